@@ -0,0 +1,49 @@
+"""
+製紙工場ダッシュボードアプリ - ダッシュボードペイロードキャッシュ
+全画面が定期ポーリングする集計結果を短時間キャッシュし、同一内容の再計算を避ける
+"""
+
+import os
+import threading
+import time
+
+# キャッシュの有効期間（秒）。0でキャッシュ無効
+PAYLOAD_CACHE_TTL = float(os.environ.get("PAPERPLANT_PAYLOAD_CACHE_TTL", "5"))
+
+class PayloadCache:
+    """キー単位のTTL付きキャッシュ"""
+
+    def __init__(self, ttl_seconds=PAYLOAD_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """有効なキャッシュがあれば返し、なければ compute() の結果を格納して返す"""
+        if self.ttl_seconds <= 0:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        payload = compute()
+        self.put(key, payload)
+        return payload
+
+    def put(self, key, payload):
+        """キャッシュへ格納（プリウォーム用）"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+
+    def invalidate(self, key=None):
+        """キャッシュの破棄（key省略時は全件）"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+payload_cache = PayloadCache()
@@ -0,0 +1,214 @@
+"""
+製紙工場ダッシュボードアプリ - ロット生産ジャーニー・工場タイムライン
+生産イベントログ（production_events）の範囲走査でタイムラインを構築する
+"""
+
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+
+from models import FinishedProductLot, ProductionBatch, ProductionEvent, QualityCheck
+from traceability import InvalidCursor
+
+PROCESS_NAMES = {
+    "P1": "パルプ化工程",
+    "P2": "調成工程",
+    "P3": "抄紙工程",
+    "P4": "仕上げ工程"
+}
+
+class LotNotFound(Exception):
+    """ロットまたはバッチが存在しない"""
+
+class InvalidLotId(Exception):
+    """FPL-/PB- 以外のロットID"""
+
+_EVENT_COLUMNS = (
+    ProductionEvent.event_id,
+    ProductionEvent.ts,
+    ProductionEvent.event_type,
+    ProductionEvent.batch_id,
+    ProductionEvent.machine_id,
+    ProductionEvent.payload,
+)
+_EVENT_ORDER = (ProductionEvent.ts, ProductionEvent.event_id)
+
+def resolve_batch_ids(db, lot_ids):
+    """ロットIDをバッチIDに解決（製品ロットはまとめて1クエリ）
+
+    解決できないロットは LotNotFound / InvalidLotId を値として返す。
+    """
+    product_lot_ids = {lot_id for lot_id in lot_ids if lot_id.startswith("FPL-")}
+    product_batches = {}
+    if product_lot_ids:
+        product_batches = dict(db.execute(
+            select(FinishedProductLot.product_lot_id, FinishedProductLot.batch_id)
+            .where(FinishedProductLot.product_lot_id.in_(product_lot_ids))
+        ).all())
+
+    resolved = {}
+    for lot_id in lot_ids:
+        if lot_id.startswith("FPL-"):
+            batch_id = product_batches.get(lot_id)
+            resolved[lot_id] = batch_id if batch_id else LotNotFound("製品ロットが見つかりません")
+        elif lot_id.startswith("PB-"):
+            resolved[lot_id] = lot_id
+        else:
+            resolved[lot_id] = InvalidLotId("無効なロットIDです")
+    return resolved
+
+def fetch_timeline(db, batch_id, limit=None, cursor=None):
+    """1バッチのタイムライン（時刻順、cursor 以降を最大 limit 件）
+
+    バッチが存在しない場合は None を返す。
+    """
+    stmt = select(*_EVENT_COLUMNS).where(ProductionEvent.batch_id == batch_id)
+    events, next_cursor = _fetch_page(db, stmt, limit, cursor)
+    if not events and cursor is None and not _existing_batches(db, [batch_id]):
+        return None, None
+    return _format_events(db, events), next_cursor
+
+def build_timelines(db, batch_ids):
+    """バッチごとのタイムラインを一括構築（存在しないバッチは結果に含めない）"""
+    batch_ids = set(batch_ids)
+    if not batch_ids:
+        return {}
+
+    events_by_batch = defaultdict(list)
+    for row in db.execute(
+        select(*_EVENT_COLUMNS)
+        .where(ProductionEvent.batch_id.in_(batch_ids))
+        .order_by(ProductionEvent.batch_id, *_EVENT_ORDER)
+    ):
+        events_by_batch[row.batch_id].append(row)
+
+    # イベントのないバッチ（編成直後など）も存在すれば空のタイムラインを返す
+    missing = batch_ids - events_by_batch.keys()
+    timelines = {batch_id: [] for batch_id in _existing_batches(db, missing)} if missing else {}
+
+    formatted = _format_events(db, [row for rows in events_by_batch.values() for row in rows])
+    offset = 0
+    for batch_id, rows in events_by_batch.items():
+        timelines[batch_id] = formatted[offset:offset + len(rows)]
+        offset += len(rows)
+    return timelines
+
+def fetch_plant_timeline(db, start_time, end_time, event_types=None, limit=200, cursor=None):
+    """工場全体のタイムライン（期間内の全イベントを時刻順に1ページ分）"""
+    stmt = select(*_EVENT_COLUMNS).where(ProductionEvent.ts >= start_time, ProductionEvent.ts <= end_time)
+    if event_types:
+        stmt = stmt.where(ProductionEvent.event_type.in_(event_types))
+    events, next_cursor = _fetch_page(db, stmt, limit, cursor)
+    formatted = _format_events(db, events)
+    for row, event in zip(events, formatted):
+        event["batch_id"] = row.batch_id
+        event["machine_id"] = row.machine_id
+    return formatted, next_cursor
+
+def _fetch_page(db, stmt, limit, cursor):
+    if cursor:
+        stmt = stmt.where(tuple_(*_EVENT_ORDER) > tuple_(*decode_event_cursor(cursor)))
+    stmt = stmt.order_by(*_EVENT_ORDER)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    events = db.execute(stmt).all()
+    if limit is None or len(events) <= limit:
+        return events, None
+    events = events[:limit]
+    return events, encode_event_cursor(events[-1].ts, events[-1].event_id)
+
+def _existing_batches(db, batch_ids):
+    return set(db.execute(
+        select(ProductionBatch.batch_id).where(ProductionBatch.batch_id.in_(batch_ids))
+    ).scalars())
+
+def _format_events(db, events):
+    # 工程開始イベントに品質検査件数を付与（COUNT ... GROUP BY で一括取得）
+    record_ids = {row.payload["record_id"] for row in events if row.event_type == "process_start"}
+    check_counts = {}
+    if record_ids:
+        check_counts = dict(db.execute(
+            select(QualityCheck.record_id, func.count())
+            .where(QualityCheck.record_id.in_(record_ids))
+            .group_by(QualityCheck.record_id)
+        ).all())
+    return [format_event(row, check_counts) for row in events]
+
+def format_event(row, check_counts):
+    """イベントログの1行をタイムライン表示用に整形"""
+    p = row.payload or {}
+    event = {"event_id": row.event_id, "timestamp": row.ts, "event_type": row.event_type}
+
+    if row.event_type == "raw_material_arrival":
+        event.update(
+            title="原料入荷",
+            description=f"{p['supplier']}から{p['material_type']}が入荷",
+            data={"supplier": p["supplier"], "weight": p["weight"], "fsc_cert": p["fsc_cert"]}
+        )
+    elif row.event_type == "process_start":
+        process_name = PROCESS_NAMES.get(p["process_code"], p["process_code"])
+        event.update(
+            title=f"{process_name}開始",
+            description=f"設備: {p['machine_id']}, オペレーター: {p['operator_id']}",
+            data={
+                "machine_id": p["machine_id"],
+                "operator_id": p["operator_id"],
+                "quality_checks": check_counts.get(p["record_id"], 0)
+            }
+        )
+    elif row.event_type == "process_end":
+        process_name = PROCESS_NAMES.get(p["process_code"], p["process_code"])
+        start_ts = datetime.fromisoformat(p["start_ts"]) if p.get("start_ts") else None
+        event.update(
+            title=f"{process_name}完了",
+            description=f"出力量: {p['output_kg'] or 0:.1f}kg",
+            data={
+                "duration_hours": (row.ts - start_ts).total_seconds() / 3600 if start_ts else None,
+                "output_kg": p["output_kg"]
+            }
+        )
+    elif row.event_type == "quality_excursion":
+        event.update(
+            title="品質逸脱",
+            description=f"{p['parameter']}: {_number(p['value'])}"
+                        f"（規格 {_number(p['lower_limit'])}〜{_number(p['upper_limit'])}）",
+            data=p
+        )
+    elif row.event_type == "alert":
+        event.update(
+            title="設備アラート",
+            description=p["message"],
+            data={"machine_id": row.machine_id, "status": p["status"], "alert_level": p["alert_level"]}
+        )
+    elif row.event_type == "product_completion":
+        event.update(
+            title="製品完成",
+            description=f"製品: {p['product_code']}",
+            data={"product_code": p["product_code"], "quantity_kg": p["quantity_kg"], "roll_count": p["roll_count"]}
+        )
+    elif row.event_type == "shipment":
+        event.update(
+            title="出荷",
+            description=f"出荷先: {p['destination']}",
+            data={"destination": p["destination"], "quantity_kg": p["quantity_kg"]}
+        )
+    else:
+        event.update(title=row.event_type, description="", data=p)
+    return event
+
+def _number(value):
+    return "-" if value is None else f"{value:.3g}"
+
+def encode_event_cursor(ts, event_id):
+    payload = json.dumps([ts.isoformat(), event_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_event_cursor(cursor):
+    try:
+        ts, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(ts), int(event_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("無効なカーソルです") from exc
@@ -3,26 +3,92 @@
 トレーサビリティとリアルタイム監視のためのRESTful API
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import json
+import logging
+import secrets
 import sys
 import os
+import time
 
 # データベースモデルのインポート
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'database'))
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), '..', 'database')
+if DATABASE_DIR not in sys.path:
+    sys.path.append(DATABASE_DIR)
 from models import (
-    create_database, get_session, 
     RawMaterialLot, ProductionBatch, ProcessRecord, 
-    QualityCheck, FinishedProductLot, MachineStatusLog, KPIMetrics
+    FinishedProductLot, MachineStatusLog, KPIMetrics
 )
+from query_profiler import QueryProfiler
+from metrics import MetricsMiddleware, current_route, instrument_engine, registry as metrics_registry
+from cache import payload_cache
+import queries
+from journey import (
+    InvalidLotId, LotNotFound, build_timelines, fetch_plant_timeline, fetch_timeline, resolve_batch_ids
+)
+from traceability import (
+    InvalidCursor, build_conditions as build_search_conditions, decode_cursor as decode_search_cursor,
+    merge_lot_pages, search_lots, suggest_lots
+)
+from sharding import ShardRouter, UnknownShard, merge_sorted
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db")
+# 起動時にダッシュボードの主要ペイロードを事前計算する
+PREWARM_ON_STARTUP = os.environ.get("PAPERPLANT_PREWARM", "0") == "1"
+# 管理用API（/api/admin/*）のトークン。未設定の場合は管理用APIを無効にする
+ADMIN_TOKEN = os.environ.get("PAPERPLANT_ADMIN_TOKEN")
+# 一括ジャーニーAPIで1リクエストに指定できるロット数の上限
+MAX_BULK_JOURNEY_LOTS = 1000
+
+# スロークエリプロファイラ
+query_profiler = QueryProfiler(
+    threshold_ms=float(os.environ.get("PAPERPLANT_SLOW_QUERY_MS", "100")),
+    capacity=int(os.environ.get("PAPERPLANT_SLOW_QUERY_BUFFER", "200")),
+    log_path=os.environ.get("PAPERPLANT_SLOW_QUERY_LOG"),
+    endpoint_getter=current_route
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ワーカー起動時にエンジン生成・スキーマ確認・キャッシュのプリウォームを行う"""
+    started = time.perf_counter()
+    shards = ShardRouter.from_env(DATABASE_URL)
+    for engine in shards.engines.values():
+        instrument_engine(engine)
+        query_profiler.attach(engine)
+    app.state.shards = shards
+    # 既定シャード（単一構成では PAPERPLANT_DATABASE_URL のエンジン）
+    engine = shards.engine()
+    app.state.engine = engine
+
+    if PREWARM_ON_STARTUP:
+        prewarm_payload_cache(shards)
+
+    app.state.startup_seconds = time.perf_counter() - started
+    logger.info("起動完了: %.1fms (prewarm=%s)", app.state.startup_seconds * 1000, PREWARM_ON_STARTUP)
+    try:
+        yield
+    finally:
+        for engine in shards.engines.values():
+            query_profiler.detach(engine)
+        shards.dispose()
 
 app = FastAPI(
     title="製紙工場ダッシュボードAPI",
     description="トレーサビリティとリアルタイム監視を実現するAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -34,31 +100,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# データベースセッションの依存関係
-engine = create_database()
+# パフォーマンス計測
+app.add_middleware(MetricsMiddleware)
 
-def get_db():
-    session = get_session(engine)
+# データベースセッションの依存関係（mill でシャードを選択）
+# DBを使うエンドポイントは同期関数（def）として定義し、FastAPIのスレッドプールで実行する。
+# async def の中で同期的にDBを使うと、接続プールの空き待ちでイベントループごと止まる。
+def get_db(
+    request: Request,
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は既定の工場")
+):
+    try:
+        session = request.app.state.shards.session(mill)
+    except UnknownShard as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
     try:
         yield session
     finally:
         session.close()
 
+def get_mill_db(
+    request: Request,
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は全工場")
+):
+    """工場全体の問い合わせに対応するAPI用のセッション
+
+    工場全体（mill 未指定の複数工場構成）では scatter が各シャードのセッションを開くため、None を渡す。
+    """
+    if is_plant_wide(request.app.state.shards, mill):
+        yield None
+    else:
+        yield from get_db(request, mill)
+
+def prewarm_payload_cache(shards):
+    """全画面がポーリングするダッシュボードのペイロードを事前にキャッシュへ格納"""
+    session = shards.session()
+    try:
+        payload_cache.put(cache_key("dashboard_summary"), compute_dashboard_summary(shards, session))
+        payload_cache.put(cache_key("process_flow"), build_process_flow_status(session))
+    finally:
+        session.close()
+
+def cache_key(name, mill=None):
+    """ペイロードキャッシュのキー（工場ごとに分ける。mill 未指定は工場全体）"""
+    return name if mill is None else f"{name}:{mill}"
+
+def is_plant_wide(shards, mill):
+    """mill 未指定かつ複数シャード構成なら、全シャードへ問い合わせて結合する"""
+    return mill is None and shards.is_sharded
+
 # === 総合サマリーダッシュボード用API ===
 
+SUMMARY_FIELDS = ("kpis", "active_batches", "critical_alerts", "last_updated")
+CRITICAL_ALERT_LIMIT = 10
+
 @app.get("/api/dashboard/summary")
-async def get_dashboard_summary(db: Session = Depends(get_db)):
+def get_dashboard_summary(
+    request: Request,
+    fields: Optional[str] = Query(None, description="返す項目（カンマ区切り）"),
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は工場全体"),
+    db: Optional[Session] = Depends(get_mill_db)
+):
     """工場長・管理者向け総合サマリー情報を取得"""
-    
-    # 主要KPI取得
-    latest_date = db.query(KPIMetrics.ts).order_by(KPIMetrics.ts.desc()).first()
-    if latest_date:
-        kpis = db.query(KPIMetrics).filter(
-            KPIMetrics.ts >= latest_date[0],
-            KPIMetrics.period_type == "daily"
-        ).all()
-    else:
-        kpis = []
+    try:
+        selected = queries.parse_fields(fields, SUMMARY_FIELDS, SUMMARY_FIELDS)
+    except queries.InvalidFields as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    summary = payload_cache.get_or_compute(
+        cache_key("dashboard_summary", mill), lambda: compute_dashboard_summary(request.app.state.shards, db, mill)
+    )
+    return summary if fields is None else queries.select_fields(summary, selected)
+
+def compute_dashboard_summary(shards, db, mill=None):
+    """サマリーの集計（mill 未指定の複数工場構成では全シャード分を結合）"""
+    if is_plant_wide(shards, mill):
+        return merge_dashboard_summaries(shards.scatter(build_dashboard_summary))
+    return build_dashboard_summary(db)
+
+def merge_dashboard_summaries(summaries):
+    """シャードごとのサマリーを工場全体に結合"""
+    kpis = {}
+    for summary in summaries.values():
+        for metric_name, kpi in summary["kpis"].items():
+            kpis.setdefault(metric_name, []).append(kpi)
+    return {
+        "kpis": {metric_name: queries.combine_kpis(values) for metric_name, values in kpis.items()},
+        "active_batches": sum(summary["active_batches"] for summary in summaries.values()),
+        "critical_alerts": merge_sorted(
+            {name: summary["critical_alerts"] for name, summary in summaries.items()},
+            key=lambda alert: alert["timestamp"], limit=CRITICAL_ALERT_LIMIT
+        ),
+        "last_updated": datetime.now()
+    }
+
+def build_dashboard_summary(db: Session):
+    """総合サマリー情報の集計"""
+    
+    # 主要KPI取得（工場全体の日次値を指標ごとに最新のもの）
+    latest = (
+        db.query(KPIMetrics.metric_name, func.max(KPIMetrics.ts).label("ts"))
+        .filter(KPIMetrics.period_type == "daily", KPIMetrics.machine_id.is_(None))
+        .group_by(KPIMetrics.metric_name)
+        .subquery()
+    )
+    kpis = db.query(KPIMetrics).join(
+        latest, and_(KPIMetrics.metric_name == latest.c.metric_name, KPIMetrics.ts == latest.c.ts)
+    ).filter(
+        KPIMetrics.period_type == "daily",
+        KPIMetrics.machine_id.is_(None)
+    ).all()
     
     # KPIデータを整形
     kpi_data = {}
@@ -67,7 +217,7 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
             "value": kpi.value,
             "target": kpi.target_value,
             "unit": kpi.unit,
-            "achievement_rate": (kpi.value / kpi.target_value * 100) if kpi.target_value > 0 else 0
+            "achievement_rate": (kpi.value / kpi.target_value * 100) if kpi.target_value else 0
         }
     
     # 現在の生産状況
@@ -75,12 +225,12 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
         ProductionBatch.status.in_(["active", "processing"])
     ).count()
     
-    # 重要アラート
+    # 重要アラート（新しい順に上限件数まで）
     critical_alerts = db.query(MachineStatusLog).filter(
         MachineStatusLog.alert_level == "critical",
         MachineStatusLog.resolved == False,
         MachineStatusLog.ts >= datetime.now() - timedelta(hours=24)
-    ).limit(10).all()
+    ).order_by(MachineStatusLog.ts.desc()).limit(CRITICAL_ALERT_LIMIT).all()
     
     alerts_data = []
     for alert in critical_alerts:
@@ -99,8 +249,15 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
     }
 
 @app.get("/api/dashboard/process-flow")
-async def get_process_flow_status(db: Session = Depends(get_db)):
-    """工程フロー図用のステータス情報を取得"""
+def get_process_flow_status(
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は既定の工場"),
+    db: Session = Depends(get_db)
+):
+    """工程フロー図用のステータス情報を取得（mill 未指定時は既定の工場）"""
+    return payload_cache.get_or_compute(cache_key("process_flow", mill), lambda: build_process_flow_status(db))
+
+def build_process_flow_status(db: Session):
+    """工程別の稼働状況の集計"""
     
     # 各工程の稼働状況
     processes = ["P1", "P2", "P3", "P4"]
@@ -141,10 +298,13 @@ async def get_process_flow_status(db: Session = Depends(get_db)):
 # === 工程別モニタリングダッシュボード用API ===
 
 @app.get("/api/dashboard/process/{process_code}")
-async def get_process_monitoring(
+def get_process_monitoring(
     process_code: str,
     start_time: Optional[datetime] = Query(None),
     end_time: Optional[datetime] = Query(None),
+    fields: Optional[str] = Query(None, description="品質データの項目（カンマ区切り、check_id は常に含む）"),
+    include_profiles: str = Query("latest", pattern="^(none|latest|all)$",
+                                  description="CDプロファイル: none / latest（パラメータごとに最新のみ） / all"),
     db: Session = Depends(get_db)
 ):
     """工程別詳細モニタリングデータを取得"""
@@ -153,32 +313,25 @@ async def get_process_monitoring(
         start_time = datetime.now() - timedelta(hours=24)
     if not end_time:
         end_time = datetime.now()
+    try:
+        point_fields = queries.parse_fields(fields, queries.QUALITY_POINT_COLUMNS, queries.PROCESS_QUALITY_FIELDS)
+    except queries.InvalidFields as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     
-    # 工程記録取得
-    records = db.query(ProcessRecord).filter(
+    # 工程記録数
+    total_records = db.query(func.count(ProcessRecord.record_id)).filter(
         ProcessRecord.process_code == process_code,
         ProcessRecord.start_ts >= start_time,
         ProcessRecord.start_ts <= end_time
-    ).order_by(ProcessRecord.start_ts).all()
-    
-    # 品質データ取得
-    quality_data = []
-    for record in records:
-        qualities = db.query(QualityCheck).filter(
-            QualityCheck.record_id == record.record_id
-        ).all()
-        
-        for quality in qualities:
-            quality_data.append({
-                "timestamp": quality.ts,
-                "parameter": quality.parameter_name,
-                "value": quality.value,
-                "target": quality.target_value,
-                "upper_limit": quality.upper_limit,
-                "lower_limit": quality.lower_limit,
-                "is_ok": quality.is_ok,
-                "cd_profile": quality.value_array
-            })
+    ).scalar()
+    
+    # 品質データ取得（工程記録と結合して1クエリ、指定された列のみ）
+    quality_data = queries.fetch_quality_points(
+        db,
+        queries.process_quality_stmt(process_code, start_time, end_time, point_fields, include_profiles),
+        point_fields,
+        include_profiles
+    )
     
     # 設備ステータス
     machines_in_process = {
@@ -205,36 +358,29 @@ async def get_process_monitoring(
     return {
         "process_code": process_code,
         "time_range": {"start": start_time, "end": end_time},
+        "fields": point_fields,
+        "include_profiles": include_profiles,
         "quality_data": quality_data,
         "machine_status": machine_status,
-        "total_records": len(records)
+        "total_records": total_records
     }
 
 @app.get("/api/dashboard/quality-trend/{parameter}")
-async def get_quality_trend(
+def get_quality_trend(
     parameter: str,
     hours: int = Query(24, description="過去何時間のデータを取得するか"),
+    fields: Optional[str] = Query(None, description="データ点の項目（カンマ区切り）"),
+    include_profiles: str = Query("none", pattern="^(none|latest|all)$"),
     db: Session = Depends(get_db)
 ):
     """特定品質パラメータのトレンドデータを取得"""
     
+    try:
+        point_fields = queries.parse_fields(fields, queries.QUALITY_POINT_COLUMNS, queries.QUALITY_TREND_COLUMNS)
+    except queries.InvalidFields as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     start_time = datetime.now() - timedelta(hours=hours)
-    
-    quality_data = db.query(QualityCheck).filter(
-        QualityCheck.parameter_name == parameter,
-        QualityCheck.ts >= start_time
-    ).order_by(QualityCheck.ts).all()
-    
-    trend_data = []
-    for data in quality_data:
-        trend_data.append({
-            "timestamp": data.ts,
-            "value": data.value,
-            "target": data.target_value,
-            "upper_limit": data.upper_limit,
-            "lower_limit": data.lower_limit,
-            "is_ok": data.is_ok
-        })
+    trend_data = queries.fetch_quality_trend(db, parameter, start_time, point_fields, include_profiles)
     
     return {
         "parameter": parameter,
@@ -242,20 +388,85 @@ async def get_quality_trend(
         "time_range": {"hours": hours, "start_time": start_time}
     }
 
+@app.get("/api/quality/checks/{check_id}/profile")
+def get_quality_profile(check_id: int, db: Session = Depends(get_db)):
+    """品質データ1件のCDプロファイルを取得（モニタリング画面からの遅延読み込み用）"""
+    profile = queries.fetch_quality_profile(db, check_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="CDプロファイルが見つかりません")
+    return profile
+
 # === トレーサビリティ検索・分析用API ===
 
 @app.get("/api/traceability/search")
-async def search_traceability(
+def search_traceability(
+    request: Request,
     product_lot_id: Optional[str] = None,
     batch_id: Optional[str] = None,
     raw_material_lot_id: Optional[str] = None,
-    start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    start_date: Optional[datetime] = Query(None, description="生産開始日時（バッチ作成）の下限"),
+    end_date: Optional[datetime] = Query(None, description="生産開始日時（バッチ作成）の上限"),
+    arrival_from: Optional[datetime] = None,
+    arrival_to: Optional[datetime] = None,
+    completion_from: Optional[datetime] = None,
+    completion_to: Optional[datetime] = None,
+    shipment_from: Optional[datetime] = None,
+    shipment_to: Optional[datetime] = None,
+    supplier_name: Optional[str] = None,
+    destination: Optional[str] = None,
+    product_code: Optional[str] = None,
+    fsc_certified: Optional[bool] = None,
+    quality_ok: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor"),
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は全工場"),
+    db: Optional[Session] = Depends(get_mill_db)
 ):
-    """トレーサビリティ検索"""
-    
-    # 検索条件に基づいてデータを取得
+    """トレーサビリティ検索
+
+    search_results: 指定IDから原料まで遡った系列（従来形式）
+    lots: 全条件に一致するロット系列（新しい順、next_cursor で次ページ）
+    複数工場構成で mill 未指定の場合は全シャードを検索し、結果に工場名（mill）を付ける
+    """
+    
+    conditions = build_search_conditions(
+        product_lot_id=product_lot_id, batch_id=batch_id, raw_material_lot_id=raw_material_lot_id,
+        start_date=start_date, end_date=end_date,
+        arrival_from=arrival_from, arrival_to=arrival_to,
+        completion_from=completion_from, completion_to=completion_to,
+        shipment_from=shipment_from, shipment_to=shipment_to,
+        supplier_name=supplier_name, destination=destination, product_code=product_code,
+        fsc_certified=fsc_certified, quality_ok=quality_ok
+    )
+    shards = request.app.state.shards
+    try:
+        if is_plant_wide(shards, mill):
+            # カーソルの検証をシャードへ投げる前に済ませる
+            if cursor:
+                decode_search_cursor(cursor)
+            pages = shards.scatter(lambda session: search_lots(session, conditions, limit=limit, cursor=cursor))
+            page = merge_lot_pages(pages, limit)
+        else:
+            page = search_lots(db, conditions, limit=limit, cursor=cursor)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    def lookup(session):
+        return build_search_results(session, product_lot_id, batch_id, raw_material_lot_id)
+
+    if not (product_lot_id or batch_id or raw_material_lot_id):
+        query_results = []
+    elif is_plant_wide(shards, mill):
+        query_results = [
+            {**result, "mill": name} for name, results in shards.scatter(lookup).items() for result in results
+        ]
+    else:
+        query_results = lookup(db)
+
+    return {"search_results": query_results, **page}
+
+def build_search_results(db: Session, product_lot_id, batch_id, raw_material_lot_id):
+    """指定IDから原料まで遡った系列（従来形式）"""
     query_results = []
     
     if product_lot_id:
@@ -318,207 +529,204 @@ async def search_traceability(
                 }
             })
     
-    return {"search_results": query_results}
+    return query_results
+
+@app.get("/api/traceability/suggest")
+def suggest_traceability(
+    q: str = Query(..., min_length=1, max_length=100, description="ロットID・サプライヤー名・出荷先などの一部"),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """トレーサビリティ検索の入力補完候補を取得"""
+    return {"query": q, "suggestions": suggest_lots(db, q, limit)}
 
 @app.get("/api/traceability/journey/{lot_id}")
-async def get_lot_journey(lot_id: str, db: Session = Depends(get_db)):
+def get_lot_journey(
+    lot_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="1ページのイベント数（省略時は全件）"),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor"),
+    db: Session = Depends(get_db)
+):
     """ロットの生産ジャーニー（タイムライン）を取得"""
     
     # バッチID取得
-    if lot_id.startswith("FPL-"):
-        # 製品ロットの場合
-        product = db.query(FinishedProductLot).filter(
-            FinishedProductLot.product_lot_id == lot_id
-        ).first()
-        if not product:
-            raise HTTPException(status_code=404, detail="製品ロットが見つかりません")
-        batch_id = product.batch_id
-    elif lot_id.startswith("PB-"):
-        # バッチIDの場合
-        batch_id = lot_id
-    else:
-        raise HTTPException(status_code=400, detail="無効なロットIDです")
+    batch_id = resolve_batch_ids(db, [lot_id])[lot_id]
+    if isinstance(batch_id, InvalidLotId):
+        raise HTTPException(status_code=400, detail=str(batch_id))
+    if isinstance(batch_id, LotNotFound):
+        raise HTTPException(status_code=404, detail=str(batch_id))
     
-    # バッチ情報取得
-    batch = db.query(ProductionBatch).filter(
-        ProductionBatch.batch_id == batch_id
-    ).first()
-    
-    if not batch:
+    try:
+        timeline, next_cursor = fetch_timeline(db, batch_id, limit=limit, cursor=cursor)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if timeline is None:
         raise HTTPException(status_code=404, detail="バッチが見つかりません")
     
-    # 工程記録取得
-    process_records = db.query(ProcessRecord).filter(
-        ProcessRecord.batch_id == batch_id
-    ).order_by(ProcessRecord.start_ts).all()
-    
-    # タイムライン構築
-    timeline = []
-    
-    # 原料入荷
-    raw_lot = db.query(RawMaterialLot).filter(
-        RawMaterialLot.lot_id == batch.raw_material_lot_id
-    ).first()
-    
-    if raw_lot:
-        timeline.append({
-            "timestamp": raw_lot.arrival_ts,
-            "event_type": "raw_material_arrival",
-            "title": "原料入荷",
-            "description": f"{raw_lot.supplier_name}から{raw_lot.material_type}が入荷",
-            "data": {
-                "supplier": raw_lot.supplier_name,
-                "weight": raw_lot.weight_kg,
-                "fsc_cert": raw_lot.fsc_cert_id
-            }
-        })
+    return {
+        "lot_id": lot_id,
+        "batch_id": batch_id,
+        "timeline": timeline,
+        "next_cursor": next_cursor
+    }
+
+class BulkJourneyRequest(BaseModel):
+    lot_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_JOURNEY_LOTS)
+
+@app.post("/api/traceability/journeys")
+def get_lot_journeys(request: BulkJourneyRequest, db: Session = Depends(get_db)):
+    """複数ロットの生産ジャーニーを一括取得（NDJSONでロットごとに1行ずつ返す）
+
+    クエリ数はロット数に依存せず一定。存在しない・無効なロットは error を含む行になる。
+    """
+    resolved = resolve_batch_ids(db, request.lot_ids)
+    timelines = build_timelines(
+        db, [batch_id for batch_id in resolved.values() if isinstance(batch_id, str)]
+    )
+    
+    def generate():
+        for lot_id in request.lot_ids:
+            batch_id = resolved[lot_id]
+            if isinstance(batch_id, Exception):
+                line = {"lot_id": lot_id, "error": str(batch_id)}
+            elif batch_id not in timelines:
+                line = {"lot_id": lot_id, "batch_id": batch_id, "error": "バッチが見つかりません"}
+            else:
+                line = {"lot_id": lot_id, "batch_id": batch_id, "timeline": timelines[batch_id]}
+            yield json.dumps(jsonable_encoder(line), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/api/plant/timeline")
+def get_plant_timeline(
+    start_time: Optional[datetime] = Query(None),
+    end_time: Optional[datetime] = Query(None),
+    event_type: Optional[List[str]] = Query(None, description="絞り込むイベント種別（複数指定可）"),
+    limit: int = Query(200, ge=1, le=2000),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor"),
+    db: Session = Depends(get_db)
+):
+    """工場全体のイベントタイムライン（期間内に起きたことを時刻順に取得）"""
     
-    # 各工程の実行
-    for record in process_records:
-        # 品質データ取得
-        quality_checks = db.query(QualityCheck).filter(
-            QualityCheck.record_id == record.record_id
-        ).all()
-        
-        process_names = {
-            "P1": "パルプ化工程",
-            "P2": "調成工程", 
-            "P3": "抄紙工程",
-            "P4": "仕上げ工程"
-        }
-        
-        timeline.append({
-            "timestamp": record.start_ts,
-            "event_type": "process_start",
-            "title": f"{process_names.get(record.process_code, record.process_code)}開始",
-            "description": f"設備: {record.machine_id}, オペレーター: {record.operator_id}",
-            "data": {
-                "machine_id": record.machine_id,
-                "operator_id": record.operator_id,
-                "output_kg": record.output_kg,
-                "quality_checks": len(quality_checks)
-            }
-        })
-        
-        if record.end_ts:
-            timeline.append({
-                "timestamp": record.end_ts,
-                "event_type": "process_end",
-                "title": f"{process_names.get(record.process_code, record.process_code)}完了",
-                "description": f"出力量: {record.output_kg:.1f}kg",
-                "data": {
-                    "duration_hours": (record.end_ts - record.start_ts).total_seconds() / 3600,
-                    "output_kg": record.output_kg
-                }
-            })
+    if not start_time:
+        start_time = datetime.now() - timedelta(hours=24)
+    if not end_time:
+        end_time = datetime.now()
     
-    # 製品完成
-    finished_product = db.query(FinishedProductLot).filter(
-        FinishedProductLot.batch_id == batch_id
-    ).first()
-    
-    if finished_product:
-        timeline.append({
-            "timestamp": finished_product.completion_ts,
-            "event_type": "product_completion", 
-            "title": "製品完成",
-            "description": f"製品: {finished_product.product_code}",
-            "data": {
-                "product_code": finished_product.product_code,
-                "quantity_kg": finished_product.quantity_kg,
-                "roll_count": finished_product.roll_count
-            }
-        })
-        
-        if finished_product.shipment_ts:
-            timeline.append({
-                "timestamp": finished_product.shipment_ts,
-                "event_type": "shipment",
-                "title": "出荷",
-                "description": f"出荷先: {finished_product.destination}",
-                "data": {
-                    "destination": finished_product.destination,
-                    "quantity_kg": finished_product.quantity_kg
-                }
-            })
+    try:
+        events, next_cursor = fetch_plant_timeline(
+            db, start_time, end_time, event_types=event_type, limit=limit, cursor=cursor
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     
     return {
-        "lot_id": lot_id,
-        "batch_id": batch_id,
-        "timeline": timeline
+        "time_range": {"start": start_time, "end": end_time},
+        "events": events,
+        "next_cursor": next_cursor
     }
 
 # === KPI・分析用API ===
 
 @app.get("/api/kpi/trend/{metric_name}")
-async def get_kpi_trend(
+def get_kpi_trend(
+    request: Request,
     metric_name: str,
-    period: str = Query("daily", regex="^(hourly|daily|monthly)$"),
+    period: str = Query("daily", pattern="^(hourly|daily|monthly)$"),
     days: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db)
+    machine_id: Optional[str] = Query(None, description="設備ID（省略時は工場全体）"),
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は全工場"),
+    db: Optional[Session] = Depends(get_mill_db)
 ):
-    """KPI指標のトレンドデータを取得"""
+    """KPI指標のトレンドデータを取得（複数工場構成で mill 未指定の場合は時刻ごとに全工場分をまとめる）"""
     
     start_date = datetime.now() - timedelta(days=days)
     
-    kpi_data = db.query(KPIMetrics).filter(
-        KPIMetrics.metric_name == metric_name,
-        KPIMetrics.period_type == period,
-        KPIMetrics.ts >= start_date
-    ).order_by(KPIMetrics.ts).all()
-    
-    trend_data = []
-    for kpi in kpi_data:
-        trend_data.append({
-            "timestamp": kpi.ts,
-            "value": kpi.value,
-            "target": kpi.target_value,
-            "unit": kpi.unit,
-            "achievement_rate": (kpi.value / kpi.target_value * 100) if kpi.target_value > 0 else 0
-        })
+    def fetch(session):
+        return queries.fetch_kpi_trend(session, metric_name, period, start_date, machine_id)
+
+    shards = request.app.state.shards
+    if is_plant_wide(shards, mill):
+        trend_data = queries.merge_kpi_trends(shards.scatter(fetch).values())
+    else:
+        trend_data = fetch(db)
     
     return {
         "metric_name": metric_name,
         "period": period,
+        "machine_id": machine_id,
+        "mill": mill,
         "data": trend_data
     }
 
 @app.get("/api/alerts")
-async def get_alerts(
-    status: str = Query("active", regex="^(active|resolved|all)$"),
+def get_alerts(
+    request: Request,
+    status: str = Query("active", pattern="^(active|resolved|all)$"),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db)
+    mill: Optional[str] = Query(None, description="工場（シャード名）。省略時は全工場"),
+    db: Optional[Session] = Depends(get_mill_db)
 ):
-    """アラート・通知一覧を取得"""
-    
-    query = db.query(MachineStatusLog)
-    
-    if status == "active":
-        query = query.filter(MachineStatusLog.resolved == False)
-    elif status == "resolved":
-        query = query.filter(MachineStatusLog.resolved == True)
-    
-    alerts = query.order_by(MachineStatusLog.ts.desc()).limit(limit).all()
-    
-    alert_data = []
-    for alert in alerts:
-        alert_data.append({
-            "log_id": alert.log_id,
-            "machine_id": alert.machine_id,
-            "timestamp": alert.ts,
-            "status": alert.status,
-            "alert_level": alert.alert_level,
-            "message": alert.message,
-            "resolved": alert.resolved
-        })
+    """アラート・通知一覧を取得（複数工場構成で mill 未指定の場合は全工場分を新しい順に結合）"""
+    
+    shards = request.app.state.shards
+    if is_plant_wide(shards, mill):
+        alert_data = merge_sorted(
+            shards.scatter(lambda session: queries.fetch_alerts(session, status, limit)),
+            key=lambda alert: (alert["timestamp"], alert["log_id"]), limit=limit
+        )
+    else:
+        alert_data = queries.fetch_alerts(db, status, limit)
     
     return {"alerts": alert_data}
 
+# === 管理用API ===
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理用APIの認可（X-Admin-Token ヘッダーと PAPERPLANT_ADMIN_TOKEN を照合）"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="管理用APIは無効です")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="管理用トークンが正しくありません")
+
+@app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """スロークエリの捕捉結果とフィンガープリント別集計を取得"""
+    return {
+        "threshold_ms": query_profiler.threshold_ms,
+        "recent": query_profiler.recent(limit),
+        "by_fingerprint": query_profiler.aggregate(limit)
+    }
+
+@app.delete("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def reset_slow_queries():
+    """スロークエリの捕捉結果を消去"""
+    query_profiler.reset()
+    return {"status": "cleared"}
+
 @app.get("/health")
 async def health_check():
     """ヘルスチェック用エンドポイント"""
     return {"status": "healthy", "timestamp": datetime.now()}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus形式のパフォーマンスメトリクス"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+
+    # 複数ワーカー起動時は自動リロードを使用できない
+    workers = int(os.environ.get("PAPERPLANT_WORKERS", "1"))
+    reload = workers == 1 and os.environ.get("PAPERPLANT_RELOAD", "1") == "1"
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PAPERPLANT_PORT", "8000")),
+        reload=reload,
+        workers=workers
+    )
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+製紙工場ダッシュボードアプリ - パフォーマンス計測
+ルート別のレイテンシ・同時処理数・レスポンスサイズ・SQL実行状況を収集し、
+Prometheusテキスト形式で公開する
+"""
+
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+from query_profiler import pop_cursor_start
+
+logger = logging.getLogger(__name__)
+
+# 1リクエストあたりのSQL実行数がこの値を超えたら警告（N+1検出用）
+QUERY_COUNT_WARN_THRESHOLD = int(os.environ.get("PAPERPLANT_QUERY_COUNT_WARN", "20"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class RequestStats:
+    """1リクエスト中に実行されたSQLの集計（工場全体の問い合わせではシャードごとのスレッドから加算される）"""
+
+    __slots__ = ("route", "query_count", "query_seconds", "_lock")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.query_count += 1
+            self.query_seconds += seconds
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("paperplant_request_stats", default=None)
+
+def current_route() -> Optional[str]:
+    """現在処理中のリクエストのルートテンプレート（リクエスト外ではNone）"""
+    stats = _current_request.get()
+    return stats.route if stats else None
+
+class Histogram:
+    """累積バケット方式のヒストグラム（ラベル値ごと）"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        # [バケット..., +Inf, sum]
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _format_labels(self.label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {count:g}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-2]:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-2]:g}")
+        return lines
+
+class Counter:
+    """単調増加カウンタ（counter）または増減値（gauge）"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], metric_type: str = "counter"):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.metric_type = metric_type
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1.0):
+        self._series[labels] = self._series.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value:g}")
+        return lines
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, escaped))
+
+class MetricsRegistry:
+    """プロセス内のメトリクス格納庫"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            "paperplant_http_request_duration_seconds", "HTTPリクエストの処理時間",
+            ("method", "route"), LATENCY_BUCKETS)
+        self.response_size = Histogram(
+            "paperplant_http_response_size_bytes", "HTTPレスポンスボディのサイズ",
+            ("method", "route"), SIZE_BUCKETS)
+        self.requests_total = Counter(
+            "paperplant_http_requests_total", "HTTPリクエスト数",
+            ("method", "route", "status"))
+        self.in_progress = Counter(
+            "paperplant_http_requests_in_progress", "処理中のHTTPリクエスト数",
+            ("method", "route"), metric_type="gauge")
+        self.queries_per_request = Histogram(
+            "paperplant_db_queries_per_request", "1リクエストあたりのSQL実行数",
+            ("method", "route"), QUERY_COUNT_BUCKETS)
+        self.query_seconds_total = Counter(
+            "paperplant_db_query_duration_seconds_total", "SQL実行時間の合計",
+            ("method", "route"))
+        self.queries_total = Counter(
+            "paperplant_db_queries_total", "SQL実行数の合計",
+            ("method", "route"))
+
+    def request_started(self, method: str, route: str):
+        with self._lock:
+            self.in_progress.inc((method, route))
+
+    def request_finished(self, method: str, route: str, status: int, duration: float,
+                         response_bytes: int, stats: RequestStats):
+        labels = (method, route)
+        with self._lock:
+            self.in_progress.inc(labels, -1)
+            self.requests_total.inc((method, route, str(status)))
+            self.request_duration.observe(labels, duration)
+            self.response_size.observe(labels, response_bytes)
+            self.queries_per_request.observe(labels, stats.query_count)
+            self.queries_total.inc(labels, stats.query_count)
+            self.query_seconds_total.inc(labels, stats.query_seconds)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = (self.request_duration, self.response_size, self.requests_total, self.in_progress,
+                       self.queries_per_request, self.query_seconds_total, self.queries_total)
+            lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("paperplant_query_start", []).append((context, time.perf_counter()))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _, started = conn.info["paperplant_query_start"].pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.add_query(time.perf_counter() - started)
+
+def _handle_error(context):
+    pop_cursor_start(context, "paperplant_query_start")
+
+def instrument_engine(engine):
+    """エンジンにSQL計測用のイベントフックを登録"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+class MetricsMiddleware:
+    """ルート別の計測を行うASGIミドルウェア"""
+
+    def __init__(self, app, registry: MetricsRegistry = registry,
+                 query_count_warn_threshold: int = QUERY_COUNT_WARN_THRESHOLD):
+        self.app = app
+        self.registry = registry
+        self.query_count_warn_threshold = query_count_warn_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # ラベルの種類を抑えるため、実パスではなくルートテンプレートで集計
+        route = _resolve_route(scope)
+        stats = RequestStats(route)
+        token = _current_request.set(stats)
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.registry.request_started(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            self.registry.request_finished(method, route, status_code, duration, response_bytes, stats)
+            _current_request.reset(token)
+            if stats.query_count > self.query_count_warn_threshold:
+                logger.warning(
+                    "SQL実行数が閾値を超えました: %s %s queries=%d (閾値 %d) sql_time=%.1fms",
+                    method, route, stats.query_count, self.query_count_warn_threshold,
+                    stats.query_seconds * 1000)
+
+def _resolve_route(scope) -> str:
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
@@ -0,0 +1,260 @@
+"""
+製紙工場ダッシュボードアプリ - 読み取り専用クエリ層
+SQLAlchemy Core の select() で必要な列だけを取得し、ORMエンティティを経由せずに整形する
+
+ステートメントはモジュール読み込み時に一度だけ組み立て、値はバインドパラメータで渡す。
+構造が常に同一になるため、エンジンのコンパイル済みキャッシュが毎回ヒットする。
+"""
+
+from sqlalchemy import bindparam, func, select
+
+from models import KPIMetrics, MachineStatusLog, ProcessRecord, QualityCheck
+from quality_chunks import chunk_watermark, fetch_trend as fetch_chunked_trend
+
+class InvalidFields(Exception):
+    """fields= に存在しない項目が指定された"""
+
+def parse_fields(fields, allowed, default):
+    """カンマ区切りの fields= を検証して項目のタプルにする（省略時は default）"""
+    if not fields:
+        return tuple(default)
+    selected = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in selected if field not in allowed]
+    if unknown:
+        raise InvalidFields(f"不明なフィールドです: {', '.join(unknown)}（指定可能: {', '.join(allowed)}）")
+    return selected
+
+def select_fields(payload, fields):
+    """キャッシュ済みペイロードから指定した最上位の項目だけを返す"""
+    return {key: payload[key] for key in fields}
+
+# === 品質トレンド ===
+
+QUALITY_TREND_COLUMNS = ("timestamp", "value", "target", "upper_limit", "lower_limit", "is_ok")
+
+QUALITY_TREND_STMT = (
+    select(
+        QualityCheck.ts,
+        QualityCheck.value,
+        QualityCheck.target_value,
+        QualityCheck.upper_limit,
+        QualityCheck.lower_limit,
+        QualityCheck.is_ok,
+    )
+    .where(
+        QualityCheck.parameter_name == bindparam("parameter"),
+        QualityCheck.ts >= bindparam("start_time"),
+    )
+    .order_by(QualityCheck.ts)
+)
+
+def fetch_quality_trend(db, parameter, start_time, fields=QUALITY_TREND_COLUMNS, include_profiles="none"):
+    """品質パラメータのトレンド（value_array等は読み込まない）
+
+    チャンク化済みの品質データがあれば、圧縮済みの範囲をチャンクから読んで行と結合する。
+    既定以外の項目は fetch_quality_points と同じく check_id を含めるため、check_id を持たないチャンクは使わない。
+    """
+    if include_profiles == "none" and tuple(fields) == QUALITY_TREND_COLUMNS and chunk_watermark(db):
+        return fetch_chunked_trend(db, parameter, start_time, fields)
+    if tuple(fields) == QUALITY_TREND_COLUMNS and include_profiles == "none":
+        rows = db.execute(QUALITY_TREND_STMT, {"parameter": parameter, "start_time": start_time}).tuples()
+        return rows_to_dicts(QUALITY_TREND_COLUMNS, rows)
+    stmt = (
+        _quality_point_select(fields, include_profiles)
+        .where(QualityCheck.parameter_name == parameter, QualityCheck.ts >= start_time)
+        .order_by(QualityCheck.ts)
+    )
+    return fetch_quality_points(db, stmt, fields, include_profiles)
+
+# === 工程別品質データ（必要な列のみ取得し、CDプロファイルは指定時のみ読み込む） ===
+
+QUALITY_POINT_COLUMNS = {
+    "check_id": QualityCheck.check_id,
+    "record_id": QualityCheck.record_id,
+    "timestamp": QualityCheck.ts,
+    "parameter": QualityCheck.parameter_name,
+    "value": QualityCheck.value,
+    "target": QualityCheck.target_value,
+    "upper_limit": QualityCheck.upper_limit,
+    "lower_limit": QualityCheck.lower_limit,
+    "is_ok": QualityCheck.is_ok,
+    "measurement_type": QualityCheck.measurement_type,
+}
+PROCESS_QUALITY_FIELDS = ("timestamp", "parameter", "value", "target", "upper_limit", "lower_limit", "is_ok")
+PROFILE_MODES = ("none", "latest", "all")
+
+# latest 判定用の内部列（応答には fields で指定された項目と check_id のみを含める）
+_POINT_KEYS = ("check_id", "timestamp", "parameter")
+
+def _quality_point_select(fields, include_profiles):
+    columns = [QUALITY_POINT_COLUMNS[key] for key in _POINT_KEYS]
+    columns += [QUALITY_POINT_COLUMNS[field] for field in fields if field not in _POINT_KEYS]
+    if include_profiles == "all":
+        columns.append(QualityCheck.value_array)
+    elif include_profiles == "latest":
+        # 配列本体は読まずに有無だけを判定（プロファイルなしの行はJSONの null が入っている場合がある）
+        columns.append((func.json_type(QualityCheck.value_array) == "array").label("has_profile"))
+    return select(*columns)
+
+def process_quality_stmt(process_code, start_time, end_time, fields, include_profiles):
+    """期間内に開始した工程記録の品質データ（工程記録と結合して1クエリ）"""
+    return (
+        _quality_point_select(fields, include_profiles)
+        .join(ProcessRecord, ProcessRecord.record_id == QualityCheck.record_id)
+        .where(
+            ProcessRecord.process_code == process_code,
+            ProcessRecord.start_ts >= start_time,
+            ProcessRecord.start_ts <= end_time,
+        )
+        .order_by(ProcessRecord.start_ts, QualityCheck.check_id)
+    )
+
+def fetch_quality_points(db, stmt, fields, include_profiles):
+    """品質データを fields の項目で整形し、include_profiles に応じてCDプロファイルを付与
+
+    latest: パラメータごとに最新のプロファイルを持つ1点のみ、配列はその点の分だけ追加で取得する。
+    """
+    extra = [field for field in fields if field not in _POINT_KEYS]
+    points = []
+    latest = {}
+    for row in db.execute(stmt).tuples():
+        check_id, ts, parameter = row[:3]
+        values = dict(zip(_POINT_KEYS, row[:3]))
+        values.update(zip(extra, row[3:3 + len(extra)]))
+        point = {"check_id": check_id}
+        for field in fields:
+            point[field] = values[field]
+        if include_profiles == "all":
+            point["cd_profile"] = row[-1]
+        elif include_profiles == "latest" and row[-1]:
+            if parameter not in latest or (ts, check_id) > (latest[parameter][0], latest[parameter][1]["check_id"]):
+                latest[parameter] = (ts, point)
+        points.append(point)
+
+    if latest:
+        by_id = {point["check_id"]: point for _, point in latest.values()}
+        for check_id, profile in db.execute(
+            select(QualityCheck.check_id, QualityCheck.value_array).where(QualityCheck.check_id.in_(by_id))
+        ).tuples():
+            by_id[check_id]["cd_profile"] = profile
+    return points
+
+QUALITY_PROFILE_STMT = select(
+    QualityCheck.check_id,
+    QualityCheck.record_id,
+    QualityCheck.ts,
+    QualityCheck.parameter_name,
+    QualityCheck.target_value,
+    QualityCheck.upper_limit,
+    QualityCheck.lower_limit,
+    QualityCheck.value_array,
+).where(QualityCheck.check_id == bindparam("check_id"))
+
+def fetch_quality_profile(db, check_id):
+    """1件の品質データのCDプロファイル（存在しない・プロファイルなしは None）"""
+    row = db.execute(QUALITY_PROFILE_STMT, {"check_id": check_id}).first()
+    if row is None or not row.value_array:
+        return None
+    return {
+        "check_id": row.check_id,
+        "record_id": row.record_id,
+        "timestamp": row.ts,
+        "parameter": row.parameter_name,
+        "target": row.target_value,
+        "upper_limit": row.upper_limit,
+        "lower_limit": row.lower_limit,
+        "cd_profile": row.value_array,
+    }
+
+# === KPIトレンド ===
+
+_KPI_TREND_SELECT = (
+    select(KPIMetrics.ts, KPIMetrics.value, KPIMetrics.target_value, KPIMetrics.unit)
+    .where(
+        KPIMetrics.metric_name == bindparam("metric_name"),
+        KPIMetrics.period_type == bindparam("period"),
+        KPIMetrics.ts >= bindparam("start_date"),
+    )
+    .order_by(KPIMetrics.ts)
+)
+
+# 工場全体（machine_id IS NULL）と設備別で構造の異なるステートメントを事前に用意
+KPI_TREND_STMT = _KPI_TREND_SELECT.where(KPIMetrics.machine_id.is_(None))
+KPI_MACHINE_TREND_STMT = _KPI_TREND_SELECT.where(KPIMetrics.machine_id == bindparam("machine_id"))
+
+def fetch_kpi_trend(db, metric_name, period, start_date, machine_id=None):
+    """KPI指標のトレンド（達成率を付与）"""
+    params = {"metric_name": metric_name, "period": period, "start_date": start_date}
+    if machine_id is None:
+        rows = db.execute(KPI_TREND_STMT, params).tuples()
+    else:
+        rows = db.execute(KPI_MACHINE_TREND_STMT, {**params, "machine_id": machine_id}).tuples()
+    return [
+        {
+            "timestamp": ts,
+            "value": value,
+            "target": target,
+            "unit": unit,
+            "achievement_rate": (value / target * 100) if target else 0,
+        }
+        for ts, value, target, unit in rows
+    ]
+
+# シャード（工場）をまたいで合計する単位。それ以外（%）は工場間の単純平均
+ADDITIVE_UNITS = ("t/h",)
+
+def combine_kpis(points):
+    """同じ指標・時刻の複数工場分の値 [{value, target, unit}, ...] を工場全体の値にまとめる"""
+    unit = points[0]["unit"]
+    combine = sum if unit in ADDITIVE_UNITS else (lambda values: sum(values) / len(values))
+    value = combine([point["value"] for point in points])
+    targets = [point["target"] for point in points if point["target"] is not None]
+    target = combine(targets) if targets else None
+    return {
+        "value": value,
+        "target": target,
+        "unit": unit,
+        "achievement_rate": (value / target * 100) if target else 0,
+    }
+
+def merge_kpi_trends(trends):
+    """シャードごとのKPIトレンドを時刻ごとにまとめる"""
+    by_timestamp = {}
+    for trend in trends:
+        for point in trend:
+            by_timestamp.setdefault(point["timestamp"], []).append(point)
+    return [{"timestamp": ts, **combine_kpis(points)} for ts, points in sorted(by_timestamp.items())]
+
+# === アラート一覧 ===
+
+ALERT_COLUMNS = ("log_id", "machine_id", "timestamp", "status", "alert_level", "message", "resolved")
+
+_ALERT_SELECT = select(
+    MachineStatusLog.log_id,
+    MachineStatusLog.machine_id,
+    MachineStatusLog.ts,
+    MachineStatusLog.status,
+    MachineStatusLog.alert_level,
+    MachineStatusLog.message,
+    MachineStatusLog.resolved,
+)
+
+# status ごとに構造の異なるステートメントを事前に用意
+ALERT_STMTS = {
+    "active": _ALERT_SELECT.where(MachineStatusLog.resolved == False),
+    "resolved": _ALERT_SELECT.where(MachineStatusLog.resolved == True),
+    "all": _ALERT_SELECT,
+}
+ALERT_STMTS = {
+    status: stmt.order_by(MachineStatusLog.ts.desc()).limit(bindparam("limit"))
+    for status, stmt in ALERT_STMTS.items()
+}
+
+def fetch_alerts(db, status, limit):
+    """アラート一覧（新しい順）"""
+    rows = db.execute(ALERT_STMTS[status], {"limit": limit}).tuples()
+    return rows_to_dicts(ALERT_COLUMNS, rows)
+
+def rows_to_dicts(columns, rows):
+    """タプル行をJSONシリアライズ用のdictへ変換"""
+    return [dict(zip(columns, row)) for row in rows]
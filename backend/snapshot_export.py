@@ -0,0 +1,227 @@
+"""
+製紙工場ダッシュボードアプリ - 静的スナップショット出力
+ダッシュボードAPIをプロセス内で呼び出し、画面・工程・KPI指標ごとの応答を
+gzip圧縮・内容ハッシュ付きのJSONバンドルとして書き出す（Netlify/CDN配信用）
+
+各バンドルが依存するテーブルの更新目印（最大ID・件数）をシャードごとに manifest.json に記録し、
+いずれかのシャードで目印が変わったバンドルと max_age を過ぎたバンドルだけを再生成する
+（複数工場構成では mill 未指定のAPIが全工場を結合して返すため）。
+バンドルのファイル名は内容のハッシュを含むため、CDNでは無期限にキャッシュできる。
+
+使い方:
+    python snapshot_export.py                          # frontend/public/snapshots に差分を出力
+    python snapshot_export.py --force                  # 全バンドルを再生成
+    python snapshot_export.py --interval 300           # 5分ごとに差分を出力し続ける
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import httpx
+from sqlalchemy import Integer, cast, func, select
+
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), '..', 'database')
+if DATABASE_DIR not in sys.path:
+    sys.path.append(DATABASE_DIR)
+from models import KPIMetrics, MachineStatusLog, ProductionBatch, ProductionEvent, QualityCheck
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'public', 'snapshots')
+MANIFEST_FILE = "manifest.json"
+BUNDLE_DIR = "bundles"
+MANIFEST_VERSION = 1
+
+PROCESS_CODES = ("P1", "P2", "P3", "P4")
+KPI_PERIODS = ("hourly", "daily", "monthly")
+
+# データの更新目印（バンドルの依存元ごと）。状態の更新や再計算での置き換えも拾えるよう件数・集計値を併用する
+WATERMARKS = {
+    "events": select(func.max(ProductionEvent.event_id)),
+    "quality": select(func.max(QualityCheck.check_id)),
+    "machine_status": select(func.max(MachineStatusLog.log_id), func.sum(cast(MachineStatusLog.resolved, Integer))),
+    "batches": select(
+        func.count(), func.sum(cast(ProductionBatch.status.in_(["active", "processing"]), Integer))
+    ).select_from(ProductionBatch),
+    "kpi": select(func.max(KPIMetrics.metric_id), func.count()).select_from(KPIMetrics),
+}
+
+def read_watermarks(shards):
+    """{依存元: {シャード名: 目印}}（全シャードへ並列に問い合わせる）"""
+    marks = shards.scatter(
+        lambda session: {name: list(session.execute(stmt).one()) for name, stmt in WATERMARKS.items()}
+    )
+    return {name: {shard: marks[shard][name] for shard in shards.names} for name in WATERMARKS}
+
+def bundle_targets(shards):
+    """出力するバンドルの一覧: (キー, APIパス, クエリ, 依存元)"""
+    targets = [
+        ("dashboard/summary", "/api/dashboard/summary", {}, ("kpi", "batches", "machine_status")),
+        ("dashboard/process-flow", "/api/dashboard/process-flow", {}, ("events", "machine_status")),
+        ("alerts", "/api/alerts", {}, ("machine_status",)),
+    ]
+    for process_code in PROCESS_CODES:
+        targets.append((
+            f"dashboard/process/{process_code}", f"/api/dashboard/process/{process_code}", {},
+            ("events", "quality", "machine_status")
+        ))
+
+    # いずれかのシャードにある品質パラメータ・KPI指標
+    found = shards.scatter(lambda session: (
+        session.execute(select(QualityCheck.parameter_name).distinct()).scalars().all(),
+        session.execute(select(KPIMetrics.metric_name).distinct()).scalars().all(),
+    )).values()
+    parameters = {parameter for shard_parameters, _ in found for parameter in shard_parameters}
+    metrics = {metric_name for _, shard_metrics in found for metric_name in shard_metrics}
+    for parameter in sorted(parameters):
+        targets.append((
+            f"dashboard/quality-trend/{parameter}", f"/api/dashboard/quality-trend/{parameter}", {}, ("quality",)
+        ))
+    for metric_name in sorted(metrics):
+        for period in KPI_PERIODS:
+            targets.append((
+                f"kpi/trend/{metric_name}/{period}", f"/api/kpi/trend/{metric_name}", {"period": period}, ("kpi",)
+            ))
+    return targets
+
+class SnapshotExporter:
+    """スナップショットバンドルの差分出力"""
+
+    def __init__(self, out_dir=DEFAULT_OUT_DIR, max_age=900):
+        self.out_dir = out_dir
+        # データが変わらなくても「過去24時間」等の期間がずれるため、この秒数を過ぎたバンドルは再生成する
+        self.max_age = max_age
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"bundles": {}}
+        return manifest if manifest.get("version") == MANIFEST_VERSION else {"bundles": {}}
+
+    async def run(self, client, shards, force=False):
+        """差分を出力して {written, unchanged, skipped, failed} の件数を返す（shards は ShardRouter）"""
+        previous = self.load_manifest()
+        watermarks = read_watermarks(shards)
+        now = datetime.now()
+        counts = {"written": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+        bundles = {}
+
+        for key, path, params, sources in bundle_targets(shards):
+            entry = previous["bundles"].get(key)
+            source_marks = {source: watermarks[source] for source in sources}
+            if not force and not self._is_stale(entry, source_marks, now):
+                bundles[key] = entry
+                counts["skipped"] += 1
+                continue
+
+            response = await client.get(path, params=params)
+            if response.status_code != 200:
+                print(f"スナップショット失敗: {key} ({response.status_code})")
+                if entry:
+                    bundles[key] = entry
+                counts["failed"] += 1
+                continue
+
+            content = response.content
+            digest = hashlib.sha256(content).hexdigest()
+            if entry and entry["sha256"] == digest and self._exists(entry):
+                counts["unchanged"] += 1
+            else:
+                entry = {"file": self._write_bundle(key, digest, content), "sha256": digest}
+                counts["written"] += 1
+            bundles[key] = {
+                **entry,
+                "path": path,
+                "params": params,
+                "raw_bytes": len(content),
+                "bytes": os.path.getsize(os.path.join(self.out_dir, entry["file"])),
+                "generated_at": now.isoformat(),
+                "sources": source_marks,
+            }
+
+        self._write_json(MANIFEST_FILE, {
+            "version": MANIFEST_VERSION,
+            "generated_at": now.isoformat(),
+            "watermarks": watermarks,
+            "bundles": bundles,
+        })
+        # 直前のマニフェストを取得済みのクライアントのため、1世代前のバンドルまでは残す
+        self._remove_unreferenced(bundles, previous["bundles"])
+        return counts
+
+    def _is_stale(self, entry, source_marks, now):
+        if entry is None or entry.get("sources") != source_marks:
+            return True
+        if not self._exists(entry):
+            return True
+        return (now - datetime.fromisoformat(entry["generated_at"])).total_seconds() >= self.max_age
+
+    def _exists(self, entry):
+        return os.path.exists(os.path.join(self.out_dir, entry["file"]))
+
+    def _write_bundle(self, key, digest, content):
+        name = f"{BUNDLE_DIR}/{key}.{digest[:16]}.json.gz"
+        # mtime=0 で同じ内容から同じバイト列を作る
+        self._write_file(name, gzip.compress(content, compresslevel=9, mtime=0))
+        return name
+
+    def _write_json(self, name, payload):
+        self._write_file(name, json.dumps(payload, ensure_ascii=False, indent=1).encode("utf-8"))
+
+    def _write_file(self, name, data):
+        path = os.path.join(self.out_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_unreferenced(self, *manifests):
+        referenced = {os.path.normpath(entry["file"]) for bundles in manifests for entry in bundles.values()}
+        bundle_root = os.path.join(self.out_dir, BUNDLE_DIR)
+        for directory, _, files in os.walk(bundle_root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if os.path.normpath(os.path.relpath(path, self.out_dir)) not in referenced:
+                    os.remove(path)
+
+async def export(exporter, force=False, interval=None):
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://snapshot") as client:
+            while True:
+                started = time.perf_counter()
+                counts = await exporter.run(client, main.app.state.shards, force=force)
+                print(
+                    f"スナップショット出力: 書き込み {counts['written']}件, 内容変化なし {counts['unchanged']}件, "
+                    f"更新なし {counts['skipped']}件, 失敗 {counts['failed']}件 "
+                    f"({(time.perf_counter() - started) * 1000:.0f}ms)"
+                )
+                if interval is None:
+                    break
+                force = False
+                await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="ダッシュボードの静的スナップショット出力")
+    parser.add_argument("--database-url", default=None, help="接続先（省略時は PAPERPLANT_DATABASE_URL）")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="出力先ディレクトリ")
+    parser.add_argument("--max-age", type=float, default=900, help="データが変わらなくても再生成するまでの秒数")
+    parser.add_argument("--force", action="store_true", help="全バンドルを再生成")
+    parser.add_argument("--interval", type=float, default=None, help="指定秒ごとに差分を出力し続ける")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["PAPERPLANT_DATABASE_URL"] = args.database_url
+    asyncio.run(export(SnapshotExporter(args.out, args.max_age), force=args.force, interval=args.interval))
+
+if __name__ == "__main__":
+    main()
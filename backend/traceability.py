@@ -0,0 +1,342 @@
+"""
+製紙工場ダッシュボードアプリ - トレーサビリティ検索
+原料ロット・生産バッチ・製品ロットを結合した条件検索（キーセットページング）
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import func, select, text, tuple_
+
+from models import FinishedProductLot, ProductionBatch, RawMaterialLot
+from search_index import (
+    LOT_SEARCH_TABLE, LOT_SEARCH_TERMS_FTS_TABLE, LOT_SEARCH_TERMS_TABLE, has_lot_search_index
+)
+
+class InvalidCursor(Exception):
+    """ページングカーソルの形式が不正"""
+
+# 並び順（新しいバッチ順）。製品ロットのないバッチも一意に並べるため空文字で補完
+# 生産開始日時（creation_ts）のないバッチは最後に、バッチID・製品ロットIDの降順で並べる
+_PRODUCT_KEY = func.coalesce(FinishedProductLot.product_lot_id, "")
+_UNDATED_SORT_KEY = (ProductionBatch.batch_id, _PRODUCT_KEY)
+_SORT_KEY = (ProductionBatch.creation_ts, *_UNDATED_SORT_KEY)
+
+_SEARCH_COLUMNS = (
+    ProductionBatch.batch_id,
+    ProductionBatch.creation_ts,
+    ProductionBatch.batch_type,
+    ProductionBatch.status,
+    RawMaterialLot.lot_id,
+    RawMaterialLot.supplier_name,
+    RawMaterialLot.material_type,
+    RawMaterialLot.arrival_ts,
+    RawMaterialLot.fsc_cert_id,
+    FinishedProductLot.product_lot_id,
+    FinishedProductLot.product_code,
+    FinishedProductLot.completion_ts,
+    FinishedProductLot.shipment_ts,
+    FinishedProductLot.destination,
+    FinishedProductLot.quantity_kg,
+    FinishedProductLot.final_quality_ok,
+)
+
+def _range(column, start, end):
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if end is not None:
+        conditions.append(column <= end)
+    return conditions
+
+def build_conditions(product_lot_id=None, batch_id=None, raw_material_lot_id=None,
+                     start_date=None, end_date=None,
+                     arrival_from=None, arrival_to=None,
+                     completion_from=None, completion_to=None,
+                     shipment_from=None, shipment_to=None,
+                     supplier_name=None, destination=None, product_code=None,
+                     fsc_certified=None, quality_ok=None):
+    """検索条件からWHERE句の条件リストを組み立てる
+
+    start_date / end_date はバッチの生産開始日時（creation_ts）に適用する。
+    """
+    conditions = []
+    if product_lot_id:
+        conditions.append(FinishedProductLot.product_lot_id == product_lot_id)
+    if batch_id:
+        conditions.append(ProductionBatch.batch_id == batch_id)
+    if raw_material_lot_id:
+        conditions.append(ProductionBatch.raw_material_lot_id == raw_material_lot_id)
+    conditions += _range(ProductionBatch.creation_ts, start_date, end_date)
+    conditions += _range(RawMaterialLot.arrival_ts, arrival_from, arrival_to)
+    conditions += _range(FinishedProductLot.completion_ts, completion_from, completion_to)
+    conditions += _range(FinishedProductLot.shipment_ts, shipment_from, shipment_to)
+    if supplier_name:
+        conditions.append(RawMaterialLot.supplier_name == supplier_name)
+    if destination:
+        conditions.append(FinishedProductLot.destination == destination)
+    if product_code:
+        conditions.append(FinishedProductLot.product_code == product_code)
+    if fsc_certified is not None:
+        conditions.append(RawMaterialLot.fsc_cert_id.isnot(None) if fsc_certified
+                          else RawMaterialLot.fsc_cert_id.is_(None))
+    if quality_ok is not None:
+        conditions.append(FinishedProductLot.final_quality_ok == quality_ok)
+    return conditions
+
+def _joined(stmt, conditions):
+    """原料ロット・製品ロットを外部結合し、条件を適用"""
+    return (
+        stmt.select_from(ProductionBatch)
+        .outerjoin(RawMaterialLot, ProductionBatch.raw_material_lot_id == RawMaterialLot.lot_id)
+        .outerjoin(FinishedProductLot, FinishedProductLot.batch_id == ProductionBatch.batch_id)
+        .where(*conditions)
+    )
+
+def search_lots(db, conditions, limit=50, cursor=None):
+    """条件に一致するロット系列を新しい順に1ページ分取得
+
+    全件数（total_count）は3表結合の全走査になるため1ページ目（cursor なし）のみ数え、以降は None を返す。
+    生産開始日時のないバッチは日時のあるバッチをすべて返した後に続ける
+    （どちらも ix_production_batches_creation の範囲走査で引けるよう、別のクエリに分ける）。
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    rows = []
+    if after is None or after[0] is not None:
+        dated = [*conditions, ProductionBatch.creation_ts.is_not(None)]
+        if after:
+            dated.append(tuple_(*_SORT_KEY) < tuple_(*after))
+        rows = _fetch_lots(db, dated, _SORT_KEY, limit + 1)
+    if len(rows) <= limit:
+        undated = [*conditions, ProductionBatch.creation_ts.is_(None)]
+        if after and after[0] is None:
+            undated.append(tuple_(*_UNDATED_SORT_KEY) < tuple_(*after[1:]))
+        rows += _fetch_lots(db, undated, _UNDATED_SORT_KEY, limit + 1 - len(rows))
+
+    total_count = None if cursor else db.execute(_joined(select(func.count()), conditions)).scalar()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.creation_ts, last.batch_id, last.product_lot_id or "")
+
+    return {
+        "lots": [_format_row(row) for row in rows],
+        "total_count": total_count,
+        "next_cursor": next_cursor
+    }
+
+def _fetch_lots(db, conditions, sort_key, limit):
+    return db.execute(
+        _joined(select(*_SEARCH_COLUMNS), conditions)
+        .order_by(*(key.desc() for key in sort_key))
+        .limit(limit)
+    ).all()
+
+def merge_lot_pages(pages, limit):
+    """シャードごとの search_lots の結果（{シャード名: ページ}）を1ページに結合
+
+    各シャードは同じカーソルより後を新しい順に limit 件まで返しているため、
+    結合して上位 limit 件を取れば全シャードを通した次の limit 件になる。
+    """
+    counts = [page["total_count"] for page in pages.values()]
+    lots = [{**lot, "mill": name} for name, page in pages.items() for lot in page["lots"]]
+    lots.sort(key=_lot_sort_key, reverse=True)
+    has_more = len(lots) > limit or any(page["next_cursor"] for page in pages.values())
+    lots = lots[:limit]
+    next_cursor = encode_cursor(*_lot_cursor_key(lots[-1])) if has_more and lots else None
+    return {
+        "lots": lots,
+        # 2ページ目以降は各シャードとも件数を数えない
+        "total_count": None if None in counts else sum(counts),
+        "next_cursor": next_cursor
+    }
+
+def _lot_cursor_key(lot):
+    product = lot["product"]
+    return lot["batch"]["creation_ts"], lot["batch"]["batch_id"], product["product_lot_id"] if product else ""
+
+def _lot_sort_key(lot):
+    # search_lots と同じく、生産開始日時のないバッチを降順の最後に並べる
+    creation_ts, batch_id, product_lot_id = _lot_cursor_key(lot)
+    return creation_ts is not None, creation_ts or datetime.min, batch_id, product_lot_id
+
+def _format_row(row):
+    return {
+        "batch": {
+            "batch_id": row.batch_id,
+            "creation_ts": row.creation_ts,
+            "batch_type": row.batch_type,
+            "status": row.status
+        },
+        "raw_material": {
+            "lot_id": row.lot_id,
+            "supplier_name": row.supplier_name,
+            "material_type": row.material_type,
+            "arrival_ts": row.arrival_ts,
+            "fsc_cert_id": row.fsc_cert_id
+        } if row.lot_id else None,
+        "product": {
+            "product_lot_id": row.product_lot_id,
+            "product_code": row.product_code,
+            "completion_ts": row.completion_ts,
+            "shipment_ts": row.shipment_ts,
+            "destination": row.destination,
+            "quantity_kg": row.quantity_kg,
+            "final_quality_ok": row.final_quality_ok
+        } if row.product_lot_id else None
+    }
+
+def encode_cursor(creation_ts, batch_id, product_lot_id):
+    # 生産開始日時のないバッチは null
+    payload = json.dumps([creation_ts.isoformat() if creation_ts else None, batch_id, product_lot_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        creation_ts, batch_id, product_lot_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (datetime.fromisoformat(creation_ts) if creation_ts is not None else None), batch_id, product_lot_id
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("無効なカーソルです") from exc
+
+# === 入力補完（type-ahead） ===
+
+# ロットIDの接頭辞と対応する主キー列
+_LOT_ID_SOURCES = (
+    ("FPL-", "product", FinishedProductLot.product_lot_id),
+    ("PB-", "batch", ProductionBatch.batch_id),
+    ("RML-", "raw_material", RawMaterialLot.lot_id),
+)
+
+# 属性値ごとのロット取得（値と日時の複合インデックスで新しい順に引く）
+_TERM_SOURCES = {
+    "supplier_name": ("raw_material", RawMaterialLot, RawMaterialLot.lot_id, RawMaterialLot.arrival_ts),
+    "material_type": ("raw_material", RawMaterialLot, RawMaterialLot.lot_id, RawMaterialLot.arrival_ts),
+    "destination": ("product", FinishedProductLot, FinishedProductLot.product_lot_id, FinishedProductLot.shipment_ts),
+    "product_code": ("product", FinishedProductLot, FinishedProductLot.product_lot_id,
+                     FinishedProductLot.completion_ts),
+}
+
+# trigramトークナイザは3文字未満の語に一致しない
+_MIN_FTS_LENGTH = 3
+
+# 一致件数が多い語でも一定時間で返すため、新しい順に候補を打ち切ってから順位付けする
+_SUGGEST_CANDIDATES = 200
+_SUGGEST_MAX_TERMS = 5
+
+_SUGGEST_ID_SQL = text(f"""
+    SELECT lot_id, lot_type
+    FROM (
+        SELECT lot_id, lot_type, bm25({LOT_SEARCH_TABLE}) AS score
+        FROM {LOT_SEARCH_TABLE}
+        WHERE {LOT_SEARCH_TABLE} MATCH :query
+        ORDER BY rowid DESC
+        LIMIT :candidates
+    )
+    ORDER BY score
+    LIMIT :limit
+""")
+
+_SUGGEST_TERM_SQL = text(f"""
+    SELECT t.field, t.value
+    FROM {LOT_SEARCH_TERMS_FTS_TABLE} f
+    JOIN {LOT_SEARCH_TERMS_TABLE} t ON t.term_id = f.rowid
+    WHERE {LOT_SEARCH_TERMS_FTS_TABLE} MATCH :query
+    ORDER BY bm25({LOT_SEARCH_TERMS_FTS_TABLE})
+    LIMIT :limit
+""")
+
+_SUGGEST_COLUMNS = ("lot_id", "lot_type", "supplier_name", "material_type", "destination", "product_code")
+
+def suggest_lots(db, q, limit=10):
+    """ロットID・サプライヤー名・原料種別・出荷先・製品コードの部分一致による入力補完
+
+    ロットIDの接頭辞（FPL-/PB-/RML-）は主キーの範囲検索、3文字以上はFTS5索引、
+    それ未満はサプライヤー名・出荷先・製品コードの前方一致で検索する。
+    ロットIDの一致を属性値の一致より上位に並べる。
+    """
+    q = q.strip()
+    if not q:
+        return []
+
+    id_sources = [(lot_type, column) for prefix, lot_type, column in _LOT_ID_SOURCES
+                  if q.upper().startswith(prefix) or prefix.startswith(q.upper())]
+    if id_sources:
+        return _suggest_id_prefix(db, q.upper(), id_sources, limit)
+
+    if len(q) >= _MIN_FTS_LENGTH and has_lot_search_index(db.connection()):
+        query = '"' + q.replace('"', '""') + '"'
+        suggestions = [
+            _suggestion(lot_id, lot_type) for lot_id, lot_type in db.execute(
+                _SUGGEST_ID_SQL, {"query": query, "candidates": _SUGGEST_CANDIDATES, "limit": limit})
+        ]
+        if len(suggestions) < limit:
+            terms = db.execute(_SUGGEST_TERM_SQL, {"query": query, "limit": _SUGGEST_MAX_TERMS}).all()
+            suggestions += _suggest_by_terms(db, terms, limit - len(suggestions))
+        return suggestions
+
+    return _suggest_name_prefix(db, q, limit)
+
+def _suggest_by_terms(db, terms, limit):
+    """一致した属性値ごとに新しいロットを均等に取得"""
+    suggestions = []
+    quota = -(-limit // len(terms)) if terms else 0
+    for field, value in terms:
+        if len(suggestions) >= limit:
+            break
+        lot_type, model, id_column, ts_column = _TERM_SOURCES[field]
+        lot_ids = db.execute(
+            select(id_column).where(getattr(model, field) == value)
+            .order_by(ts_column.desc()).limit(min(quota, limit - len(suggestions)))
+        ).scalars()
+        suggestions += [_suggestion(lot_id, lot_type, **{field: value}) for lot_id in lot_ids]
+    return suggestions
+
+def _prefix_range(column, prefix):
+    # LIKE 'x%' はSQLiteの既定（大文字小文字を区別しない）ではインデックスを使えないため範囲比較にする
+    return (column >= prefix, column < prefix + "\uffff")
+
+def _suggest_id_prefix(db, prefix, id_sources, limit):
+    suggestions = []
+    for lot_type, column in id_sources:
+        ids = db.execute(
+            select(column).where(*_prefix_range(column, prefix)).order_by(column).limit(limit - len(suggestions))
+        ).scalars()
+        suggestions += [_suggestion(lot_id, lot_type) for lot_id in ids]
+        if len(suggestions) >= limit:
+            break
+    return suggestions
+
+def _suggest_name_prefix(db, prefix, limit):
+    suggestions = [
+        _suggestion(row.lot_id, "raw_material", supplier_name=row.supplier_name, material_type=row.material_type)
+        for row in db.execute(
+            select(RawMaterialLot.lot_id, RawMaterialLot.supplier_name, RawMaterialLot.material_type)
+            .where(*_prefix_range(RawMaterialLot.supplier_name, prefix))
+            .order_by(RawMaterialLot.supplier_name.desc(), RawMaterialLot.arrival_ts.desc())
+            .limit(limit)
+        )
+    ]
+    for column in (FinishedProductLot.destination, FinishedProductLot.product_code):
+        if len(suggestions) >= limit:
+            break
+        suggestions += [
+            _suggestion(row.product_lot_id, "product", destination=row.destination, product_code=row.product_code)
+            for row in db.execute(
+                select(FinishedProductLot.product_lot_id, FinishedProductLot.destination,
+                       FinishedProductLot.product_code)
+                .where(*_prefix_range(column, prefix))
+                .order_by(column.desc())
+                .limit(limit - len(suggestions))
+            )
+        ]
+    return suggestions
+
+def _suggestion(lot_id, lot_type, **fields):
+    suggestion = dict.fromkeys(_SUGGEST_COLUMNS)
+    suggestion.update(lot_id=lot_id, lot_type=lot_type, **fields)
+    return suggestion
@@ -0,0 +1,90 @@
+"""
+製紙工場ダッシュボードアプリ - CDプロファイル解析ベンチマーク
+1直分（既定8時間・30秒周期）の600点CDプロファイルに筋状欠陥・耳部カールを埋め込み、
+cd_profile_analysis.py の読み込み・解析時間と検出結果を確認する
+
+使い方:
+    python benchmarks/cd_profile_benchmark.py --hours 8 --points 600
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+
+from sqlalchemy import insert
+
+from cd_profile_analysis import CDProfileAnalyzer
+from models import create_database, ProcessRecord, QualityCheck
+
+PARAMETERS = {"basis_weight": (80.0, 2.0), "moisture_content": (5.0, 0.5)}
+MACHINES = ("PM-01", "PM-02")
+
+def populate(engine, start, scans, points, interval, rng):
+    """プロファイルの投入。PM-01 の後半に筋状欠陥、PM-02 の中盤に耳部カールを埋め込む"""
+    with engine.begin() as conn:
+        record_ids = {
+            machine_id: conn.execute(insert(ProcessRecord).values(
+                batch_id="PB-BENCH", process_code="P3", machine_id=machine_id, start_ts=start
+            )).inserted_primary_key[0]
+            for machine_id in MACHINES
+        }
+        for machine_id in MACHINES:
+            for parameter, (target, tolerance) in PARAMETERS.items():
+                profiles = target + rng.normal(0, tolerance / 6, (scans, points))
+                if machine_id == "PM-01":
+                    profiles[scans // 2:, points // 3:points // 3 + 5] += 0.6 * tolerance
+                else:
+                    profiles[scans // 3:scans // 2, :points // 20] += 0.3 * tolerance
+                conn.execute(insert(QualityCheck), [{
+                    "record_id": record_ids[machine_id],
+                    "ts": start + timedelta(seconds=i * interval),
+                    "parameter_name": parameter,
+                    "value": float(profile.mean()),
+                    "value_array": profile.tolist(),
+                    "target_value": target,
+                    "upper_limit": target + tolerance,
+                    "lower_limit": target - tolerance,
+                    "is_ok": True,
+                    "measurement_type": "online",
+                } for i, profile in enumerate(profiles)])
+
+def main():
+    parser = argparse.ArgumentParser(description="CDプロファイル解析ベンチマーク")
+    parser.add_argument("--hours", type=float, default=8.0)
+    parser.add_argument("--points", type=int, default=600, help="1プロファイルの測定点数")
+    parser.add_argument("--interval", type=float, default=30.0, help="スキャン周期（秒）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    scans = int(args.hours * 3600 / args.interval)
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(hours=args.hours)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_database(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        print(f"{len(MACHINES) * len(PARAMETERS)}系列 x {scans}スキャン x {args.points}点を投入中...")
+        populate(engine, start, scans, args.points, args.interval, np.random.default_rng(0))
+        analyzer = CDProfileAnalyzer(engine)
+
+        load_times, detect_times = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            groups = analyzer.load_profiles(start, end)
+            loaded = time.perf_counter()
+            findings = [finding for group in groups for finding in analyzer.detect(group)]
+            load_times.append(loaded - started)
+            detect_times.append(time.perf_counter() - loaded)
+
+        print(f"読み込み: {min(load_times) * 1000:.0f}ms, 解析: {min(detect_times) * 1000:.0f}ms（最良値）")
+        for finding in sorted(findings, key=lambda finding: (finding["machine_id"], finding["ts"])):
+            print(f"  {finding['machine_id']} {finding['message']}")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
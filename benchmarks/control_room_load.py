@@ -0,0 +1,272 @@
+"""
+製紙工場ダッシュボードアプリ - 中央制御室負荷シミュレーター
+フロントエンドの定期ポーリングとトレーサビリティ操作をN台の画面分再現し、ルート別のレイテンシと飽和点を計測する
+
+画面種別（更新間隔は frontend/src/components の setInterval に合わせる）:
+- summary: 総合サマリー（30秒ごと）
+- process: 工程別モニタリング（15秒ごと、工程・表示期間を切り替えながら）
+- flow: 工程フロー監視（10秒ごと）
+- traceability: 検索 → 先頭結果のジャーニー → 数件のジャーニー閲覧（操作間隔は指数分布）
+
+closed: 各画面は応答を待ってから次のリクエストまで待機する（サーバーが遅いと要求も減る）
+open: 応答を待たずにポアソン到着でリクエストを発行する（サーバーが遅いと待ち行列が伸びる）
+
+使い方:
+    python benchmarks/control_room_load.py --database-url sqlite:///database/paperplant.db --screens 40 --duration 60
+    python benchmarks/control_room_load.py --base-url http://localhost:8000 --mode open --ramp 10,20,40,80 --time-scale 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+# 画面ごとのポーリング間隔（秒）
+POLL_INTERVALS = {"summary": 30.0, "process": 15.0, "flow": 10.0}
+# トレーサビリティ画面: 検索操作の平均間隔と、結果からジャーニーを開くまでの平均間隔（秒）
+SEARCH_INTERVAL = 60.0
+CLICK_INTERVAL = 3.0
+
+# 工程別モニタリングの選択肢（既定表示の抄紙工程・24時間に偏らせる）
+PROCESS_CODES = ["P3", "P3", "P3", "P1", "P2", "P4"]
+TIME_RANGES = [24, 24, 1, 4, 12]
+
+DEFAULT_MIX = "summary=1,process=2,flow=1,traceability=1"
+
+class LoadStats:
+    """ルート別のレイテンシ・エラー件数"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.started = time.perf_counter()
+
+    def record(self, route, elapsed_ms, ok):
+        self.latencies[route].append(elapsed_ms)
+        if not ok:
+            self.errors[route] += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        result = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            result[route] = {
+                "count": len(values),
+                "error_rate": self.errors[route] / len(values),
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "p99": _percentile(values, 0.99),
+                "rps": len(values) / elapsed,
+            }
+        return result
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+class ControlRoom:
+    """画面種別ごとのリクエストを発行する仮想画面群"""
+
+    def __init__(self, client, stats, lot_ids, mode="closed", time_scale=1.0, timeout=30.0):
+        self.client = client
+        self.stats = stats
+        self.lot_ids = lot_ids
+        self.mode = mode
+        self.time_scale = time_scale
+        self.timeout = timeout
+        self.pending = set()
+
+    async def get(self, route, url, params=None):
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(url, params=params, timeout=self.timeout)
+            ok = response.status_code < 400
+            data = response.json() if ok else None
+        except (httpx.HTTPError, ValueError):
+            ok, data = False, None
+        self.stats.record(route, (time.perf_counter() - started) * 1000, ok)
+        return data
+
+    async def run_screen(self, kind, until):
+        interval = (POLL_INTERVALS.get(kind, SEARCH_INTERVAL)) / self.time_scale
+        action = self.traceability_session if kind == "traceability" else lambda: self.poll(kind)
+        # 画面を開いたタイミングをばらけさせる
+        await asyncio.sleep(random.uniform(0, interval))
+        loop = asyncio.get_running_loop()
+        while loop.time() < until:
+            if self.mode == "open":
+                task = asyncio.create_task(action())
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+                await asyncio.sleep(random.expovariate(1 / interval))
+            else:
+                await action()
+                # ポーリングは固定間隔、検索操作は人の操作として指数分布
+                await asyncio.sleep(interval if kind in POLL_INTERVALS else random.expovariate(1 / interval))
+
+    async def poll(self, kind):
+        if kind == "summary":
+            await self.get("GET /api/dashboard/summary", "/api/dashboard/summary")
+        elif kind == "flow":
+            await self.get("GET /api/dashboard/process-flow", "/api/dashboard/process-flow")
+        else:
+            end_time = datetime.now()
+            start_time = end_time - timedelta(hours=random.choice(TIME_RANGES))
+            await self.get(
+                "GET /api/dashboard/process/{process_code}",
+                f"/api/dashboard/process/{random.choice(PROCESS_CODES)}",
+                {"start_time": start_time.isoformat(), "end_time": end_time.isoformat()}
+            )
+
+    async def traceability_session(self):
+        data = await self.get("GET /api/traceability/search", "/api/traceability/search", self._search_params())
+        if not data:
+            return
+        lot_ids = [lot_id for lot_id in (_journey_lot_id(lot) for lot in data.get("lots", [])) if lot_id]
+        # 先頭の結果は自動的にジャーニーを表示し、その後いくつかの結果を開く
+        for i, lot_id in enumerate(lot_ids[:1 + random.randint(0, 3)]):
+            if i:
+                await asyncio.sleep(random.expovariate(self.time_scale / CLICK_INTERVAL))
+            await self.get("GET /api/traceability/journey/{lot_id}", f"/api/traceability/journey/{lot_id}")
+
+    def _search_params(self):
+        roll = random.random()
+        if self.lot_ids and roll < 0.4:
+            return {"product_lot_id": random.choice(self.lot_ids["product"])} if self.lot_ids["product"] else {}
+        if self.lot_ids and roll < 0.6:
+            return {"batch_id": random.choice(self.lot_ids["batch"])}
+        if self.lot_ids and roll < 0.7:
+            return {"raw_material_lot_id": random.choice(self.lot_ids["raw_material"])}
+        end_date = datetime.now()
+        return {"start_date": (end_date - timedelta(days=random.choice([1, 7, 30]))).isoformat(),
+                "end_date": end_date.isoformat()}
+
+def _journey_lot_id(lot):
+    if lot.get("product"):
+        return lot["product"]["product_lot_id"]
+    return lot["batch"]["batch_id"]
+
+def parse_mix(text):
+    weights = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in POLL_INTERVALS and kind != "traceability":
+            raise SystemExit(f"不明な画面種別: {kind}")
+        weights[kind] = int(weight or 1)
+    return weights
+
+def assign_screens(count, weights):
+    """重みに比例して画面種別を割り当てる"""
+    cycle = [kind for kind, weight in weights.items() for _ in range(weight)]
+    return [cycle[i % len(cycle)] for i in range(count)]
+
+@asynccontextmanager
+async def connect(base_url, timeout):
+    """base_url 指定時は起動済みのサーバー、省略時は main.app をASGIで直接呼び出す"""
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+            yield client
+        return
+
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://control-room", timeout=timeout) as client:
+            yield client
+
+async def sample_lot_ids(client, count=200):
+    """検索・ジャーニーで使う実在ロットIDを取得"""
+    response = await client.get("/api/traceability/search", params={"limit": min(count, 500)})
+    response.raise_for_status()
+    lots = response.json().get("lots", [])
+    return {
+        "product": [lot["product"]["product_lot_id"] for lot in lots if lot.get("product")],
+        "batch": [lot["batch"]["batch_id"] for lot in lots],
+        "raw_material": [lot["raw_material"]["lot_id"] for lot in lots if lot.get("raw_material")],
+    } if lots else None
+
+async def run_stage(client, lot_ids, screens, duration, mode, time_scale, timeout):
+    stats = LoadStats()
+    room = ControlRoom(client, stats, lot_ids, mode=mode, time_scale=time_scale, timeout=timeout)
+    until = asyncio.get_running_loop().time() + duration
+    await asyncio.gather(*(room.run_screen(kind, until) for kind in screens))
+    if room.pending:
+        await asyncio.wait(set(room.pending), timeout=timeout)
+    return stats.summary()
+
+def print_stage(screen_count, mode, summary):
+    total = sum(route["count"] for route in summary.values())
+    errors = sum(route["count"] * route["error_rate"] for route in summary.values())
+    print(f"\n画面数 {screen_count}（{mode}）: {total}リクエスト, エラー率 {errors / total * 100 if total else 0:.2f}%")
+    print(f"{'route':44s} {'count':>6s} {'err%':>6s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'req/s':>7s}")
+    for route, s in summary.items():
+        print(f"{route:44s} {s['count']:6d} {s['error_rate'] * 100:6.2f} "
+              f"{s['p50']:8.1f} {s['p95']:8.1f} {s['p99']:8.1f} {s['rps']:7.2f}")
+
+def print_saturation(stages, slo_ms, max_error_rate):
+    """ルートごとに p95 がSLOを超えるかエラー率が上限を超えた最初の画面数を表示"""
+    print(f"\n飽和点（p95 > {slo_ms:g}ms またはエラー率 > {max_error_rate * 100:g}%）:")
+    routes = sorted({route for _, summary in stages for route in summary})
+    for route in routes:
+        saturated = next((
+            screen_count for screen_count, summary in stages
+            if route in summary and (summary[route]["p95"] > slo_ms or summary[route]["error_rate"] > max_error_rate)
+        ), None)
+        label = f"{saturated}画面" if saturated else f"{stages[-1][0]}画面まで未到達"
+        print(f"- {route}: {label}")
+
+async def run(args):
+    weights = parse_mix(args.mix)
+    ramp = [int(n) for n in args.ramp.split(",")] if args.ramp else [args.screens]
+
+    async with connect(args.base_url, args.timeout) as client:
+        lot_ids = await sample_lot_ids(client)
+        if not lot_ids:
+            print("ロットが見つからないため、トレーサビリティ検索は期間指定のみで行います")
+
+        stages = []
+        for screen_count in ramp:
+            summary = await run_stage(
+                client, lot_ids, assign_screens(screen_count, weights),
+                args.duration, args.mode, args.time_scale, args.timeout
+            )
+            print_stage(screen_count, args.mode, summary)
+            stages.append((screen_count, summary))
+
+    if len(stages) > 1:
+        print_saturation(stages, args.slo_ms, args.max_error_rate)
+
+def main():
+    parser = argparse.ArgumentParser(description="中央制御室負荷シミュレーター")
+    parser.add_argument("--base-url", default=None, help="起動済みサーバーのURL（省略時はプロセス内でASGI呼び出し）")
+    parser.add_argument("--database-url", default=None, help="プロセス内実行時の接続先（PAPERPLANT_DATABASE_URL）")
+    parser.add_argument("--screens", type=int, default=20, help="同時に開いている画面数")
+    parser.add_argument("--ramp", default=None, help="画面数を段階的に増やす（例: 10,20,40,80）")
+    parser.add_argument("--duration", type=float, default=60.0, help="1段階あたりの計測時間（秒）")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"画面種別の比率（既定: {DEFAULT_MIX}）")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="操作・ポーリング間隔の短縮倍率")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="飽和判定に使う p95 の上限")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.database_url:
+        os.environ["PAPERPLANT_DATABASE_URL"] = args.database_url
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+製紙工場ダッシュボードアプリ - ロット入力補完ベンチマーク
+大量のロットを投入した一時データベースで suggest_lots のレイテンシ（p50/p99）を計測する
+
+使い方:
+    python benchmarks/lot_search_benchmark.py --lots 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from models import create_database, get_session, RawMaterialLot, ProductionBatch, FinishedProductLot
+from traceability import suggest_lots
+
+SUPPLIERS = [("北海道木材", "木材チップ"), ("カナダ森林資源", "木材チップ"), ("東南アジア木材", "木材チップ"),
+             ("古紙回収センター", "古紙"), ("欧州パルプ", "木材チップ")]
+PRODUCT_CODES = ["NP-80", "OF-90", "CB-120", "CW-60"]
+
+# 操作員の入力を模したクエリ（ID前方一致・日本語部分一致・短い入力）
+QUERIES = ["FPL-0012", "PB-00099", "RML-1", "アジア", "古紙回収", "森林", "Customer-07", "CB-1", "OF-",
+           "0012345", "北海", "欧", "NP", "ustomer-1"]
+
+def populate(engine, lots, chunk=50000):
+    start = datetime(2020, 1, 1)
+    for offset in range(0, lots, chunk):
+        count = min(chunk, lots - offset)
+        raw, batches, products = [], [], []
+        for i in range(offset, offset + count):
+            supplier, material = random.choice(SUPPLIERS)
+            ts = start + timedelta(minutes=i)
+            raw.append({"lot_id": f"RML-{i:07d}", "arrival_ts": ts, "supplier_name": supplier,
+                        "material_type": material, "weight_kg": 20000.0})
+            batches.append({"batch_id": f"PB-{i:07d}", "raw_material_lot_id": f"RML-{i:07d}",
+                            "creation_ts": ts, "batch_type": "Pulp", "status": "completed"})
+            products.append({"product_lot_id": f"FPL-{i:07d}", "batch_id": f"PB-{i:07d}",
+                             "product_code": random.choice(PRODUCT_CODES), "completion_ts": ts,
+                             "destination": f"Customer-{random.randint(1, 20):02d}", "quantity_kg": 15000.0})
+        with engine.begin() as conn:
+            conn.execute(insert(RawMaterialLot), raw)
+            conn.execute(insert(ProductionBatch), batches)
+            conn.execute(insert(FinishedProductLot), products)
+        print(f"  {offset + count}/{lots}")
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+def main():
+    parser = argparse.ArgumentParser(description="ロット入力補完ベンチマーク")
+    parser.add_argument("--lots", type=int, default=200000, help="ロット系列数（原料・バッチ・製品を各1件）")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_database(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        print(f"{args.lots}系列を投入中（トリガーで検索インデックスを同期）...")
+        populate(engine, args.lots)
+
+        db = get_session(engine)
+        try:
+            print(f"\n{'query':14s} {'hits':>5s} {'p50 ms':>8s} {'p99 ms':>8s}")
+            overall = []
+            for query in QUERIES:
+                suggest_lots(db, query, args.limit)  # ウォームアップ
+                timings = []
+                for _ in range(args.iterations):
+                    started = time.perf_counter()
+                    hits = len(suggest_lots(db, query, args.limit))
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                overall += timings
+                print(f"{query:14s} {hits:5d} {percentile(timings, 0.5):8.2f} {percentile(timings, 0.99):8.2f}")
+            overall.sort()
+            print(f"\n全体: p50={percentile(overall, 0.5):.2f}ms p99={percentile(overall, 0.99):.2f}ms")
+        finally:
+            db.close()
+            engine.dispose()
+
+if __name__ == "__main__":
+    main()
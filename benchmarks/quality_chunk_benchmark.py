@@ -0,0 +1,109 @@
+"""
+製紙工場ダッシュボードアプリ - 品質データのチャンク格納ベンチマーク
+1行1点の quality_checks と、チャンク化（quality_chunks.py）後の格納サイズ（1点あたりバイト数、インデックス込み）と
+品質トレンドの読み取り速度を比較する
+
+使い方:
+    python benchmarks/quality_chunk_benchmark.py --points 200000
+    python benchmarks/quality_chunk_benchmark.py --points 200000 --decimals 2   # 測定分解能0.01に丸めた値
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert, text
+
+from models import create_database, get_session, QualityCheck
+from quality_chunks import compact_quality_checks
+import queries
+
+PARAMETERS = {"basis_weight": (80.0, 2.0), "moisture_content": (5.0, 0.5), "thickness": (100.0, 5.0)}
+
+def populate(engine, points, decimals):
+    """工程記録ごとに各パラメータを1秒周期で測定した品質データを投入（まれに欠測で間隔が空く）"""
+    start = datetime(2024, 1, 1)
+    per_record = 3600
+    rows = []
+    for i in range(points):
+        record, offset = divmod(i // len(PARAMETERS), per_record)
+        parameter = list(PARAMETERS)[i % len(PARAMETERS)]
+        target, tolerance = PARAMETERS[parameter]
+        value = random.gauss(target, tolerance / 3)
+        if decimals is not None:
+            value = round(value, decimals)
+        rows.append({
+            "record_id": record + 1,
+            "ts": start + timedelta(hours=record, seconds=offset + (30 if random.random() < 0.001 else 0)),
+            "parameter_name": parameter,
+            "value": value,
+            "target_value": target,
+            "upper_limit": target + tolerance,
+            "lower_limit": target - tolerance,
+            "is_ok": target - tolerance <= value <= target + tolerance,
+            "measurement_type": "online",
+        })
+    with engine.begin() as conn:
+        conn.execute(insert(QualityCheck), rows)
+    return start
+
+def table_bytes(engine, table):
+    """テーブルとそのインデックスのページサイズ合計（dbstat）"""
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT sum(pgsize) FROM dbstat WHERE name = :table "
+            "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table)"
+        ), {"table": table}).scalar() or 0
+
+def measure_trend(engine, start, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        db = get_session(engine)
+        try:
+            started = time.perf_counter()
+            result = {parameter: queries.fetch_quality_trend(db, parameter, start) for parameter in PARAMETERS}
+            elapsed = time.perf_counter() - started
+        finally:
+            db.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="品質データのチャンク格納ベンチマーク")
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--decimals", type=int, default=None, help="値を指定桁に丸める（測定分解能）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_database(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        print(f"{args.points}点を投入中...")
+        start = populate(engine, args.points, args.decimals)
+
+        row_bytes = table_bytes(engine, "quality_checks")
+        row_seconds, row_result = measure_trend(engine, start, args.repeat)
+
+        started = time.perf_counter()
+        counts = compact_quality_checks(engine, datetime.max)
+        compact_seconds = time.perf_counter() - started
+        with engine.connect() as conn:
+            conn.execute(text("VACUUM"))
+        chunk_bytes = table_bytes(engine, "quality_chunks")
+        chunk_seconds, chunk_result = measure_trend(engine, start, args.repeat)
+        assert chunk_result == row_result, "チャンクから復元したトレンドが元の行と一致しません"
+
+        print(f"チャンク化: {counts['chunks']}チャンク, {compact_seconds * 1000:.0f}ms")
+        print(f"\n{'storage':15s} {'bytes/point':>12s} {'trend ms':>10s} {'points/s':>12s}")
+        for name, size, seconds in (("rows", row_bytes, row_seconds), ("chunks", chunk_bytes, chunk_seconds)):
+            print(f"{name:15s} {size / args.points:12.1f} {seconds * 1000:10.0f} {args.points / seconds:12.0f}")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+製紙工場ダッシュボードアプリ - 読み取り経路ベンチマーク
+ORMエンティティ読み込み＋dictコピー（従来方式）と、Core列射影（queries.py）の1行あたりコストを比較する
+
+使い方:
+    python benchmarks/read_path_benchmark.py --rows 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from models import create_database, get_session, QualityCheck, MachineStatusLog, KPIMetrics
+import queries
+
+def populate(engine, rows):
+    """ベンチマーク用データの投入（CDプロファイル付き品質データ・アラート・KPI）"""
+    start = datetime(2024, 1, 1)
+    quality_rows = []
+    for i in range(rows):
+        value = random.gauss(80.0, 0.7)
+        quality_rows.append({
+            "record_id": i // 100 + 1,
+            "ts": start + timedelta(seconds=i),
+            "parameter_name": "basis_weight",
+            "value": value,
+            "value_array": [value + random.gauss(0, 0.3) for _ in range(50)],
+            "target_value": 80.0,
+            "upper_limit": 82.0,
+            "lower_limit": 78.0,
+            "is_ok": True,
+            "measurement_type": "online",
+        })
+    alert_rows = [{
+        "machine_id": f"PM-0{i % 2 + 1}",
+        "ts": start + timedelta(seconds=i),
+        "status": "alarm",
+        "alert_level": "warning",
+        "message": "PM-01: ドライヤー蒸気圧低下" * 4,
+        "resolved": False,
+    } for i in range(rows)]
+    kpi_rows = [{
+        "ts": start + timedelta(seconds=i),
+        "metric_name": "OEE",
+        "value": random.gauss(75.0, 8.0),
+        "unit": "%",
+        "period_type": "hourly",
+        "target_value": 85.0,
+    } for i in range(rows)]
+
+    with engine.begin() as conn:
+        conn.execute(insert(QualityCheck), quality_rows)
+        conn.execute(insert(MachineStatusLog), alert_rows)
+        conn.execute(insert(KPIMetrics), kpi_rows)
+    return start
+
+# === 従来方式（ORMエンティティ → dict） ===
+
+def orm_quality_trend(db, start):
+    data = db.query(QualityCheck).filter(
+        QualityCheck.parameter_name == "basis_weight", QualityCheck.ts >= start
+    ).order_by(QualityCheck.ts).all()
+    return [{"timestamp": d.ts, "value": d.value, "target": d.target_value, "upper_limit": d.upper_limit,
+             "lower_limit": d.lower_limit, "is_ok": d.is_ok} for d in data]
+
+def orm_alerts(db, limit):
+    alerts = db.query(MachineStatusLog).filter(
+        MachineStatusLog.resolved == False
+    ).order_by(MachineStatusLog.ts.desc()).limit(limit).all()
+    return [{"log_id": a.log_id, "machine_id": a.machine_id, "timestamp": a.ts, "status": a.status,
+             "alert_level": a.alert_level, "message": a.message, "resolved": a.resolved} for a in alerts]
+
+def orm_kpi_trend(db, start):
+    kpis = db.query(KPIMetrics).filter(
+        KPIMetrics.metric_name == "OEE", KPIMetrics.period_type == "hourly", KPIMetrics.ts >= start
+    ).order_by(KPIMetrics.ts).all()
+    return [{"timestamp": k.ts, "value": k.value, "target": k.target_value, "unit": k.unit,
+             "achievement_rate": (k.value / k.target_value * 100) if k.target_value > 0 else 0} for k in kpis]
+
+def measure(engine, fn, repeat):
+    """新規セッションで fn を repeat 回実行し、(中央値秒, 行数) を返す"""
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        db = get_session(engine)
+        try:
+            started = time.perf_counter()
+            count = len(fn(db))
+            timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return statistics.median(timings), count
+
+def main():
+    parser = argparse.ArgumentParser(description="読み取り経路ベンチマーク（ORM vs Core列射影）")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_database(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        print(f"{args.rows}行ずつ投入中...")
+        start = populate(engine, args.rows)
+
+        cases = [
+            ("quality_trend", lambda db: orm_quality_trend(db, start),
+             lambda db: queries.fetch_quality_trend(db, "basis_weight", start)),
+            ("alerts", lambda db: orm_alerts(db, args.rows),
+             lambda db: queries.fetch_alerts(db, "active", args.rows)),
+            ("kpi_trend", lambda db: orm_kpi_trend(db, start),
+             lambda db: queries.fetch_kpi_trend(db, "OEE", "hourly", start)),
+        ]
+
+        print(f"\n{'endpoint':15s} {'ORM us/row':>12s} {'Core us/row':>12s} {'speedup':>8s}")
+        for name, orm_fn, core_fn in cases:
+            orm_seconds, orm_rows = measure(engine, orm_fn, args.repeat)
+            core_seconds, core_rows = measure(engine, core_fn, args.repeat)
+            assert orm_rows == core_rows
+            orm_us = orm_seconds / orm_rows * 1e6
+            core_us = core_seconds / core_rows * 1e6
+            print(f"{name:15s} {orm_us:12.2f} {core_us:12.2f} {orm_us / core_us:7.1f}x")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
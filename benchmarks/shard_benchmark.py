@@ -0,0 +1,109 @@
+"""
+製紙工場ダッシュボードアプリ - シャーディングのベンチマーク
+同じ件数のロットを1つのデータベースに入れた場合と、工場ごとのシャードに分けた場合とで、
+工場全体のトレーサビリティ検索（件数集計＋1ページ目）のレイテンシを比較する
+（シャードは順番に問い合わせる場合と、ShardRouter.scatter で並列に問い合わせる場合の両方を計測）
+
+使い方:
+    python benchmarks/shard_benchmark.py --lots 200000 --shards 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from models import RawMaterialLot, ProductionBatch, FinishedProductLot
+from sharding import ShardRouter
+from traceability import build_conditions, merge_lot_pages, search_lots
+
+SUPPLIERS = ["北海道木材", "カナダ森林資源", "東南アジア木材", "古紙回収センター", "欧州パルプ"]
+
+def populate(engine, lots, prefix, seed, chunk=50000):
+    """1工場分のロットを投入（1DBとシャードに同じ内容を入れるため乱数を固定）"""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for offset in range(0, lots, chunk):
+        count = min(chunk, lots - offset)
+        raw, batches, products = [], [], []
+        for i in range(offset, offset + count):
+            ts = start + timedelta(minutes=i)
+            raw.append({"lot_id": f"RML-{prefix}{i:07d}", "arrival_ts": ts, "supplier_name": rng.choice(SUPPLIERS),
+                        "material_type": "木材チップ", "weight_kg": 20000.0})
+            batches.append({"batch_id": f"PB-{prefix}{i:07d}", "raw_material_lot_id": f"RML-{prefix}{i:07d}",
+                            "creation_ts": ts, "batch_type": "Pulp", "status": "completed"})
+            products.append({"product_lot_id": f"FPL-{prefix}{i:07d}", "batch_id": f"PB-{prefix}{i:07d}",
+                             "product_code": "NP-80", "completion_ts": ts,
+                             "destination": f"Customer-{rng.randint(1, 20):02d}", "quantity_kg": 15000.0})
+        with engine.begin() as conn:
+            conn.execute(insert(RawMaterialLot), raw)
+            conn.execute(insert(ProductionBatch), batches)
+            conn.execute(insert(FinishedProductLot), products)
+
+def measure(search, repeat):
+    best, page = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        page = search()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, page
+
+def main():
+    parser = argparse.ArgumentParser(description="シャーディングのベンチマーク")
+    parser.add_argument("--lots", type=int, default=200000, help="全工場合計のロット系列数")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conditions = build_conditions(supplier_name="カナダ森林資源", destination="Customer-07")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        single = ShardRouter({"all": f"sqlite:///{os.path.join(tmpdir, 'all.db')}"})
+        sharded = ShardRouter({
+            f"mill{n}": f"sqlite:///{os.path.join(tmpdir, f'mill{n}.db')}" for n in range(args.shards)
+        })
+        print(f"{args.lots}ロットを投入中（1DB と {args.shards}シャード）...")
+        per_shard = args.lots // args.shards
+        for n, name in enumerate(sharded.names):
+            populate(single.engine(), per_shard, f"{n}-", seed=n)
+            populate(sharded.engine(name), per_shard, f"{n}-", seed=n)
+
+        def search(session):
+            return search_lots(session, conditions, limit=args.limit)
+
+        def sequential():
+            pages = {}
+            for name in sharded.names:
+                session = sharded.session(name)
+                try:
+                    pages[name] = search(session)
+                finally:
+                    session.close()
+            return merge_lot_pages(pages, args.limit)
+
+        results = {
+            "single db": measure(lambda: single.scatter(search)["all"], args.repeat),
+            "shards (sequential)": measure(sequential, args.repeat),
+            "shards (scatter)": measure(lambda: merge_lot_pages(sharded.scatter(search), args.limit), args.repeat),
+        }
+        expected = results["single db"][1]
+        print(f"\n{'layout':22s} {'ms':>8s} {'total':>8s}")
+        for name, (seconds, page) in results.items():
+            assert page["total_count"] == expected["total_count"], f"{name}: 件数が一致しません"
+            assert [lot["batch"]["batch_id"] for lot in page["lots"]] == \
+                [lot["batch"]["batch_id"] for lot in expected["lots"]], f"{name}: 1ページ目が一致しません"
+            print(f"{name:22s} {seconds * 1000:8.1f} {page['total_count']:8d}")
+        single.dispose()
+        sharded.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+製紙工場ダッシュボードアプリ - ワーカー起動時間ベンチマーク
+モジュールのインポートからlifespan起動完了までを新しいプロセスで繰り返し計測する
+
+使い方:
+    python benchmarks/startup_benchmark.py --database-url sqlite:///database/paperplant.db --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+# 子プロセスで実行する計測スクリプト
+_CHILD_SCRIPT = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+imported = time.perf_counter()
+
+async def run_lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(run_lifespan())
+
+# 従来方式（毎回の create_all）とスキーマバージョン確認の比較（いずれも新規エンジン）
+from sqlalchemy import create_engine
+from models import Base, ensure_schema
+t0 = time.perf_counter()
+Base.metadata.create_all(create_engine(main.DATABASE_URL))
+t1 = time.perf_counter()
+ensure_schema(create_engine(main.DATABASE_URL))
+t2 = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "lifespan_ms": (ready - imported) * 1000,
+    "total_ms": (ready - started) * 1000,
+    "create_all_ms": (t1 - t0) * 1000,
+    "schema_check_ms": (t2 - t1) * 1000,
+}))
+"""
+
+def measure(database_url, prewarm):
+    env = dict(os.environ, PAPERPLANT_DATABASE_URL=database_url, PAPERPLANT_PREWARM="1" if prewarm else "0")
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD_SCRIPT, BACKEND_DIR],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(label, samples):
+    print(f"\n[{label}] {len(samples)}回")
+    for key in ("import_ms", "lifespan_ms", "total_ms", "create_all_ms", "schema_check_ms"):
+        values = [s[key] for s in samples]
+        print(f"  {key:16s} median={statistics.median(values):8.1f}  min={min(values):8.1f}  max={max(values):8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="ワーカー起動時間ベンチマーク")
+    parser.add_argument("--database-url", default="sqlite:///paperplant.db")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    # 初回はスキーマ作成が走るため計測対象外
+    measure(args.database_url, prewarm=False)
+
+    summarize("スキーマ確認のみ", [measure(args.database_url, prewarm=False) for _ in range(args.runs)])
+    summarize("プリウォームあり", [measure(args.database_url, prewarm=True) for _ in range(args.runs)])
+
+if __name__ == "__main__":
+    main()
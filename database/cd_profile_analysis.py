@@ -0,0 +1,374 @@
+"""
+製紙工場ダッシュボードアプリ - CDプロファイル解析
+抄紙工程の坪量・水分率のCDプロファイル（value_array）を設備・パラメータごとに MD×CD の行列として読み込み、
+NumPyの一括演算で筋状欠陥（ストリーク）・2σ幅の悪化・耳部のカール・基準形状からのドリフトを検出する
+
+検出は各スキャンの幅方向平均を引いた形状（偏差）に対して行う。
+ばらつきの基準 σ は隣接測定点の差から推定するため、ストリークや耳部の偏りがあっても膨らまない。
+検出結果は MachineStatusLog に status=alarm / alert_level=warning として記録する（停止扱いにはならない）。
+
+使い方:
+    python cd_profile_analysis.py                       # 直近8時間（1直）を解析して記録
+    python cd_profile_analysis.py --start 2024-12-01T00:00 --end 2024-12-02T00:00 --dry-run
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import String, func, insert, select, type_coerce, update
+
+from models import create_database, MachineStatusLog, ProcessRecord, QualityCheck
+
+PROFILE_PARAMETERS = ("basis_weight", "moisture_content")
+
+# MAD から正規分布の σ への換算係数
+MAD_TO_SIGMA = 1.4826
+
+class CDProfileAnalyzer:
+    """CDプロファイルの異常検出"""
+
+    def __init__(self, engine, sigma=2.0, min_scans=5, band_ratio=0.5, edge_fraction=0.05,
+                 baseline_scans=20, drift_ratio=1.5, merge_scans=20):
+        self.engine = engine
+        self.sigma = sigma                    # ストリーク・耳部の判定幅（σの倍数）
+        self.min_scans = min_scans            # 連続して検出されたスキャン数がこれ以上で異常とする
+        self.band_ratio = band_ratio          # CD 2σ が規格の片幅に対してこの比率を超えたら異常
+        self.edge_fraction = edge_fraction    # 耳部とみなす幅方向の割合（両端それぞれ）
+        self.baseline_scans = baseline_scans  # ドリフト判定の基準形状（直前スキャンの移動平均）の本数
+        self.drift_ratio = drift_ratio        # 基準形状との差のRMSが σ のこの倍数を超えたらドリフト
+        self.merge_scans = merge_scans        # 途切れがこのスキャン数未満なら同じ事象とみなす
+
+    def load_profiles(self, start, end, parameters=PROFILE_PARAMETERS):
+        """期間内のプロファイルを (設備, パラメータ, 測定点数) ごとの行列にまとめる"""
+        stmt = (
+            select(
+                ProcessRecord.machine_id,
+                QualityCheck.parameter_name,
+                QualityCheck.record_id,
+                QualityCheck.ts,
+                QualityCheck.upper_limit,
+                QualityCheck.lower_limit,
+                # 行ごとのJSONデコードを避け、文字列のまま受け取って一括で解析する
+                type_coerce(QualityCheck.value_array, String),
+            )
+            .join(ProcessRecord, ProcessRecord.record_id == QualityCheck.record_id)
+            .where(
+                QualityCheck.parameter_name.in_(parameters),
+                QualityCheck.ts >= start,
+                QualityCheck.ts < end,
+                func.json_type(QualityCheck.value_array) == "array",
+            )
+            .order_by(ProcessRecord.machine_id, QualityCheck.parameter_name, QualityCheck.ts)
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        if not rows:
+            return []
+
+        values = json.loads("[" + ",".join(row[6] for row in rows) + "]")
+        series = defaultdict(list)
+        for row, profile in zip(rows, values):
+            series[(row.machine_id, row.parameter_name, len(profile))].append((row, profile))
+
+        groups = []
+        for (machine_id, parameter, _), items in series.items():
+            groups.append({
+                "machine_id": machine_id,
+                "parameter": parameter,
+                "ts": [row.ts for row, _ in items],
+                "record_ids": [row.record_id for row, _ in items],
+                "tolerance": np.array([
+                    (row.upper_limit - row.lower_limit) / 2 if row.upper_limit is not None else np.nan
+                    for row, _ in items
+                ]),
+                "profiles": np.array([profile for _, profile in items], dtype=float),
+            })
+        return groups
+
+    def analyze(self, start, end, parameters=PROFILE_PARAMETERS):
+        """期間内の全プロファイルを解析して検出結果の一覧を返す"""
+        findings = []
+        for group in self.load_profiles(start, end, parameters):
+            findings.extend(self.detect(group))
+        findings.sort(key=lambda finding: finding["ts"])
+        return findings
+
+    def detect(self, group):
+        """1系列（MD×CD行列）の検出"""
+        profiles = group["profiles"]
+        scans, width = profiles.shape
+        if scans < self.min_scans or width < 3:
+            return []
+
+        deviation = profiles - profiles.mean(axis=1, keepdims=True)
+        sigma = MAD_TO_SIGMA * np.median(np.abs(np.diff(profiles, axis=1))) / np.sqrt(2)
+        if sigma <= 0:
+            return []
+
+        findings = []
+        findings += self._streaks(group, deviation, sigma)
+        findings += self._bands(group, deviation)
+        findings += self._edges(group, deviation, sigma)
+        findings += self._drift(group, deviation, sigma)
+        return findings
+
+    def _streaks(self, group, deviation, sigma):
+        """耳部を除く同じ幅方向位置で、min_scans 本の平均偏差が同じ向きに sigma 倍を超える"""
+        scans, width = deviation.shape
+        edge = self._edge_width(width)
+        center = deviation[:, edge:width - edge]
+        # 1本ごとでは雑音で途切れるため min_scans 本の移動平均で判定し、
+        # それが min_scans 窓続いた位置を、窓に含まれる本数分に広げる
+        rolling = _rolling_mean(center, self.min_scans)
+        findings = []
+        for sign in (1, -1):
+            hits = _qualified(sign * rolling > self.sigma * sigma, self.min_scans)
+            streak = _cover(hits, self.min_scans, scans)
+            for start_row, end_row in self._merge(_spans(streak.any(axis=1))):
+                rows = slice(start_row, end_row + 1)
+                for first, last in _spans(streak[rows].any(axis=0)):
+                    amplitude = float(center[rows, first:last + 1].mean()) / sigma
+                    findings.append(self._finding(
+                        group, "streak", f"CDストリーク（{_direction(amplitude)}）", start_row, end_row,
+                        f"{amplitude:+.1f}σ",
+                        positions=(int(first + edge) + 1, int(last + edge) + 1), amplitude_sigma=amplitude,
+                    ))
+        return findings
+
+    def _bands(self, group, deviation):
+        """CD 2σ（幅方向偏差の標準偏差の2倍）が規格の片幅に対して大きいスキャンが続く"""
+        two_sigma = 2 * deviation.std(axis=1)
+        findings = []
+        for start_row, end_row in self._episodes(two_sigma > self.band_ratio * group["tolerance"]):
+            worst = float(two_sigma[start_row:end_row + 1].max())
+            findings.append(self._finding(
+                group, "cd_2sigma", "CD 2σ悪化", start_row, end_row,
+                f"最大 {worst:.3g}（規格片幅 {group['tolerance'][end_row]:.3g}）",
+                two_sigma=worst,
+            ))
+        return findings
+
+    def _edges(self, group, deviation, sigma):
+        """両端の耳部の平均偏差が中央に対して同じ向きに大きい状態が続く"""
+        edge = self._edge_width(deviation.shape[1])
+        # 耳部 edge 点の平均は σ/√edge でばらつく
+        limit = self.sigma * sigma / np.sqrt(edge)
+        findings = []
+        for side, values in (("操作側", deviation[:, :edge]), ("駆動側", deviation[:, -edge:])):
+            offset = values.mean(axis=1)
+            for sign in (1, -1):
+                for start_row, end_row in self._episodes(sign * offset > limit):
+                    amplitude = float(offset[start_row:end_row + 1].mean()) / sigma
+                    findings.append(self._finding(
+                        group, "edge_curl", f"耳部カール（{side}・{_direction(amplitude)}）", start_row, end_row,
+                        f"{amplitude:+.1f}σ",
+                        side=side, amplitude_sigma=amplitude,
+                    ))
+        return findings
+
+    def _drift(self, group, deviation, sigma):
+        """直前 baseline_scans 本の平均形状からの差が大きいスキャンが続く"""
+        window = self.baseline_scans
+        if deviation.shape[0] <= window:
+            return []
+        baseline = _rolling_mean(deviation, window)[:-1]
+        rms = np.sqrt(((deviation[window:] - baseline) ** 2).mean(axis=1))
+        # 雑音のみなら基準との差は σ√(1 + 1/window) 程度
+        findings = []
+        for start_row, end_row in self._episodes(rms > self.drift_ratio * sigma * np.sqrt(1 + 1 / window)):
+            worst = float(rms[start_row:end_row + 1].max()) / sigma
+            findings.append(self._finding(
+                group, "drift", "CDプロファイルのドリフト", start_row + window, end_row + window,
+                f"基準形状との差 最大 {worst:.1f}σ",
+                rms_sigma=worst,
+            ))
+        return findings
+
+    def _edge_width(self, width):
+        return max(2, int(width * self.edge_fraction))
+
+    def _episodes(self, mask):
+        """min_scans 回以上連続した区間（merge_scans 未満の途切れを挟む区間は1つの事象にまとめる）"""
+        return self._merge(_spans(_qualified(mask, self.min_scans)))
+
+    def _merge(self, spans):
+        merged = []
+        for start_row, end_row in spans:
+            if merged and start_row - merged[-1][1] - 1 < self.merge_scans:
+                merged[-1][1] = end_row
+            else:
+                merged.append([start_row, end_row])
+        return [(int(start_row), int(end_row)) for start_row, end_row in merged]
+
+    def _finding(self, group, kind, label, start_row, end_row, detail, **details):
+        finding = {
+            "kind": kind,
+            "label": label,
+            "machine_id": group["machine_id"],
+            "parameter": group["parameter"],
+            "record_id": group["record_ids"][end_row],
+            "start_ts": group["ts"][start_row],
+            "ts": group["ts"][end_row],
+            "scans": end_row - start_row + 1,
+            "detail": detail,
+            **details,
+        }
+        finding["message"] = _message(finding, finding["start_ts"])
+        return finding
+
+    def record(self, findings):
+        """検出結果を設備ステータスログに記録し、追加・更新した件数を返す
+
+        同じ設備・パラメータ・検出内容（ストリークは位置が重なるもの）で期間が重なる記録済みのアラームは
+        同じ事象とみなし、新しい行は追加せずに終了時刻とメッセージを延ばす。
+        継続中の事象を含む期間を繰り返し解析しても、アラームは1件のまま更新される。
+        """
+        if not findings:
+            return 0
+        with self.engine.begin() as conn:
+            episodes = defaultdict(list)
+            for log_id, machine_id, ts, message in conn.execute(
+                select(MachineStatusLog.log_id, MachineStatusLog.machine_id, MachineStatusLog.ts, MachineStatusLog.message)
+                .where(
+                    MachineStatusLog.machine_id.in_({finding["machine_id"] for finding in findings}),
+                    MachineStatusLog.status == "alarm",
+                    MachineStatusLog.message.startswith("[CD] ", autoescape=True),
+                    MachineStatusLog.ts >= min(finding["start_ts"] for finding in findings),
+                )
+            ):
+                episode = _parse_message(message)
+                if episode:
+                    episodes[machine_id].append({"log_id": log_id, "ts": ts, **episode})
+
+            rows, updated = [], 0
+            for finding in findings:
+                episode = next((episode for episode in episodes[finding["machine_id"]]
+                                if _same_episode(episode, finding)), None)
+                if episode is None:
+                    rows.append({
+                        "machine_id": finding["machine_id"],
+                        "record_id": finding["record_id"],
+                        "ts": finding["ts"],
+                        "status": "alarm",
+                        "alert_level": "warning",
+                        "message": finding["message"],
+                        "resolved": False,
+                    })
+                elif finding["ts"] > episode["ts"]:
+                    # 継続中の事象: 開始は記録済みの方を残し、終了時刻・位置・値を新しい検出に合わせる
+                    start_ts = min(episode["start_ts"], finding["start_ts"])
+                    conn.execute(
+                        update(MachineStatusLog)
+                        .where(MachineStatusLog.log_id == episode["log_id"])
+                        .values(record_id=finding["record_id"], ts=finding["ts"], message=_message(finding, start_ts))
+                    )
+                    updated += 1
+            if rows:
+                conn.execute(insert(MachineStatusLog), rows)
+        return len(rows) + updated
+
+def _direction(amplitude):
+    return "高" if amplitude > 0 else "低"
+
+def _message(finding, start_ts):
+    """アラームのメッセージ（記録済みの事象との照合のため、識別部分は _MESSAGE で読み戻せる形にする）"""
+    positions = " 位置 {}-{}".format(*finding["positions"]) if "positions" in finding else ""
+    return (f"[CD] {finding['parameter']} {finding['label']}{positions}: "
+            f"{finding['detail']}（{start_ts:%Y-%m-%d %H:%M}〜）")
+
+_MESSAGE = re.compile(
+    r"^\[CD\] (?P<parameter>\S+) (?P<label>.+?)(?: 位置 (?P<first>\d+)-(?P<last>\d+))?: "
+    r".*（(?P<start>\d{4}-\d{2}-\d{2} \d{2}:\d{2})〜）$"
+)
+
+def _parse_message(message):
+    """記録済みメッセージから事象の識別部分と開始時刻（分単位）を読み戻す（形式が異なるものは None）"""
+    match = _MESSAGE.match(message or "")
+    if not match:
+        return None
+    return {
+        "parameter": match["parameter"],
+        "label": match["label"],
+        "positions": (int(match["first"]), int(match["last"])) if match["first"] else None,
+        "start_ts": datetime.strptime(match["start"], "%Y-%m-%d %H:%M"),
+    }
+
+def _same_episode(episode, finding):
+    """同じ検出内容で期間（ストリークは位置も）が重なるか"""
+    if (episode["parameter"], episode["label"]) != (finding["parameter"], finding["label"]):
+        return False
+    if episode["start_ts"] > finding["ts"] or episode["ts"] < finding["start_ts"]:
+        return False
+    positions = finding.get("positions")
+    if episode["positions"] is None or positions is None:
+        return episode["positions"] == positions
+    return episode["positions"][0] <= positions[1] and positions[0] <= episode["positions"][1]
+
+def _run_lengths(mask):
+    """各行で終わる連続 True の長さ（行方向、列ごと）"""
+    index = np.arange(mask.shape[0]).reshape((-1,) + (1,) * (mask.ndim - 1))
+    last_false = np.maximum.accumulate(np.where(mask, -1, index), axis=0)
+    return np.where(mask, index - last_false, 0)
+
+def _rolling_mean(values, window):
+    """行方向の移動平均（i 行目は i〜i+window-1 行の平均）"""
+    cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+def _cover(hits, window, rows):
+    """移動窓ごとの判定を、その窓に含まれる行に広げる"""
+    padding = np.zeros((rows + 1 - hits.shape[0],) + hits.shape[1:])
+    counts = np.concatenate([np.zeros((1,) + hits.shape[1:]), np.cumsum(np.concatenate([hits, padding]), axis=0)])
+    index = np.arange(rows)
+    return counts[index + 1] - counts[np.maximum(index - window + 1, 0)] > 0
+
+def _qualified(mask, min_length):
+    """min_length 回以上連続した True だけを残す（行方向）"""
+    forward = _run_lengths(mask)
+    backward = _run_lengths(mask[::-1])[::-1]
+    return mask & (forward + backward - 1 >= min_length)
+
+def _spans(mask):
+    """1次元の真偽値列で True が続く区間 (先頭, 末尾) の一覧"""
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2], edges[1::2] - 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="CDプロファイル解析")
+    parser.add_argument("--database-url", default=os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db"))
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="解析開始（省略時は終了の --hours 前）")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="解析終了（省略時は現在）")
+    parser.add_argument("--hours", type=float, default=8.0, help="--start 省略時の解析時間幅")
+    parser.add_argument("--dry-run", action="store_true", help="検出結果を表示するのみで記録しない")
+    args = parser.parse_args()
+
+    end = args.end or datetime.now()
+    start = args.start or end - timedelta(hours=args.hours)
+    analyzer = CDProfileAnalyzer(create_database(args.database_url))
+
+    started = time.perf_counter()
+    groups = analyzer.load_profiles(start, end)
+    loaded = time.perf_counter()
+    findings = [finding for group in groups for finding in analyzer.detect(group)]
+    findings.sort(key=lambda finding: finding["ts"])
+    analyzed = time.perf_counter()
+
+    for finding in findings:
+        print(f"{finding['ts']:%Y-%m-%d %H:%M:%S} {finding['machine_id']} {finding['message']}")
+    profiles = sum(len(group["ts"]) for group in groups)
+    print(
+        f"プロファイル {profiles}本（{len(groups)}系列）: 読み込み {(loaded - started) * 1000:.0f}ms, "
+        f"解析 {(analyzed - loaded) * 1000:.0f}ms, 検出 {len(findings)}件"
+    )
+    if not args.dry_run:
+        print(f"設備ステータスログに記録（追加・更新）: {analyzer.record(findings)}件")
+
+if __name__ == "__main__":
+    main()
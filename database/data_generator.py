@@ -7,6 +7,7 @@ import random
 import numpy as np
 from datetime import datetime, timedelta
 from sqlalchemy.orm import sessionmaker
+from kpi_engine import KPIEngine
 from models import (
     create_database, RawMaterialLot, ProductionBatch, ProcessRecord, 
     QualityCheck, FinishedProductLot, MachineStatusLog, KPIMetrics
@@ -43,6 +44,31 @@ class PaperMillDataGenerator:
             {"code": "CW-60", "name": "コート紙 白 60g/m²", "target_basis_weight": 60}
         ]
         
+        # 工程別品質パラメータマスタ
+        self.quality_params = {
+            "P1": [
+                {"name": "kappa_number", "target": 15.0, "tolerance": 2.0, "unit": ""},
+                {"name": "brightness", "target": 85.0, "tolerance": 3.0, "unit": "%"}
+            ],
+            "P2": [
+                {"name": "freeness_csf", "target": 450.0, "tolerance": 50.0, "unit": "ml"},
+                {"name": "consistency", "target": 3.5, "tolerance": 0.3, "unit": "%"}
+            ],
+            "P3": [
+                {"name": "basis_weight", "target": 80.0, "tolerance": 2.0, "unit": "g/m²"},
+                {"name": "moisture_content", "target": 5.0, "tolerance": 0.5, "unit": "%"},
+                {"name": "caliper", "target": 0.12, "tolerance": 0.01, "unit": "mm"}
+            ],
+            "P4": [
+                {"name": "smoothness", "target": 150.0, "tolerance": 20.0, "unit": "ml/min"},
+                {"name": "tensile_strength", "target": 120.0, "tolerance": 15.0, "unit": "N*m/g"}
+            ]
+        }
+        
+        # 工程別の標準処理時間（時間）と歩留まり
+        self.process_durations = {"P1": 8, "P2": 4, "P3": 12, "P4": 6}
+        self.yield_rates = {"P1": 0.95, "P2": 0.98, "P3": 0.94, "P4": 0.99}
+        
         # オペレーターマスタ
         self.operators = [f"OP{i:03d}" for i in range(1, 21)]
         
@@ -117,16 +143,14 @@ class PaperMillDataGenerator:
                 machine_id = random.choice(self.machines[process_code])
                 
                 # 工程時間の設定
-                process_durations = {"P1": 8, "P2": 4, "P3": 12, "P4": 6}
-                base_duration = process_durations[process_code]
+                base_duration = self.process_durations[process_code]
                 actual_duration = random.gauss(base_duration, base_duration * 0.2)
                 
                 start_time = current_time + timedelta(hours=random.uniform(0.5, 2))
                 end_time = start_time + timedelta(hours=max(1, actual_duration))
                 
                 # 歩留まり計算
-                yield_rates = {"P1": 0.95, "P2": 0.98, "P3": 0.94, "P4": 0.99}
-                output_quantity = current_quantity * yield_rates[process_code]
+                output_quantity = current_quantity * self.yield_rates[process_code]
                 current_quantity = output_quantity
                 
                 record = ProcessRecord(
@@ -181,34 +205,13 @@ class PaperMillDataGenerator:
         quality_checks = []
         duration = (end_time - start_time).total_seconds() / 3600  # 時間
         
-        # 工程別パラメータ定義
-        quality_params = {
-            "P1": [
-                {"name": "kappa_number", "target": 15.0, "tolerance": 2.0, "unit": ""},
-                {"name": "brightness", "target": 85.0, "tolerance": 3.0, "unit": "%"}
-            ],
-            "P2": [
-                {"name": "freeness_csf", "target": 450.0, "tolerance": 50.0, "unit": "ml"},
-                {"name": "consistency", "target": 3.5, "tolerance": 0.3, "unit": "%"}
-            ],
-            "P3": [
-                {"name": "basis_weight", "target": 80.0, "tolerance": 2.0, "unit": "g/m²"},
-                {"name": "moisture_content", "target": 5.0, "tolerance": 0.5, "unit": "%"},
-                {"name": "caliper", "target": 0.12, "tolerance": 0.01, "unit": "mm"}
-            ],
-            "P4": [
-                {"name": "smoothness", "target": 150.0, "tolerance": 20.0, "unit": "ml/min"},
-                {"name": "tensile_strength", "target": 120.0, "tolerance": 15.0, "unit": "N*m/g"}
-            ]
-        }
-        
-        if process_code not in quality_params:
+        if process_code not in self.quality_params:
             return quality_checks
         
         # データポイント数（工程の長さに応じて）
         num_points = max(5, int(duration * 2))
         
-        for param in quality_params[process_code]:
+        for param in self.quality_params[process_code]:
             for i in range(num_points):
                 timestamp = start_time + timedelta(hours=duration * i / num_points)
                 
@@ -313,6 +316,10 @@ class PaperMillDataGenerator:
         
         self.session.commit()
         
+        # OEE・FPY・歩留まり・生産速度は生成した実績から算出した値で置き換える
+        print("KPI算出中...")
+        kpi_counts = KPIEngine(self.engine).run(full=True)
+        
         print(f"データ生成完了:")
         print(f"- 原料ロット: {len(raw_lots)}件")
         print(f"- 生産バッチ: {len(batches)}件")
@@ -320,7 +327,7 @@ class PaperMillDataGenerator:
         print(f"- 品質データ: {len(quality_data)}件")
         print(f"- 設備ログ: {len(machine_logs)}件")
         print(f"- 製品ロット: {len(products)}件")
-        print(f"- KPI指標: {len(kpi_data)}件")
+        print(f"- KPI指標: {len(kpi_data)}件（うち実績からの算出: 時間 {kpi_counts['hourly']}件・日 {kpi_counts['daily']}件・月 {kpi_counts['monthly']}件）")
 
 if __name__ == "__main__":
     generator = PaperMillDataGenerator()
@@ -0,0 +1,101 @@
+"""
+製紙工場ダッシュボードアプリ - 生産イベントログ
+原料入荷・工程開始/完了・品質逸脱・アラート・製品完成・出荷を production_events に追記するトリガー定義
+
+イベントは元テーブルへの登録（および終了・出荷日時の確定更新）時にトリガーで追記され、
+更新・削除はしない。原料入荷はバッチ編成時に、そのバッチのイベントとして記録する。
+"""
+
+from sqlalchemy import text
+
+EVENT_TABLE = "production_events"
+
+# 各イベントは SELECT句・結合・条件で定義し、{row} をトリガーでは new、
+# 既存データの取り込みでは元テーブル名に置き換えて使う
+_PROCESS_END = {
+    "select": """{row}.end_ts, 'process_end', {row}.batch_id, {row}.machine_id, {row}.record_id,
+        json_object('record_id', {row}.record_id, 'process_code', {row}.process_code,
+                    'start_ts', {row}.start_ts, 'output_kg', {row}.output_kg)""",
+    "where": "{row}.end_ts IS NOT NULL",
+}
+
+_SHIPMENT = {
+    "select": """{row}.shipment_ts, 'shipment', {row}.batch_id, NULL, {row}.product_lot_id,
+        json_object('product_lot_id', {row}.product_lot_id, 'destination', {row}.destination,
+                    'quantity_kg', {row}.quantity_kg)""",
+    "where": "{row}.shipment_ts IS NOT NULL",
+}
+
+# (トリガー名, 元テーブル, タイミング, 定義)。更新トリガーは既存データの取り込みを行わない
+_EVENTS = [
+    ("production_events_raw_material_arrival", "production_batches", "AFTER INSERT", {
+        "select": """r.arrival_ts, 'raw_material_arrival', {row}.batch_id, NULL, r.lot_id,
+            json_object('lot_id', r.lot_id, 'supplier', r.supplier_name, 'material_type', r.material_type,
+                        'weight', r.weight_kg, 'fsc_cert', r.fsc_cert_id)""",
+        "join": "JOIN raw_material_lots r ON r.lot_id = {row}.raw_material_lot_id",
+    }),
+    ("production_events_process_start", "process_records", "AFTER INSERT", {
+        "select": """{row}.start_ts, 'process_start', {row}.batch_id, {row}.machine_id, {row}.record_id,
+            json_object('record_id', {row}.record_id, 'process_code', {row}.process_code,
+                        'machine_id', {row}.machine_id, 'operator_id', {row}.operator_id)""",
+        "where": "{row}.start_ts IS NOT NULL",
+    }),
+    ("production_events_process_end", "process_records", "AFTER INSERT", _PROCESS_END),
+    ("production_events_process_end_update", "process_records",
+     "AFTER UPDATE OF end_ts WHEN old.end_ts IS NULL AND new.end_ts IS NOT NULL", _PROCESS_END),
+    ("production_events_quality_excursion", "quality_checks", "AFTER INSERT", {
+        "select": """{row}.ts, 'quality_excursion', p.batch_id, p.machine_id, {row}.check_id,
+            json_object('check_id', {row}.check_id, 'record_id', {row}.record_id,
+                        'parameter', {row}.parameter_name, 'value', {row}.value,
+                        'upper_limit', {row}.upper_limit, 'lower_limit', {row}.lower_limit)""",
+        "join": "LEFT JOIN process_records p ON p.record_id = {row}.record_id",
+        "where": "{row}.is_ok = 0",
+    }),
+    ("production_events_alert", "machine_status_logs", "AFTER INSERT", {
+        "select": """{row}.ts, 'alert', p.batch_id, {row}.machine_id, {row}.log_id,
+            json_object('log_id', {row}.log_id, 'status', {row}.status,
+                        'alert_level', {row}.alert_level, 'message', {row}.message)""",
+        "join": "LEFT JOIN process_records p ON p.record_id = {row}.record_id",
+        "where": "{row}.alert_level IN ('warning', 'critical')",
+    }),
+    ("production_events_product_completion", "finished_product_lots", "AFTER INSERT", {
+        "select": """{row}.completion_ts, 'product_completion', {row}.batch_id, NULL, {row}.product_lot_id,
+            json_object('product_lot_id', {row}.product_lot_id, 'product_code', {row}.product_code,
+                        'quantity_kg', {row}.quantity_kg, 'roll_count', {row}.roll_count)""",
+        "where": "{row}.completion_ts IS NOT NULL",
+    }),
+    ("production_events_shipment", "finished_product_lots", "AFTER INSERT", _SHIPMENT),
+    ("production_events_shipment_update", "finished_product_lots",
+     "AFTER UPDATE OF shipment_ts WHEN old.shipment_ts IS NULL AND new.shipment_ts IS NOT NULL", _SHIPMENT),
+]
+
+_INSERT = f"INSERT INTO {EVENT_TABLE}(ts, event_type, batch_id, machine_id, source_id, payload)"
+
+def _event_sql(definition, row, source):
+    return (
+        f"{_INSERT} SELECT {definition['select']} FROM {source} {definition.get('join', '')} "
+        f"WHERE {definition.get('where', '1')}"
+    ).format(row=row)
+
+def create_event_log_triggers(conn):
+    """イベント追記トリガーを作成し、既存データからイベントを取り込む
+
+    作成済みのトリガーは取り込みを行わず、定義が変わっていればトリガーだけを作り直す。
+    """
+    existing = dict(conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'production_events_%'"
+    )).all())
+    for name, table, timing, definition in _EVENTS:
+        timing, _, when = timing.partition(" WHEN ")
+        trigger_sql = (
+            f"CREATE TRIGGER {name} {timing} ON {table} {'WHEN ' + when if when else ''} BEGIN "
+            f"{_event_sql(definition, 'new', '(SELECT 1)')}; END"
+        )
+        if name in existing:
+            if existing[name] != trigger_sql:
+                conn.execute(text(f"DROP TRIGGER {name}"))
+                conn.execute(text(trigger_sql))
+            continue
+        if not timing.startswith("AFTER UPDATE"):
+            conn.execute(text(_event_sql(definition, table, table)))
+        conn.execute(text(trigger_sql))
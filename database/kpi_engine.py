@@ -0,0 +1,478 @@
+"""
+製紙工場ダッシュボードアプリ - KPI算出エンジン
+工程実績・設備ログ・品質データ・製品ロットから OEE / FPY / 歩留まり / 生産速度 を算出し KPIMetrics に書き込む
+
+設備・1時間ごとの加算可能な中間値（kpi_components）を作り、日次・月次はその合算から算出する。
+元テーブルごとの処理済みIDを kpi_watermarks に記録し、新しいデータが触れた時間・日・月だけを再計算する。
+工程実績は終了（end_ts の確定）時に集計へ反映する。
+
+使い方:
+    python kpi_engine.py                # 前回以降の差分を反映
+    python kpi_engine.py --full         # 全期間を再計算（乱数で生成されたKPIも置き換える）
+    python kpi_engine.py --interval 60  # 60秒ごとに差分を反映し続ける
+"""
+
+import argparse
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, case, cast, delete, func, insert, select
+from sqlalchemy.orm import aliased
+
+from models import (
+    create_database, FinishedProductLot, KPIComponent, KPIMetrics, KPIWatermark, MachineStatusLog,
+    ProcessRecord, ProductionBatch, ProductionEvent, QualityCheck, RawMaterialLot
+)
+
+# 算出するKPI（工場全体の目標値）
+KPI_DEFINITIONS = {
+    "OEE": {"unit": "%", "target": 85.0},
+    "FPY": {"unit": "%", "target": 95.0},
+    "yield_rate": {"unit": "%", "target": 98.0},
+    "production_rate": {"unit": "t/h", "target": 50.0},
+}
+
+PERIOD_TYPES = ("hourly", "daily", "monthly")
+
+# 工程別の設計能力（kg/h）。性能稼働率 = 出力量 / (実稼働時間 × 設計能力)
+IDEAL_RATES_KG_H = {"P1": 3500.0, "P2": 7000.0, "P3": 2300.0, "P4": 4500.0}
+
+# 停止とみなす設備ログ。復旧（status=running）のログで終了し、復旧ログがなければ既定時間で打ち切る
+DOWNTIME_STATUSES = ("stopped", "maintenance")
+DEFAULT_DOWNTIME = timedelta(minutes=30)
+MAX_DOWNTIME = timedelta(hours=8)
+
+# 処理済み位置を記録する元テーブル
+WATERMARK_SOURCES = {
+    "production_events": ProductionEvent.event_id,
+    "quality_checks": QualityCheck.check_id,
+    "machine_status_logs": MachineStatusLog.log_id,
+}
+
+COMPONENT_FIELDS = (
+    "loaded_hours", "downtime_hours", "output_kg", "ideal_output_kg", "input_kg", "yield_output_kg",
+    "checks", "checks_ok", "passes", "first_passes", "active_hours",
+)
+
+HOUR = timedelta(hours=1)
+_HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+
+def period_start(ts, period_type):
+    """ts を含む期間の開始時刻"""
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if period_type == "daily":
+        return ts.replace(hour=0)
+    if period_type == "monthly":
+        return ts.replace(day=1, hour=0)
+    return ts
+
+def next_period(start, period_type):
+    if period_type == "daily":
+        return start + timedelta(days=1)
+    if period_type == "monthly":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + HOUR
+
+def _hours_between(start, end):
+    hour = period_start(start, "hourly")
+    while hour < end:
+        yield hour
+        hour += HOUR
+
+def _overlap_hours(start, end, other_start, other_end):
+    return max(0.0, (min(end, other_end) - max(start, other_start)).total_seconds() / 3600)
+
+def _runs(periods, period_type):
+    """連続する期間をまとめて (開始, 終了) の範囲にする"""
+    runs = []
+    for start in sorted(periods):
+        end = next_period(start, period_type)
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+    return runs
+
+def _chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class KPIEngine:
+    """KPIの差分計算（1回の run が1トランザクション）"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def run(self, full=False):
+        """未処理のデータが触れた期間のKPIを再計算する
+
+        周期ごとの再計算した期間数 {"hourly": n, "daily": n, "monthly": n} を返す。
+        """
+        with self.engine.begin() as conn:
+            latest = {
+                source: conn.execute(select(func.max(column))).scalar() or 0
+                for source, column in WATERMARK_SOURCES.items()
+            }
+            watermarks = dict(conn.execute(select(KPIWatermark.source, KPIWatermark.last_id)).all())
+
+            if full or not watermarks:
+                hours = self._all_hours(conn)
+                conn.execute(delete(KPIComponent))
+                conn.execute(delete(KPIMetrics).where(KPIMetrics.metric_name.in_(KPI_DEFINITIONS)))
+            else:
+                hours = self._touched_hours(
+                    conn, {source: watermarks.get(source, 0) for source in WATERMARK_SOURCES}, latest
+                )
+
+            counts = {"hourly": 0, "daily": 0, "monthly": 0}
+            if hours:
+                self._write_components(conn, hours)
+                counts = self._write_metrics(conn, hours)
+
+            conn.execute(delete(KPIWatermark))
+            conn.execute(insert(KPIWatermark), [
+                {"source": source, "last_id": last_id} for source, last_id in latest.items()
+            ])
+        return counts
+
+    # === 再計算する時間の特定 ===
+
+    def _all_hours(self, conn):
+        start, end = conn.execute(
+            select(func.min(ProcessRecord.start_ts), func.max(ProcessRecord.end_ts))
+            .where(ProcessRecord.end_ts.is_not(None))
+        ).one()
+        first_lot, last_lot = conn.execute(
+            select(func.min(FinishedProductLot.completion_ts), func.max(FinishedProductLot.completion_ts))
+        ).one()
+        # 品質データは工程の終了を待たずに時間ごとに集計する（差分計算と範囲を揃える）
+        first_check, last_check = conn.execute(select(func.min(QualityCheck.ts), func.max(QualityCheck.ts))).one()
+        starts = [ts for ts in (start, first_lot, first_check) if ts]
+        ends = [ts for ts in (end, last_lot, last_check) if ts]
+        if not starts:
+            return set()
+        return set(_hours_between(min(starts), max(ends) + HOUR))
+
+    def _touched_hours(self, conn, watermarks, latest):
+        hours = set()
+
+        def new_ids(source):
+            column = WATERMARK_SOURCES[source]
+            return column > watermarks[source], column <= latest[source]
+
+        # 終了した工程（工程時間の全体）と完成した製品ロット
+        ended_records = select(cast(ProductionEvent.source_id, Integer)).where(
+            *new_ids("production_events"), ProductionEvent.event_type == "process_end"
+        )
+        for start_ts, end_ts in conn.execute(
+            select(ProcessRecord.start_ts, ProcessRecord.end_ts).where(ProcessRecord.record_id.in_(ended_records))
+        ):
+            hours.update(_hours_between(start_ts or end_ts, end_ts + timedelta(microseconds=1)))
+        hours.update(period_start(ts, "hourly") for (ts,) in conn.execute(
+            select(ProductionEvent.ts).where(
+                *new_ids("production_events"), ProductionEvent.event_type == "product_completion"
+            )
+        ))
+
+        # 品質データの時間、不合格が追加された工程の終了時刻とそのバッチの製品ロット完成時刻
+        hours.update(datetime.strptime(hour, _HOUR_FORMAT) for (hour,) in conn.execute(
+            select(func.strftime(_HOUR_FORMAT, QualityCheck.ts)).where(*new_ids("quality_checks")).distinct()
+        ) if hour)
+        failed_records = select(QualityCheck.record_id).where(
+            *new_ids("quality_checks"), QualityCheck.is_ok == False
+        )
+        hours.update(period_start(ts, "hourly") for (ts,) in conn.execute(
+            select(ProcessRecord.end_ts).where(
+                ProcessRecord.record_id.in_(failed_records), ProcessRecord.end_ts.is_not(None)
+            ).distinct()
+        ))
+        hours.update(period_start(ts, "hourly") for (ts,) in conn.execute(
+            select(FinishedProductLot.completion_ts).where(
+                FinishedProductLot.batch_id.in_(
+                    select(ProcessRecord.batch_id).where(ProcessRecord.record_id.in_(failed_records))
+                ),
+                FinishedProductLot.completion_ts.is_not(None)
+            ).distinct()
+        ))
+
+        # 停止の開始は既定の停止時間分、復旧は遡って停止が始まり得る範囲を再計算
+        for ts, status, alert_level in conn.execute(
+            select(MachineStatusLog.ts, MachineStatusLog.status, MachineStatusLog.alert_level)
+            .where(*new_ids("machine_status_logs"))
+        ):
+            if status == "running":
+                hours.update(_hours_between(ts - MAX_DOWNTIME, ts + timedelta(microseconds=1)))
+            elif _is_down(status, alert_level):
+                hours.update(_hours_between(ts, ts + DEFAULT_DOWNTIME))
+        return hours
+
+    # === 時間ごとの中間値 ===
+
+    def _write_components(self, conn, hours):
+        for chunk in _chunks(sorted(hours)):
+            conn.execute(delete(KPIComponent).where(KPIComponent.period_start.in_(chunk)))
+        rows = []
+        for start, end in _runs(hours, "hourly"):
+            rows += self._span_components(conn, start, end, hours)
+        if rows:
+            conn.execute(insert(KPIComponent), rows)
+
+    def _span_components(self, conn, start, end, hours):
+        components = defaultdict(lambda: dict.fromkeys(COMPONENT_FIELDS, 0))
+        downtime = self._downtime_intervals(conn, start, end)
+
+        # 工程の投入量は同じバッチの直前工程の出力量（最初の工程はバッチの初期量）
+        previous = aliased(ProcessRecord)
+        input_kg = func.coalesce(
+            select(previous.output_kg)
+            .where(previous.batch_id == ProcessRecord.batch_id, previous.start_ts < ProcessRecord.start_ts)
+            .order_by(previous.start_ts.desc())
+            .limit(1)
+            .scalar_subquery(),
+            ProductionBatch.initial_quantity_kg
+        )
+        records = conn.execute(
+            select(
+                ProcessRecord.record_id, ProcessRecord.machine_id, ProcessRecord.process_code,
+                ProcessRecord.start_ts, ProcessRecord.end_ts, ProcessRecord.output_kg, input_kg.label("input_kg")
+            )
+            .outerjoin(ProductionBatch, ProductionBatch.batch_id == ProcessRecord.batch_id)
+            .where(ProcessRecord.end_ts > start, ProcessRecord.start_ts < end, ProcessRecord.end_ts.is_not(None))
+        ).all()
+
+        ended_ids = [row.record_id for row in records if start <= row.end_ts < end]
+        failed = {}
+        for chunk in _chunks(ended_ids):
+            failed.update(conn.execute(
+                select(QualityCheck.record_id, func.count())
+                .where(QualityCheck.record_id.in_(chunk), QualityCheck.is_ok == False)
+                .group_by(QualityCheck.record_id)
+            ).all())
+
+        for row in records:
+            duration = (row.end_ts - row.start_ts).total_seconds() / 3600
+            rate = IDEAL_RATES_KG_H.get(row.process_code, 0.0)
+            for hour in _hours_between(max(row.start_ts, start), min(row.end_ts, end)):
+                if hour not in hours:
+                    continue
+                loaded_from, loaded_to = max(row.start_ts, hour), min(row.end_ts, hour + HOUR)
+                loaded = _overlap_hours(loaded_from, loaded_to, hour, hour + HOUR)
+                down = sum(
+                    _overlap_hours(loaded_from, loaded_to, down_from, down_to)
+                    for down_from, down_to in downtime.get(row.machine_id, ())
+                )
+                c = components[(hour, row.machine_id)]
+                c["loaded_hours"] += loaded
+                c["downtime_hours"] += down
+                c["output_kg"] += (row.output_kg or 0.0) * loaded / duration if duration else 0.0
+                c["ideal_output_kg"] += (loaded - down) * rate
+
+            end_hour = period_start(row.end_ts, "hourly")
+            if end_hour in hours:
+                c = components[(end_hour, row.machine_id)]
+                c["passes"] += 1
+                c["first_passes"] += 0 if failed.get(row.record_id) else 1
+                if row.input_kg and row.output_kg is not None:
+                    c["input_kg"] += row.input_kg
+                    c["yield_output_kg"] += row.output_kg
+
+        hour_column = func.strftime(_HOUR_FORMAT, QualityCheck.ts)
+        for machine_id, hour, count, ok in conn.execute(
+            select(
+                ProcessRecord.machine_id, hour_column, func.count(),
+                func.sum(case((QualityCheck.is_ok == True, 1), else_=0))
+            )
+            .join(ProcessRecord, ProcessRecord.record_id == QualityCheck.record_id)
+            .where(QualityCheck.ts >= start, QualityCheck.ts < end)
+            .group_by(ProcessRecord.machine_id, hour_column)
+        ):
+            hour = datetime.strptime(hour, _HOUR_FORMAT)
+            if hour in hours:
+                components[(hour, machine_id)]["checks"] += count
+                components[(hour, machine_id)]["checks_ok"] += ok or 0
+
+        self._add_lot_components(conn, start, end, hours, components)
+
+        # 工場全体の生産速度の分母は、いずれかの設備が稼働していた時間数
+        for hour in {hour for (hour, machine_id), c in list(components.items()) if c["loaded_hours"] > 0}:
+            components[(hour, None)]["active_hours"] = 1.0
+
+        return [
+            {"period_start": hour, "machine_id": machine_id, **values}
+            for (hour, machine_id), values in components.items()
+        ]
+
+    def _add_lot_components(self, conn, start, end, hours, components):
+        """製品ロットの完成（工場全体のFPY・歩留まり・生産量）"""
+        other_lot = aliased(FinishedProductLot)
+        failed_checks = (
+            select(func.count())
+            .select_from(QualityCheck)
+            .join(ProcessRecord, ProcessRecord.record_id == QualityCheck.record_id)
+            .where(ProcessRecord.batch_id == FinishedProductLot.batch_id, QualityCheck.is_ok == False)
+            .scalar_subquery()
+        )
+        lots_in_batch = (
+            select(func.count()).select_from(other_lot)
+            .where(other_lot.batch_id == FinishedProductLot.batch_id)
+            .scalar_subquery()
+        )
+        for lot in conn.execute(
+            select(
+                FinishedProductLot.completion_ts, FinishedProductLot.final_quality_ok,
+                FinishedProductLot.quantity_kg, RawMaterialLot.weight_kg,
+                failed_checks.label("failed_checks"), lots_in_batch.label("lots_in_batch")
+            )
+            .outerjoin(ProductionBatch, ProductionBatch.batch_id == FinishedProductLot.batch_id)
+            .outerjoin(RawMaterialLot, RawMaterialLot.lot_id == ProductionBatch.raw_material_lot_id)
+            .where(FinishedProductLot.completion_ts >= start, FinishedProductLot.completion_ts < end)
+        ):
+            hour = period_start(lot.completion_ts, "hourly")
+            if hour not in hours:
+                continue
+            c = components[(hour, None)]
+            c["passes"] += 1
+            c["first_passes"] += 1 if lot.final_quality_ok and not lot.failed_checks else 0
+            c["output_kg"] += lot.quantity_kg or 0.0
+            if lot.weight_kg and lot.quantity_kg is not None:
+                # 1バッチから複数の製品ロットができる場合は原料重量を按分
+                c["input_kg"] += lot.weight_kg / max(lot.lots_in_batch, 1)
+                c["yield_output_kg"] += lot.quantity_kg
+
+    def _downtime_intervals(self, conn, start, end):
+        """設備ごとの停止区間（重なりは結合済み）"""
+        open_since = defaultdict(list)
+        intervals = defaultdict(list)
+        for machine_id, ts, status, alert_level in conn.execute(
+            select(MachineStatusLog.machine_id, MachineStatusLog.ts, MachineStatusLog.status, MachineStatusLog.alert_level)
+            .where(MachineStatusLog.ts >= start - MAX_DOWNTIME, MachineStatusLog.ts < end + MAX_DOWNTIME)
+            .order_by(MachineStatusLog.machine_id, MachineStatusLog.ts)
+        ):
+            if status == "running":
+                for down_from in open_since.pop(machine_id, []):
+                    down_to = ts if ts - down_from <= MAX_DOWNTIME else down_from + DEFAULT_DOWNTIME
+                    intervals[machine_id].append((down_from, down_to))
+            elif _is_down(status, alert_level):
+                open_since[machine_id].append(ts)
+        for machine_id, starts in open_since.items():
+            intervals[machine_id] += [(down_from, down_from + DEFAULT_DOWNTIME) for down_from in starts]
+
+        merged = {}
+        for machine_id, spans in intervals.items():
+            result = []
+            for down_from, down_to in sorted(spans):
+                if result and down_from <= result[-1][1]:
+                    result[-1] = (result[-1][0], max(result[-1][1], down_to))
+                else:
+                    result.append((down_from, down_to))
+            merged[machine_id] = result
+        return merged
+
+    # === 期間ごとのKPI ===
+
+    def _write_metrics(self, conn, hours):
+        counts = {}
+        for period_type in PERIOD_TYPES:
+            periods = {period_start(hour, period_type) for hour in hours}
+            totals = defaultdict(lambda: dict.fromkeys(COMPONENT_FIELDS, 0))
+            for start, end in _runs(periods, period_type):
+                for row in conn.execute(
+                    select(KPIComponent).where(KPIComponent.period_start >= start, KPIComponent.period_start < end)
+                ).mappings():
+                    key = period_start(row["period_start"], period_type)
+                    if key not in periods:
+                        continue
+                    keys = [(key, row["machine_id"])]
+                    if row["machine_id"] is not None:
+                        keys.append((key, "__machines__"))
+                    for total_key in keys:
+                        for field in COMPONENT_FIELDS:
+                            totals[total_key][field] += row[field] or 0
+
+            rows = []
+            for (ts, machine_id), c in totals.items():
+                if machine_id == "__machines__":
+                    # 工場全体のOEEは全設備の時間・出力量・検査数を合算して算出
+                    rows += _metric_rows(ts, period_type, None, {"OEE": _oee(c)})
+                elif machine_id is None:
+                    rows += _metric_rows(ts, period_type, None, {
+                        "FPY": _percentage(c["first_passes"], c["passes"]),
+                        "yield_rate": _percentage(c["yield_output_kg"], c["input_kg"]),
+                        "production_rate": c["output_kg"] / 1000 / c["active_hours"] if c["active_hours"] else None,
+                    })
+                else:
+                    rows += _metric_rows(ts, period_type, machine_id, {
+                        "OEE": _oee(c),
+                        "FPY": _percentage(c["first_passes"], c["passes"]),
+                        "yield_rate": _percentage(c["yield_output_kg"], c["input_kg"]),
+                        "production_rate": c["output_kg"] / 1000 / c["loaded_hours"] if c["loaded_hours"] else None,
+                    })
+
+            for chunk in _chunks(sorted(periods)):
+                conn.execute(delete(KPIMetrics).where(
+                    KPIMetrics.metric_name.in_(KPI_DEFINITIONS),
+                    KPIMetrics.period_type == period_type,
+                    KPIMetrics.ts.in_(chunk)
+                ))
+            if rows:
+                conn.execute(insert(KPIMetrics), rows)
+            counts[period_type] = len(periods)
+        return counts
+
+def _is_down(status, alert_level):
+    return status in DOWNTIME_STATUSES or (status == "alarm" and alert_level == "critical")
+
+def _oee(c):
+    """OEE = 時間稼働率 × 性能稼働率 × 良品率"""
+    if c["loaded_hours"] <= 0:
+        return None
+    availability = (c["loaded_hours"] - c["downtime_hours"]) / c["loaded_hours"]
+    performance = min(1.0, c["output_kg"] / c["ideal_output_kg"]) if c["ideal_output_kg"] > 0 else 0.0
+    quality = c["checks_ok"] / c["checks"] if c["checks"] else 1.0
+    return availability * performance * quality * 100
+
+def _percentage(numerator, denominator):
+    return numerator / denominator * 100 if denominator else None
+
+def _metric_rows(ts, period_type, machine_id, values):
+    return [
+        {
+            "ts": ts,
+            "metric_name": name,
+            "value": value,
+            "unit": KPI_DEFINITIONS[name]["unit"],
+            "period_type": period_type,
+            "machine_id": machine_id,
+            # 生産速度の目標は工場全体の値のため設備別には設定しない
+            "target_value": None if machine_id and name == "production_rate" else KPI_DEFINITIONS[name]["target"],
+        }
+        for name, value in values.items()
+        if value is not None
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="KPI算出エンジン")
+    parser.add_argument("--database-url", default=os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db"))
+    parser.add_argument("--full", action="store_true", help="全期間を再計算")
+    parser.add_argument("--interval", type=float, default=None, help="指定秒ごとに差分を反映し続ける")
+    args = parser.parse_args()
+
+    kpi_engine = KPIEngine(create_database(args.database_url))
+    full = args.full
+    while True:
+        started = time.perf_counter()
+        counts = kpi_engine.run(full=full)
+        print(
+            f"KPI更新: 時間 {counts['hourly']}件, 日 {counts['daily']}件, 月 {counts['monthly']}件 "
+            f"({(time.perf_counter() - started) * 1000:.0f}ms)"
+        )
+        if args.interval is None:
+            break
+        full = False
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,21 @@
 HTMLファイルの設計に基づいたトレーサビリティシステム用データモデル
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import create_engine, text, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON, Index, LargeBinary
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
 import sqlite3
 
+from search_index import create_lot_search_index
+from event_log import create_event_log_triggers
+
 Base = declarative_base()
 
+# スキーマ変更時にインクリメントする（SQLiteの PRAGMA user_version に記録）
+SCHEMA_VERSION = 9
+
 class RawMaterialLot(Base):
     """原料ロットマスタ - トレーサビリティの起点"""
     __tablename__ = 'raw_material_lots'
@@ -26,6 +33,13 @@ class RawMaterialLot(Base):
     moisture_content = Column(Float)  # 含水率
     created_at = Column(DateTime, default=datetime.now)
     
+    # トレーサビリティ検索用インデックス
+    __table_args__ = (
+        Index('ix_raw_material_lots_supplier_arrival', 'supplier_name', 'arrival_ts'),
+        Index('ix_raw_material_lots_arrival', 'arrival_ts'),
+        Index('ix_raw_material_lots_material_arrival', 'material_type', 'arrival_ts'),
+    )
+    
     # リレーション
     production_batches = relationship("ProductionBatch", back_populates="raw_material_lot")
 
@@ -41,6 +55,12 @@ class ProductionBatch(Base):
     current_quantity_kg = Column(Float)
     status = Column(String(20))  # active, processing, completed
     
+    # トレーサビリティ検索の並び順（キーセットページング）と原料ロットからの逆引き
+    __table_args__ = (
+        Index('ix_production_batches_creation', 'creation_ts', 'batch_id'),
+        Index('ix_production_batches_raw_lot', 'raw_material_lot_id'),
+    )
+    
     # リレーション
     raw_material_lot = relationship("RawMaterialLot", back_populates="production_batches")
     process_records = relationship("ProcessRecord", back_populates="batch")
@@ -59,6 +79,12 @@ class ProcessRecord(Base):
     operator_id = Column(String(20))
     output_kg = Column(Float)
     
+    # バッチ内の工程順の参照と、KPI集計時の期間指定
+    __table_args__ = (
+        Index('ix_process_records_batch_start', 'batch_id', 'start_ts'),
+        Index('ix_process_records_end', 'end_ts'),
+    )
+    
     # リレーション
     batch = relationship("ProductionBatch", back_populates="process_records")
     quality_checks = relationship("QualityCheck", back_populates="process_record")
@@ -80,9 +106,45 @@ class QualityCheck(Base):
     is_ok = Column(Boolean)
     measurement_type = Column(String(20))  # online, offline
     
+    # 工程記録ごとの品質データ取得・件数集計用、KPI集計時の期間指定
+    __table_args__ = (
+        Index('ix_quality_checks_record', 'record_id'),
+        Index('ix_quality_checks_ts', 'ts'),
+    )
+    
     # リレーション
     process_record = relationship("ProcessRecord", back_populates="quality_checks")
 
+class QualityChunk(Base):
+    """品質データのチャンク - (工程記録, パラメータ) 系列の測定点を圧縮して1行に格納（quality_chunks.py）
+
+    規格値・測定種別はチャンクに1回だけ持つ。last_check_id までの品質データは圧縮済み。
+    """
+    __tablename__ = 'quality_chunks'
+    
+    chunk_id = Column(Integer, primary_key=True, autoincrement=True)
+    record_id = Column(Integer, ForeignKey('process_records.record_id'))
+    parameter_name = Column(String(50))
+    measurement_type = Column(String(20))
+    target_value = Column(Float)
+    upper_limit = Column(Float)
+    lower_limit = Column(Float)
+    start_ts = Column(DateTime)
+    end_ts = Column(DateTime)
+    point_count = Column(Integer)
+    first_check_id = Column(Integer)
+    last_check_id = Column(Integer)
+    ts_data = Column(LargeBinary)  # 時刻（delta-of-delta）
+    value_data = Column(LargeBinary)  # 値（直前の値とのXOR）
+    ok_data = Column(LargeBinary)  # 合否（1点1ビット）
+    
+    # トレンド取得（期間と重なるチャンク）と工程記録ごとの取得
+    __table_args__ = (
+        Index('ix_quality_chunks_parameter_end', 'parameter_name', 'end_ts'),
+        Index('ix_quality_chunks_record', 'record_id'),
+        Index('ix_quality_chunks_last_check', 'last_check_id'),
+    )
+
 class FinishedProductLot(Base):
     """製品ロットマスタ - 最終製品の情報"""
     __tablename__ = 'finished_product_lots'
@@ -97,6 +159,15 @@ class FinishedProductLot(Base):
     roll_count = Column(Integer)
     final_quality_ok = Column(Boolean)
     
+    # トレーサビリティ検索用インデックス
+    __table_args__ = (
+        Index('ix_finished_product_lots_batch', 'batch_id'),
+        Index('ix_finished_product_lots_destination_shipment', 'destination', 'shipment_ts'),
+        Index('ix_finished_product_lots_product_completion', 'product_code', 'completion_ts'),
+        Index('ix_finished_product_lots_shipment', 'shipment_ts'),
+        Index('ix_finished_product_lots_completion', 'completion_ts'),
+    )
+    
     # リレーション
     batch = relationship("ProductionBatch", back_populates="finished_products")
 
@@ -113,6 +184,11 @@ class MachineStatusLog(Base):
     message = Column(Text)
     resolved = Column(Boolean, default=False)
     
+    # KPI集計時の停止時間の算出（期間指定）
+    __table_args__ = (
+        Index('ix_machine_status_logs_ts', 'ts'),
+    )
+    
     # リレーション
     process_record = relationship("ProcessRecord", back_populates="machine_logs")
 
@@ -126,15 +202,109 @@ class KPIMetrics(Base):
     value = Column(Float)
     unit = Column(String(20))
     period_type = Column(String(10))  # hourly, daily, monthly
-    machine_id = Column(String(20), nullable=True)
+    machine_id = Column(String(20), nullable=True)  # NULLは工場全体
     target_value = Column(Float)
     
+    # トレンド取得と、KPIエンジンによる期間単位の置き換え
+    __table_args__ = (
+        Index('ix_kpi_metrics_metric_period', 'metric_name', 'period_type', 'ts'),
+    )
+
+class KPIComponent(Base):
+    """KPI集計の中間値 - 設備・1時間ごとの加算可能な値（日次・月次はこれを合算して算出）
+
+    machine_id がNULLの行は工場全体の製品ロット集計（完成ロット数・初回合格数・製品/原料重量）。
+    """
+    __tablename__ = 'kpi_components'
+    
+    component_id = Column(Integer, primary_key=True, autoincrement=True)
+    period_start = Column(DateTime, nullable=False)
+    machine_id = Column(String(20), nullable=True)
+    loaded_hours = Column(Float, default=0.0)  # 工程実績がある時間（計画稼働時間）
+    downtime_hours = Column(Float, default=0.0)  # うち停止・重大アラームの時間
+    output_kg = Column(Float, default=0.0)  # 出力量（工程時間で按分）、工場全体は製品重量
+    ideal_output_kg = Column(Float, default=0.0)  # 実稼働時間×設計能力
+    input_kg = Column(Float, default=0.0)  # 歩留まりの分母（工程の投入量、工場全体は原料重量）
+    yield_output_kg = Column(Float, default=0.0)  # 歩留まりの分子（この時間に完了した工程の出力量）
+    checks = Column(Integer, default=0)
+    checks_ok = Column(Integer, default=0)
+    passes = Column(Integer, default=0)  # 完了した工程数、工場全体は完成ロット数
+    first_passes = Column(Integer, default=0)  # うち品質検査がすべて合格
+    active_hours = Column(Float, default=0.0)  # 工場全体の生産速度の分母（稼働のあった時間数）
+    
+    __table_args__ = (
+        Index('ix_kpi_components_period', 'period_start', 'machine_id'),
+    )
+
+class KPIWatermark(Base):
+    """KPIエンジンの処理済み位置（元テーブルごとの最終ID）"""
+    __tablename__ = 'kpi_watermarks'
+    
+    source = Column(String(50), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+class ProductionEvent(Base):
+    """生産イベントログ - 追記専用の統合タイムライン（各テーブルへの登録時にトリガーで追記）"""
+    __tablename__ = 'production_events'
+    
+    event_id = Column(Integer, primary_key=True, autoincrement=True)
+    ts = Column(DateTime, nullable=False)
+    event_type = Column(String(30), nullable=False)  # raw_material_arrival, process_start, process_end, quality_excursion, alert, product_completion, shipment
+    batch_id = Column(String(50), nullable=True)  # バッチに紐づかない設備アラートはNULL
+    machine_id = Column(String(20), nullable=True)
+    source_id = Column(String(50))  # 元テーブルの主キー
+    payload = Column(JSON)
+    
+    # ロット単位・工場全体のタイムラインをそれぞれ1回の範囲走査で取得する
+    __table_args__ = (
+        Index('ix_production_events_batch_ts', 'batch_id', 'ts', 'event_id'),
+        Index('ix_production_events_ts', 'ts', 'event_id'),
+    )
+
 def create_database(database_url="sqlite:///paperplant.db"):
     """データベースとテーブルの作成"""
     engine = create_engine(database_url)
-    Base.metadata.create_all(engine)
+    ensure_schema(engine)
     return engine
 
+def ensure_schema(engine):
+    """スキーマバージョンを確認し、古い場合のみテーブル・インデックスを作成
+
+    最新の場合は PRAGMA の読み取り1回で終わるため、ワーカー起動時に毎回呼んでも軽い。
+    データベースの方が新しい場合（ローリングデプロイ中の旧ワーカー）も何もせず、バージョンを下げない。
+    スキーマを更新した場合は True を返す。
+    """
+    if engine.dialect.name != "sqlite":
+        Base.metadata.create_all(engine)
+        return True
+
+    if _schema_version(engine) >= SCHEMA_VERSION:
+        return False
+
+    try:
+        with engine.begin() as conn:
+            Base.metadata.create_all(conn)
+            # create_all は既存テーブルに追加されたインデックスを作成しないため個別に確認
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            # ORMで表現できないSQLite固有のオブジェクト（FTS5仮想テーブル・トリガー）
+            create_lot_search_index(conn)
+            create_event_log_triggers(conn)
+            # 確認後に新しいワーカーが更新していた場合も、より低い番号で上書きしない
+            current = conn.execute(text("PRAGMA user_version")).scalar()
+            conn.execute(text(f"PRAGMA user_version = {max(current, SCHEMA_VERSION)}"))
+    except OperationalError:
+        # 複数ワーカーが同時に起動した場合、先行したワーカーが更新済みなら問題なし
+        if _schema_version(engine) < SCHEMA_VERSION:
+            raise
+        return False
+    return True
+
+def _schema_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
 def get_session(engine):
     """セッションファクトリの取得"""
     Session = sessionmaker(bind=engine)
@@ -0,0 +1,387 @@
+"""
+製紙工場ダッシュボードアプリ - リアルタイム工場シミュレーター
+模擬時計を進めながら、バッチ・工程実績・QCS測定点（CDプロファイル付き）・設備アラームを
+指定したレートで書き込み続ける（同時書き込み下での読み取り性能の確認用）
+
+サプライヤー・設備・製品・品質パラメータのマスタは PaperMillDataGenerator と共通。
+書き込みは刻み（tick）ごとに1トランザクションの一括INSERTで行い、要求レートと達成レートを定期的に表示する。
+
+使い方:
+    python plant_simulator.py --rate 5000 --duration 300 --speedup 60
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert, text, update
+
+from data_generator import PaperMillDataGenerator
+from models import (
+    RawMaterialLot, ProductionBatch, ProcessRecord, QualityCheck, FinishedProductLot, MachineStatusLog
+)
+
+PROCESS_ORDER = ["P1", "P2", "P3", "P4"]
+
+# CDプロファイル（幅方向）を付ける抄紙工程のパラメータと測定点数
+CD_PROFILE_PARAMETERS = {"basis_weight", "moisture_content"}
+CD_PROFILE_POINTS = 50
+
+class PlantSimulator:
+    """模擬時計で工場を動かし、発生したデータを逐次データベースに書き込む"""
+
+    def __init__(self, database_url="sqlite:///paperplant.db", rate=5000, speedup=60.0, lines=4,
+                 fault_rate=0.1, profile_interval=30.0, tick=0.25, seed=None, start=None):
+        self.masters = PaperMillDataGenerator(database_url)
+        self.masters.session.close()
+        self.engine = self.masters.engine
+        if self.engine.dialect.name == "sqlite":
+            # 書き込み中もダッシュボードの読み取りがブロックされないようにする（DBファイルに永続）
+            with self.engine.connect() as conn:
+                conn.execute(text("PRAGMA journal_mode = WAL"))
+
+        self.rate = rate  # QCS測定点/秒（実時間）
+        self.speedup = speedup  # 模擬時間の進み（実時間1秒あたりの模擬秒）
+        self.lines = lines  # 同時に生産中のバッチ数
+        self.fault_rate = fault_rate  # 設備1台・模擬1時間あたりの障害発生確率
+        self.profile_interval = timedelta(seconds=profile_interval)  # CDプロファイルのスキャン周期（模擬時間）
+        self.tick = tick
+
+        self.rng = np.random.default_rng(seed)
+        random.seed(seed)
+
+        self.clock = start or datetime.now()  # 模擬時計
+        self.run_tag = self.clock.strftime("%y%m%d%H%M%S")
+        self.sequence = 0
+        self.active = []  # 生産中のバッチ（現在の工程と終了予定時刻）
+        self.pending_shipments = []  # (出荷予定時刻, 製品ロットID)
+        self.faults = {}  # 設備ID -> 障害エピソード
+        self.last_profile = {}  # (工程記録ID, パラメータ) -> 直近のCDプロファイル時刻
+        self.counts = Counter()
+
+    def run(self, duration=None, report_interval=5.0):
+        """duration 秒（None なら中断されるまで）実行し、集計結果を返す"""
+        started = last = time.perf_counter()
+        next_report = started + report_interval
+        written = 0
+        write_ms = []
+
+        try:
+            while True:
+                now = time.perf_counter()
+                elapsed = now - started
+                if duration is not None and elapsed >= duration:
+                    break
+
+                # 遅れている分は追いつくよう要求するが、1トランザクションが大きくなりすぎないよう上限を設ける
+                points = min(int(self.rate * elapsed) - written, int(self.rate * self.tick * 4))
+                window_end = self.clock + timedelta(seconds=(now - last) * self.speedup)
+                last = now
+
+                write_started = time.perf_counter()
+                written += self.advance(window_end, max(points, 0))
+                write_ms.append((time.perf_counter() - write_started) * 1000)
+
+                if now >= next_report:
+                    self._report(elapsed, written, write_ms)
+                    write_ms = []
+                    next_report += report_interval
+
+                time.sleep(max(0.0, self.tick - (time.perf_counter() - now)))
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.perf_counter() - started
+        return {
+            "elapsed_seconds": elapsed,
+            "simulated_hours": elapsed * self.speedup / 3600,
+            "requested_rate": self.rate,
+            "achieved_rate": written / elapsed if elapsed else 0.0,
+            "rows": dict(self.counts),
+        }
+
+    def advance(self, window_end, points):
+        """模擬時計を window_end まで進め、その間の出来事を1トランザクションで書き込む（書き込んだQCS測定点数を返す）"""
+        with self.engine.begin() as conn:
+            written = self._step(conn, self.clock, window_end, points)
+        self.clock = window_end
+        return written
+
+    def _report(self, elapsed, written, write_ms):
+        achieved = written / elapsed if elapsed else 0.0
+        write_ms.sort()
+        p50 = write_ms[len(write_ms) // 2] if write_ms else 0.0
+        p99 = write_ms[min(len(write_ms) - 1, int(len(write_ms) * 0.99))] if write_ms else 0.0
+        print(
+            f"[{elapsed:7.1f}s] 模擬時刻 {self.clock:%m-%d %H:%M} "
+            f"要求 {self.rate}/s 達成 {achieved:.0f}/s ({achieved / self.rate * 100 if self.rate else 0:.0f}%) "
+            f"書き込み p50 {p50:.1f}ms p99 {p99:.1f}ms "
+            f"生産中 {len(self.active)} 障害中 {len(self.faults)}"
+        )
+
+    def _step(self, conn, start, end, points):
+        """模擬時刻 [start, end) の出来事を書き込み、書き込んだQCS測定点数を返す"""
+        self._advance_processes(conn, end)
+        while len(self.active) < self.lines:
+            self._start_batch(conn, start)
+        self._ship_products(conn, end)
+        self._update_faults(conn, start, end)
+        return self._write_quality_points(conn, start, end, points)
+
+    def _next_id(self, prefix):
+        self.sequence += 1
+        return f"{prefix}-{self.run_tag}-{self.sequence:05d}"
+
+    def _start_batch(self, conn, ts):
+        supplier = random.choice(self.masters.suppliers)
+        material_type = "古紙" if "古紙" in supplier["name"] else "木材チップ"
+        weight = random.uniform(15000, 25000) if material_type == "古紙" else random.uniform(20000, 40000)
+        lot_id = self._next_id("RML")
+        conn.execute(insert(RawMaterialLot).values(
+            lot_id=lot_id,
+            arrival_ts=ts - timedelta(hours=random.uniform(2, 8)),
+            supplier_name=supplier["name"],
+            material_type=material_type,
+            origin_country=supplier["country"],
+            fsc_cert_id=f"FSC-{random.randint(100000, 999999)}" if random.random() < supplier["fsc_ratio"] else None,
+            weight_kg=weight,
+            moisture_content=max(0, random.gauss(12.0 if material_type == "木材チップ" else 8.0, 0.5))
+        ))
+        self.counts["raw_material_lots"] += 1
+
+        batch = {
+            "batch_id": self._next_id("PB"),
+            "product": random.choice(self.masters.products),
+            "quantity": weight * 0.85,
+            "stage": -1,
+        }
+        conn.execute(insert(ProductionBatch).values(
+            batch_id=batch["batch_id"],
+            raw_material_lot_id=lot_id,
+            creation_ts=ts,
+            batch_type="Pulp",
+            initial_quantity_kg=batch["quantity"],
+            current_quantity_kg=batch["quantity"],
+            status="processing"
+        ))
+        self.counts["production_batches"] += 1
+        self._start_process(conn, batch, ts)
+        self.active.append(batch)
+
+    def _start_process(self, conn, batch, ts):
+        batch["stage"] += 1
+        process_code = PROCESS_ORDER[batch["stage"]]
+        base_duration = self.masters.process_durations[process_code]
+        batch.update(
+            process_code=process_code,
+            machine_id=random.choice(self.masters.machines[process_code]),
+            end_ts=ts + timedelta(hours=max(1, random.gauss(base_duration, base_duration * 0.2))),
+        )
+        batch["record_id"] = conn.execute(insert(ProcessRecord).values(
+            batch_id=batch["batch_id"],
+            process_code=process_code,
+            machine_id=batch["machine_id"],
+            start_ts=ts,
+            operator_id=random.choice(self.masters.operators)
+        )).inserted_primary_key[0]
+        self.counts["process_records"] += 1
+
+    def _advance_processes(self, conn, until):
+        """終了時刻を迎えた工程を完了させ、次工程の開始または製品ロットの完成へ進める"""
+        for batch in list(self.active):
+            while batch["end_ts"] <= until:
+                ended = batch["end_ts"]
+                batch["quantity"] *= self.masters.yield_rates[batch["process_code"]]
+                conn.execute(
+                    update(ProcessRecord)
+                    .where(ProcessRecord.record_id == batch["record_id"])
+                    .values(end_ts=ended, output_kg=batch["quantity"])
+                )
+                self.last_profile = {
+                    key: ts for key, ts in self.last_profile.items() if key[0] != batch["record_id"]
+                }
+                if batch["stage"] + 1 < len(PROCESS_ORDER):
+                    self._start_process(conn, batch, ended)
+                    continue
+
+                self._complete_batch(conn, batch, ended)
+                self.active.remove(batch)
+                break
+
+    def _complete_batch(self, conn, batch, ts):
+        product_lot_id = self._next_id("FPL")
+        conn.execute(insert(FinishedProductLot).values(
+            product_lot_id=product_lot_id,
+            batch_id=batch["batch_id"],
+            product_code=batch["product"]["code"],
+            completion_ts=ts,
+            destination=f"Customer-{random.randint(1, 20):02d}",
+            quantity_kg=batch["quantity"],
+            roll_count=random.randint(8, 20),
+            final_quality_ok=random.random() > 0.05
+        ))
+        conn.execute(
+            update(ProductionBatch)
+            .where(ProductionBatch.batch_id == batch["batch_id"])
+            .values(current_quantity_kg=batch["quantity"], status="completed")
+        )
+        self.pending_shipments.append((ts + timedelta(hours=random.uniform(12, 48)), product_lot_id))
+        self.counts["finished_product_lots"] += 1
+
+    def _ship_products(self, conn, until):
+        due = [item for item in self.pending_shipments if item[0] <= until]
+        if not due:
+            return
+        self.pending_shipments = [item for item in self.pending_shipments if item[0] > until]
+        for shipment_ts, product_lot_id in due:
+            conn.execute(
+                update(FinishedProductLot)
+                .where(FinishedProductLot.product_lot_id == product_lot_id)
+                .values(shipment_ts=shipment_ts)
+            )
+        self.counts["shipments"] += len(due)
+
+    def _update_faults(self, conn, start, end):
+        """障害エピソードの発生・復旧（発生時にアラーム、復旧時に info ログを記録）"""
+        for machine_id, fault in list(self.faults.items()):
+            if fault["end_ts"] <= end:
+                conn.execute(
+                    update(MachineStatusLog).where(MachineStatusLog.log_id == fault["log_id"]).values(resolved=True)
+                )
+                self._log_machine(conn, fault["end_ts"], machine_id, fault["record_id"], "running", "info",
+                                  f"{machine_id}: 復旧", resolved=True)
+                del self.faults[machine_id]
+
+        hours = (end - start).total_seconds() / 3600
+        probability = 1 - np.exp(-self.fault_rate * hours)
+        for batch in self.active:
+            machine_id = batch["machine_id"]
+            if machine_id in self.faults or random.random() >= probability:
+                continue
+            ts = start + (end - start) * random.random()
+            alert_level = "warning" if random.random() < 0.7 else "critical"
+            self.faults[machine_id] = {
+                "end_ts": ts + timedelta(minutes=random.uniform(10, 60)),
+                "record_id": batch["record_id"],
+                # 規格幅に対する偏り（critical は規格外まで振れる）と、CDプロファイルの筋状欠陥の位置
+                "bias": random.choice([-1, 1]) * (1.2 if alert_level == "critical" else 0.6),
+                "streak": random.randrange(2, CD_PROFILE_POINTS - 2),
+                "log_id": self._log_machine(
+                    conn, ts, machine_id, batch["record_id"], "alarm", alert_level,
+                    self.masters.generate_alert_message(batch["process_code"], machine_id)
+                ),
+            }
+
+    def _log_machine(self, conn, ts, machine_id, record_id, status, alert_level, message, resolved=False):
+        self.counts["machine_status_logs"] += 1
+        return conn.execute(insert(MachineStatusLog).values(
+            machine_id=machine_id,
+            record_id=record_id,
+            ts=ts,
+            status=status,
+            alert_level=alert_level,
+            message=message,
+            resolved=resolved
+        )).inserted_primary_key[0]
+
+    def _write_quality_points(self, conn, start, end, points):
+        """生産中の各工程のパラメータ系列に測定点を均等に割り振り、一括INSERTする"""
+        series = [
+            (batch, param)
+            for batch in self.active
+            for param in self.masters.quality_params.get(batch["process_code"], [])
+        ]
+        if not series or points <= 0:
+            return 0
+
+        span = (end - start).total_seconds()
+        per_series = np.full(len(series), points // len(series))
+        per_series[:points % len(series)] += 1
+
+        rows, profiles = [], []
+        for (batch, param), count in zip(series, per_series):
+            if not count:
+                continue
+            target = param["target"]
+            if param["name"] == "basis_weight":
+                target = float(batch["product"]["target_basis_weight"])
+            tolerance = param["tolerance"]
+            fault = self.faults.get(batch["machine_id"])
+
+            values = self.rng.normal(target, tolerance / 3, count)
+            if fault:
+                values += fault["bias"] * tolerance
+            offsets = np.sort(self.rng.uniform(0, span, count))
+
+            profile_key = (batch["record_id"], param["name"])
+            profiled = param["name"] in CD_PROFILE_PARAMETERS
+
+            for value, offset in zip(values.tolist(), offsets.tolist()):
+                ts = start + timedelta(seconds=offset)
+                row = {
+                    "record_id": batch["record_id"],
+                    "ts": ts,
+                    "parameter_name": param["name"],
+                    "value": value,
+                    "target_value": target,
+                    "upper_limit": target + tolerance,
+                    "lower_limit": target - tolerance,
+                    "is_ok": target - tolerance <= value <= target + tolerance,
+                    "measurement_type": "online" if batch["process_code"] == "P3" else "offline",
+                }
+                if profiled and ts - self.last_profile.get(profile_key, datetime.min) >= self.profile_interval:
+                    self.last_profile[profile_key] = ts
+                    row["value_array"] = self._cd_profile(value, tolerance, fault)
+                    profiles.append(row)
+                else:
+                    rows.append(row)
+
+        # value_array を含めない行は JSON の null ではなくSQLのNULLになるよう分けてINSERT
+        for chunk in (rows, profiles):
+            if chunk:
+                conn.execute(insert(QualityCheck), chunk)
+        self.counts["quality_checks"] += len(rows) + len(profiles)
+        self.counts["cd_profiles"] += len(profiles)
+        return len(rows) + len(profiles)
+
+    def _cd_profile(self, value, tolerance, fault):
+        """幅方向プロファイル（障害中は筋状の偏りと端部の反りを加える）"""
+        profile = value + self.rng.normal(0, tolerance / 6, CD_PROFILE_POINTS)
+        if fault:
+            profile[fault["streak"] - 1:fault["streak"] + 2] += fault["bias"] * tolerance
+            profile[:3] += abs(fault["bias"]) * tolerance / 2
+            profile[-3:] += abs(fault["bias"]) * tolerance / 2
+        return profile.tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description="リアルタイム工場シミュレーター")
+    parser.add_argument("--database-url", default=os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db"))
+    parser.add_argument("--rate", type=int, default=5000, help="QCS測定点の書き込みレート（点/秒）")
+    parser.add_argument("--duration", type=float, default=None, help="実行時間（秒、省略時は Ctrl+C まで）")
+    parser.add_argument("--speedup", type=float, default=60.0, help="模擬時間の倍速（実時間1秒あたりの模擬秒）")
+    parser.add_argument("--lines", type=int, default=4, help="同時に生産中のバッチ数")
+    parser.add_argument("--fault-rate", type=float, default=0.1, help="設備1台・模擬1時間あたりの障害発生確率")
+    parser.add_argument("--profile-interval", type=float, default=30.0, help="CDプロファイルのスキャン周期（模擬秒）")
+    parser.add_argument("--tick", type=float, default=0.25, help="書き込み間隔（秒）")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = PlantSimulator(
+        args.database_url, rate=args.rate, speedup=args.speedup, lines=args.lines,
+        fault_rate=args.fault_rate, profile_interval=args.profile_interval, tick=args.tick, seed=args.seed
+    )
+    print(f"シミュレーション開始: 要求 {args.rate}点/s, {args.speedup:g}倍速（Ctrl+C で終了）")
+    summary = simulator.run(args.duration, args.report_interval)
+
+    print(f"\n実行時間: {summary['elapsed_seconds']:.1f}秒（模擬 {summary['simulated_hours']:.1f}時間）")
+    print(f"QCS測定点: 要求 {summary['requested_rate']}点/s, 達成 {summary['achieved_rate']:.0f}点/s")
+    for table, count in sorted(summary["rows"].items()):
+        print(f"- {table}: {count}件")
+
+if __name__ == "__main__":
+    main()
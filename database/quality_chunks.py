@@ -0,0 +1,244 @@
+"""
+製紙工場ダッシュボードアプリ - QCS時系列のチャンク格納
+品質データ（quality_checks）を (工程記録, パラメータ, 規格値) の系列ごとに quality_chunks の1行へまとめる
+
+- 時刻: マイクロ秒の整数にして2階差分（delta-of-delta）を取り、収まる最小の整数幅で格納
+- 値: 直前の値とのビットXOR（Gorilla方式）を取り、バイト位置ごとに並べ替えて格納
+  （変化の小さい系列では上位バイトが0の連続になり、zlibがよく効く）
+- 合否: 1点1ビット
+いずれもzlibで圧縮し、規格値・測定種別はチャンクに1回だけ持つ。符号化・復号はNumPyの一括演算で行う。
+
+圧縮は check_id の昇順に行い、チャンクの last_check_id の最大値までが圧縮済み。
+check_id の順で最初に現れる対象期間外（before 以降）の行の手前で止めるため、
+check_id と時刻の順序が揃っていない（後から古いデータを取り込んだ）場合も、新しい行を圧縮することはない。
+トレンドの読み取りは圧縮済みの範囲をチャンクから、それ以降を quality_checks から取得する。
+チャンクは読み取りの高速化用で、圧縮済みの行は削除しない（工程別モニタリング・CDプロファイル・
+イベントログの取り込み・トレーサビリティの品質判定・KPIの全期間再計算は check_id 付きの行を参照するため）。
+
+使い方:
+    python quality_chunks.py --older-than-hours 24           # 24時間より前の品質データをチャンク化
+"""
+
+import argparse
+import itertools
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from models import create_database, QualityCheck, QualityChunk
+
+# 1チャンクの最大点数
+CHUNK_POINTS = 1024
+# 1トランザクションで圧縮する check_id の範囲
+BATCH_CHECKS = 100000
+
+# チャンクから復元できる項目（queries.py の品質データ項目名）。check_id は持たないため、必要な場合は行から読む
+CHUNK_FIELDS = ("timestamp", "parameter", "value", "target", "upper_limit", "lower_limit", "is_ok",
+                "measurement_type", "record_id")
+
+_WIDTHS = (np.dtype("<i1"), np.dtype("<i2"), np.dtype("<i4"), np.dtype("<i8"))
+
+# === 符号化・復号 ===
+
+def encode_timestamps(timestamps):
+    """時刻（datetime の列）を delta-of-delta で符号化"""
+    micros = np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+    # [1階差分の先頭, 2階差分...]。一定周期の測定ではほぼ0が並ぶ
+    residuals = np.concatenate([np.diff(micros)[:1], np.diff(micros, n=2)])
+    width = next(
+        (dtype for dtype in _WIDTHS
+         if not residuals.size or np.abs(residuals).max() <= np.iinfo(dtype).max),
+        _WIDTHS[-1]
+    )
+    header = struct.pack("<Bq", width.itemsize, micros[0])
+    return zlib.compress(header + residuals.astype(width).tobytes())
+
+def decode_timestamps(data):
+    """時刻をマイクロ秒の整数配列に復号"""
+    raw = zlib.decompress(data)
+    itemsize, first = struct.unpack_from("<Bq", raw)
+    residuals = np.frombuffer(raw, dtype=np.dtype(f"<i{itemsize}"), offset=9).astype(np.int64)
+    deltas = np.cumsum(residuals)
+    return first + np.concatenate([[0], np.cumsum(deltas)])
+
+def encode_values(values):
+    """値を直前の値とのXORで符号化（欠測は NaN）"""
+    bits = np.array(values, dtype="<f8").view("<u8")
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    # 8バイト×点数 → 点数バイト×8面に並べ替え、同じ桁のバイトを連続させる
+    planes = xored.view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(planes.tobytes())
+
+def decode_values(data, count):
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(8, count)
+    xored = np.ascontiguousarray(planes.T).view("<u8").ravel()
+    return np.bitwise_xor.accumulate(xored).view("<f8")
+
+def encode_flags(flags):
+    return zlib.compress(np.packbits(np.array(flags, dtype=bool)).tobytes())
+
+def decode_flags(data, count):
+    return np.unpackbits(np.frombuffer(zlib.decompress(data), dtype=np.uint8), count=count).astype(bool)
+
+def chunk_row(series_key, points):
+    """1系列分の測定点（check_id, ts, value, is_ok）からチャンクの1行を作る"""
+    record_id, parameter_name, measurement_type, target_value, upper_limit, lower_limit = series_key
+    check_ids, timestamps, values, flags = zip(*points)
+    return {
+        "record_id": record_id,
+        "parameter_name": parameter_name,
+        "measurement_type": measurement_type,
+        "target_value": target_value,
+        "upper_limit": upper_limit,
+        "lower_limit": lower_limit,
+        "start_ts": timestamps[0],
+        "end_ts": timestamps[-1],
+        "point_count": len(points),
+        "first_check_id": min(check_ids),
+        "last_check_id": max(check_ids),
+        "ts_data": encode_timestamps(timestamps),
+        "value_data": encode_values(values),
+        "ok_data": encode_flags(flags),
+    }
+
+# === 圧縮 ===
+
+def chunk_watermark(db):
+    """圧縮済みの最大 check_id（未圧縮なら0）"""
+    return db.execute(select(func.coalesce(func.max(QualityChunk.last_check_id), 0))).scalar()
+
+def compact_quality_checks(engine, before, chunk_points=CHUNK_POINTS):
+    """before より前に測定された品質データをチャンク化し、{points, chunks} を返す
+
+    check_id の範囲ごとにトランザクションを分けるため、途中で止めても続きから再開できる。
+    before 以降の行より check_id の大きい古い行は、その行が before より前になった回の実行でチャンク化する。
+    """
+    counts = {"points": 0, "chunks": 0}
+    with engine.connect() as conn:
+        watermark = chunk_watermark(conn)
+        pending = [QualityCheck.check_id > watermark, QualityCheck.ts < before]
+        # 圧縮済みの範囲は check_id の区間で表すため、before 以降の最初の行を越えて進めない
+        recent = conn.execute(
+            select(func.min(QualityCheck.check_id))
+            .where(QualityCheck.check_id > watermark, QualityCheck.ts >= before)
+        ).scalar()
+        if recent is not None:
+            pending.append(QualityCheck.check_id < recent)
+        upto = conn.execute(select(func.max(QualityCheck.check_id)).where(*pending)).scalar()
+    if upto is None:
+        return counts
+
+    for low in range(watermark, upto, BATCH_CHECKS):
+        high = min(low + BATCH_CHECKS, upto)
+        with engine.begin() as conn:
+            in_batch = (QualityCheck.check_id > low, QualityCheck.check_id <= high, QualityCheck.ts < before)
+            series_columns = (
+                QualityCheck.record_id, QualityCheck.parameter_name, QualityCheck.measurement_type,
+                QualityCheck.target_value, QualityCheck.upper_limit, QualityCheck.lower_limit,
+            )
+            rows = conn.execute(
+                select(*series_columns, QualityCheck.check_id, QualityCheck.ts, QualityCheck.value, QualityCheck.is_ok)
+                .where(*in_batch)
+                .order_by(*series_columns, QualityCheck.ts, QualityCheck.check_id)
+            ).all()
+
+            chunks = []
+            for series_key, points in itertools.groupby(rows, key=lambda row: tuple(row[:6])):
+                points = [tuple(row[6:]) for row in points]
+                for offset in range(0, len(points), chunk_points):
+                    chunks.append(chunk_row(series_key, points[offset:offset + chunk_points]))
+            if chunks:
+                # 範囲内の行は時刻のないものを除いてすべてチャンク化したため、
+                # last_check_id が high に届かなくても次回はこの範囲の後から再開させる
+                chunks[-1]["last_check_id"] = max(chunks[-1]["last_check_id"], high)
+                conn.execute(insert(QualityChunk), chunks)
+            counts["points"] += len(rows)
+            counts["chunks"] += len(chunks)
+    return counts
+
+# === 読み取り ===
+
+def fetch_trend(db, parameter, start_time, fields):
+    """品質パラメータのトレンド（圧縮済みの範囲はチャンク、それ以降は行から取得して時刻順に結合）"""
+    watermark = chunk_watermark(db)
+    start_micros = np.datetime64(start_time, "us").astype(np.int64)
+
+    columns = {name: [] for name in ("ts", "value", "is_ok", "target", "upper_limit", "lower_limit",
+                                     "measurement_type", "record_id")}
+    for chunk in db.execute(
+        select(
+            QualityChunk.ts_data, QualityChunk.value_data, QualityChunk.ok_data, QualityChunk.point_count,
+            QualityChunk.target_value, QualityChunk.upper_limit, QualityChunk.lower_limit,
+            QualityChunk.measurement_type, QualityChunk.record_id,
+        )
+        .where(QualityChunk.parameter_name == parameter, QualityChunk.end_ts >= start_time)
+    ):
+        micros = decode_timestamps(chunk.ts_data)
+        selected = micros >= start_micros
+        count = int(selected.sum())
+        columns["ts"].append(micros[selected])
+        columns["value"].append(decode_values(chunk.value_data, chunk.point_count)[selected])
+        columns["is_ok"].append(decode_flags(chunk.ok_data, chunk.point_count)[selected])
+        for name, value in (("target", chunk.target_value), ("upper_limit", chunk.upper_limit),
+                            ("lower_limit", chunk.lower_limit), ("measurement_type", chunk.measurement_type),
+                            ("record_id", chunk.record_id)):
+            columns[name].append(np.full(count, value, dtype=object))
+
+    rows = db.execute(
+        select(
+            QualityCheck.ts, QualityCheck.value, QualityCheck.is_ok, QualityCheck.target_value,
+            QualityCheck.upper_limit, QualityCheck.lower_limit, QualityCheck.measurement_type, QualityCheck.record_id,
+        )
+        .where(QualityCheck.parameter_name == parameter, QualityCheck.ts >= start_time,
+               QualityCheck.check_id > watermark)
+    ).all()
+    if rows:
+        ts, value, is_ok, *rest = zip(*rows)
+        columns["ts"].append(np.array(ts, dtype="datetime64[us]").astype(np.int64))
+        columns["value"].append(np.array(value, dtype=float))
+        columns["is_ok"].append(np.array(is_ok, dtype=bool))
+        for name, values in zip(("target", "upper_limit", "lower_limit", "measurement_type", "record_id"), rest):
+            columns[name].append(np.array(values, dtype=object))
+
+    if not columns["ts"]:
+        return []
+    merged = {name: np.concatenate(parts) for name, parts in columns.items()}
+    order = np.argsort(merged["ts"], kind="stable")
+    values = merged["value"][order]
+    output = {
+        "timestamp": merged["ts"][order].astype("datetime64[us]").astype(object),
+        "parameter": itertools.repeat(parameter),
+        # 欠測（NaN）はJSONで表せないため None に戻す
+        "value": np.where(np.isnan(values), None, values.astype(object)),
+        "target": merged["target"][order],
+        "upper_limit": merged["upper_limit"][order],
+        "lower_limit": merged["lower_limit"][order],
+        "is_ok": merged["is_ok"][order].tolist(),
+        "measurement_type": merged["measurement_type"][order],
+        "record_id": merged["record_id"][order],
+    }
+    return [dict(zip(fields, point)) for point in zip(*(output[field] for field in fields))]
+
+def main():
+    parser = argparse.ArgumentParser(description="品質データのチャンク化")
+    parser.add_argument("--database-url", default=os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db"))
+    parser.add_argument("--older-than-hours", type=float, default=24.0, help="この時間より前の品質データを対象にする")
+    parser.add_argument("--delete", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.delete:
+        parser.error(
+            "--delete は使用できません。工程別モニタリング・CDプロファイル・イベントログの取り込みなどが "
+            "quality_checks の行を参照するため、チャンク化した行も削除せずに残します"
+        )
+
+    before = datetime.now() - timedelta(hours=args.older_than_hours)
+    counts = compact_quality_checks(create_database(args.database_url), before)
+    print(f"チャンク化: {counts['points']}点 → {counts['chunks']}チャンク")
+
+if __name__ == "__main__":
+    main()
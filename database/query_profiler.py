@@ -0,0 +1,188 @@
+"""
+製紙工場ダッシュボードアプリ - スロークエリプロファイラ
+閾値を超えたSQLを正規化SQL・パラメータ・実行時間・呼び出し元・実行計画とともに記録する
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(statement):
+    """リテラル・IN句の要素数・空白の違いを吸収した正規化SQL"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    # IN (?, ?, ?) の要素数違いを同一視
+    sql = _PLACEHOLDER_LIST.sub("(?...)", sql)
+    return sql
+
+def fingerprint_sql(normalized_sql):
+    """正規化SQLのフィンガープリント"""
+    return hashlib.sha1(normalized_sql.encode("utf-8")).hexdigest()[:12]
+
+def pop_cursor_start(context, key):
+    """handle_error で、失敗した文の開始時刻を接続ごとのスタック（conn.info[key]）から取り除く
+
+    失敗した文では after_cursor_execute が呼ばれないため、積み残すとプールで再利用される接続の計測がずれる。
+    取得（fetch）中の例外など、after_cursor_execute の後で起きた例外では先頭が別の文なので取り除かない。
+    """
+    if context.connection is None or context.execution_context is None:
+        return
+    stack = context.connection.info.get(key)
+    if stack and stack[-1][0] is context.execution_context:
+        stack.pop()
+
+class QueryProfiler:
+    """エンジンに接続してスロークエリを捕捉するプロファイラ"""
+
+    def __init__(self, threshold_ms=100.0, capacity=200, log_path=None,
+                 log_max_bytes=10 * 1024 * 1024, log_backup_count=5,
+                 endpoint_getter=None, explain=True, max_fingerprints=1000):
+        self.threshold_ms = threshold_ms
+        self.endpoint_getter = endpoint_getter
+        self.explain = explain
+        self.max_fingerprints = max_fingerprints
+        self._recent = deque(maxlen=capacity)
+        self._aggregates = OrderedDict()
+        self._lock = threading.Lock()
+        self._logger = None
+        if log_path:
+            self._logger = logging.getLogger(f"paperplant.slow_query.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(RotatingFileHandler(
+                log_path, maxBytes=log_max_bytes, backupCount=log_backup_count, encoding="utf-8"))
+
+    def attach(self, engine):
+        """エンジンにイベントフックを登録"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        return self
+
+    def detach(self, engine):
+        """エンジンからイベントフックを解除"""
+        event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.remove(engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("paperplant_profiler_start", []).append((context, time.perf_counter()))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        _, started = conn.info["paperplant_profiler_start"].pop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        normalized = normalize_sql(statement)
+        plan = None
+        if self.explain and not executemany and conn.dialect.name == "sqlite":
+            plan = self._explain(conn, statement, parameters)
+
+        entry = {
+            "captured_at": datetime.now().isoformat(),
+            "fingerprint": fingerprint_sql(normalized),
+            "sql": normalized,
+            "parameters": _summarize_parameters(parameters, executemany),
+            "duration_ms": round(duration_ms, 3),
+            "endpoint": self.endpoint_getter() if self.endpoint_getter else None,
+            "query_plan": plan,
+        }
+        self._record(entry)
+
+    def _handle_error(self, context):
+        pop_cursor_start(context, "paperplant_profiler_start")
+
+    def _explain(self, conn, statement, parameters):
+        if statement.lstrip()[:6].upper() not in ("SELECT", "WITH"):
+            return None
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters or ())
+                return [row[-1] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as exc:  # 実行計画の取得失敗で本来のクエリを妨げない
+            return [f"EXPLAIN失敗: {exc}"]
+
+    def _record(self, entry):
+        with self._lock:
+            self._recent.append(entry)
+            stats = self._aggregates.pop(entry["fingerprint"], None)
+            if stats is None:
+                stats = {
+                    "fingerprint": entry["fingerprint"],
+                    "sql": entry["sql"],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "endpoints": set(),
+                }
+            stats["count"] += 1
+            stats["total_ms"] += entry["duration_ms"]
+            stats["max_ms"] = max(stats["max_ms"], entry["duration_ms"])
+            stats["last_seen"] = entry["captured_at"]
+            stats["last_query_plan"] = entry["query_plan"]
+            if entry["endpoint"]:
+                stats["endpoints"].add(entry["endpoint"])
+            # 最近出現したものを末尾に置き、上限超過時は最も古いものから破棄
+            self._aggregates[entry["fingerprint"]] = stats
+            while len(self._aggregates) > self.max_fingerprints:
+                self._aggregates.popitem(last=False)
+
+        if self._logger:
+            self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def recent(self, limit=None):
+        """捕捉したスロークエリ（新しい順）"""
+        with self._lock:
+            entries = list(self._recent)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def aggregate(self, limit=None):
+        """フィンガープリント別の集計（合計時間の降順）"""
+        with self._lock:
+            rows = [
+                {
+                    "fingerprint": s["fingerprint"],
+                    "sql": s["sql"],
+                    "count": s["count"],
+                    "total_ms": round(s["total_ms"], 3),
+                    "mean_ms": round(s["total_ms"] / s["count"], 3),
+                    "max_ms": s["max_ms"],
+                    "endpoints": sorted(s["endpoints"]),
+                    "last_seen": s["last_seen"],
+                    "last_query_plan": s["last_query_plan"],
+                }
+                for s in self._aggregates.values()
+            ]
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        """捕捉結果の消去"""
+        with self._lock:
+            self._recent.clear()
+            self._aggregates.clear()
+
+def _summarize_parameters(parameters, executemany, max_length=500):
+    if executemany:
+        return f"<executemany: {len(parameters)}件>"
+    text = repr(parameters)
+    return text if len(text) <= max_length else text[:max_length] + "..."
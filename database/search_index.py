@@ -0,0 +1,179 @@
+"""
+製紙工場ダッシュボードアプリ - ロット全文検索インデックス
+SQLite FTS5（trigramトークナイザ、日本語の部分一致に対応）によるロット検索用インデックスの定義
+
+- lot_search: ロットID（原料ロット・生産バッチ・製品ロット）の部分一致用
+- lot_search_rows: (ロット種別, ロットID) と lot_search の rowid の対応表
+- lot_search_terms / lot_search_terms_fts: サプライヤー名・原料種別・出荷先・製品コードの値の辞書
+
+属性値は種類が少なく1つの値を大量のロットが共有するため、ロット単位ではなく値単位で索引し、
+一致した値から各テーブルのB-treeインデックスでロットを引く。
+いずれも元テーブルの登録・更新・削除時にトリガーで自動的に反映される。
+元テーブルは文字列の主キーを持ち、暗黙の rowid は VACUUM で振り直されることがあるため、
+lot_search の行は元テーブルの rowid ではなく (ロット種別, ロットID) で対応表から引く。
+"""
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+LOT_SEARCH_TABLE = "lot_search"
+LOT_SEARCH_ROWS_TABLE = "lot_search_rows"
+LOT_SEARCH_TERMS_TABLE = "lot_search_terms"
+LOT_SEARCH_TERMS_FTS_TABLE = "lot_search_terms_fts"
+
+# (lot_type, 元テーブル, ロットID列, 辞書に登録する属性列)
+_SOURCES = [
+    ("raw_material", "raw_material_lots", "lot_id", ("supplier_name", "material_type")),
+    ("batch", "production_batches", "batch_id", ()),
+    ("product", "finished_product_lots", "product_lot_id", ("destination", "product_code")),
+]
+
+def _row_id(lot_type, lot_id):
+    return f"(SELECT row_id FROM {LOT_SEARCH_ROWS_TABLE} WHERE lot_type = '{lot_type}' AND lot_id = {lot_id})"
+
+def _index_row(lot_type, id_column, term_columns, alias):
+    """1行分の lot_search 登録と属性値の辞書登録"""
+    lot_id = f"{alias}.{id_column}"
+    statements = [
+        f"INSERT INTO {LOT_SEARCH_ROWS_TABLE}(lot_type, lot_id) VALUES ('{lot_type}', {lot_id});",
+        f"INSERT INTO {LOT_SEARCH_TABLE}(rowid, lot_id, lot_type) "
+        f"VALUES ({_row_id(lot_type, lot_id)}, {lot_id}, '{lot_type}');",
+    ]
+    for column in term_columns:
+        statements.append(
+            f"INSERT OR IGNORE INTO {LOT_SEARCH_TERMS_TABLE}(field, value) "
+            f"SELECT '{column}', {alias}.{column} WHERE {alias}.{column} IS NOT NULL;"
+        )
+    return "\n".join(statements)
+
+def _unindex_row(lot_type, id_column, alias):
+    """1行分の lot_search と対応表の削除"""
+    lot_id = f"{alias}.{id_column}"
+    return (
+        f"DELETE FROM {LOT_SEARCH_TABLE} WHERE rowid = {_row_id(lot_type, lot_id)};\n"
+        f"DELETE FROM {LOT_SEARCH_ROWS_TABLE} WHERE lot_type = '{lot_type}' AND lot_id = {lot_id};"
+    )
+
+def _update_trigger(lot_type, table, id_column, term_columns):
+    # 状態・日時の更新（status / end_ts / shipment_ts など）では索引を書き換えない
+    columns = ", ".join((id_column, *term_columns))
+    return f"""
+    CREATE TRIGGER {table}_lot_search_au AFTER UPDATE OF {columns} ON {table} BEGIN
+        {_unindex_row(lot_type, id_column, 'old')}
+        {_index_row(lot_type, id_column, term_columns, 'new')}
+    END
+    """
+
+def _ddl():
+    statements = [
+        f"""
+        CREATE VIRTUAL TABLE {LOT_SEARCH_TABLE} USING fts5(
+            lot_id, lot_type UNINDEXED, tokenize = 'trigram'
+        )
+        """,
+        # INTEGER PRIMARY KEY の rowid は VACUUM でも変わらない
+        f"""
+        CREATE TABLE {LOT_SEARCH_ROWS_TABLE} (
+            row_id INTEGER PRIMARY KEY,
+            lot_type TEXT NOT NULL,
+            lot_id TEXT NOT NULL,
+            UNIQUE (lot_type, lot_id)
+        )
+        """,
+        f"""
+        CREATE TABLE {LOT_SEARCH_TERMS_TABLE} (
+            term_id INTEGER PRIMARY KEY,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            UNIQUE (field, value)
+        )
+        """,
+        f"""
+        CREATE VIRTUAL TABLE {LOT_SEARCH_TERMS_FTS_TABLE} USING fts5(
+            value, content = '{LOT_SEARCH_TERMS_TABLE}', content_rowid = 'term_id', tokenize = 'trigram'
+        )
+        """,
+        # 辞書は追記のみ（ロット削除後に残った値は一致しても該当ロットが0件になるだけ）
+        f"""
+        CREATE TRIGGER {LOT_SEARCH_TERMS_TABLE}_ai AFTER INSERT ON {LOT_SEARCH_TERMS_TABLE} BEGIN
+            INSERT INTO {LOT_SEARCH_TERMS_FTS_TABLE}(rowid, value) VALUES (new.term_id, new.value);
+        END
+        """,
+    ]
+    for lot_type, table, id_column, term_columns in _SOURCES:
+        statements += [
+            f"""
+            CREATE TRIGGER {table}_lot_search_ai AFTER INSERT ON {table} BEGIN
+                {_index_row(lot_type, id_column, term_columns, 'new')}
+            END
+            """,
+            f"""
+            CREATE TRIGGER {table}_lot_search_ad AFTER DELETE ON {table} BEGIN
+                {_unindex_row(lot_type, id_column, 'old')}
+            END
+            """,
+            _update_trigger(lot_type, table, id_column, term_columns),
+            # 既存データの取り込み
+            f"""
+            INSERT INTO {LOT_SEARCH_ROWS_TABLE}(lot_type, lot_id)
+            SELECT '{lot_type}', {id_column} FROM {table}
+            """,
+            f"""
+            INSERT INTO {LOT_SEARCH_TABLE}(rowid, lot_id, lot_type)
+            SELECT row_id, lot_id, lot_type FROM {LOT_SEARCH_ROWS_TABLE} WHERE lot_type = '{lot_type}'
+            """,
+        ]
+        for column in term_columns:
+            statements.append(f"""
+            INSERT OR IGNORE INTO {LOT_SEARCH_TERMS_TABLE}(field, value)
+            SELECT DISTINCT '{column}', {column} FROM {table} WHERE {column} IS NOT NULL
+            """)
+    return statements
+
+def create_lot_search_index(conn):
+    """検索インデックスとトリガーを作成し、既存データを取り込む（作成済みなら何もしない）
+
+    FTS5が使用できない環境では作成せず False を返す。
+    元テーブルの rowid で対応付けていた旧形式のインデックスは作り直し、
+    全列の更新で発火する旧形式の更新トリガーは索引対象の列に限ったものに置き換える。
+    """
+    if has_lot_search_index(conn):
+        if not _has_table(conn, LOT_SEARCH_ROWS_TABLE):
+            return rebuild_lot_search_index(conn)
+        for lot_type, table, id_column, term_columns in _SOURCES:
+            trigger_sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"),
+                {"name": f"{table}_lot_search_au"}
+            ).scalar()
+            if trigger_sql is None or " UPDATE OF " not in trigger_sql:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_lot_search_au"))
+                conn.execute(text(_update_trigger(lot_type, table, id_column, term_columns)))
+        return True
+    try:
+        for statement in _ddl():
+            conn.execute(text(statement))
+    except OperationalError as exc:
+        if "fts5" in str(exc):
+            return False
+        raise
+    return True
+
+def has_lot_search_index(conn):
+    """検索インデックスが作成済みか"""
+    return _has_table(conn, LOT_SEARCH_TABLE)
+
+def _has_table(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": name}
+    ).first() is not None
+
+def rebuild_lot_search_index(conn):
+    """検索インデックスの再構築（削除して作り直す）"""
+    for _, table, _, _ in _SOURCES:
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_lot_search_{suffix}"))
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {LOT_SEARCH_TERMS_TABLE}_ai"))
+    for table in (LOT_SEARCH_TERMS_FTS_TABLE, LOT_SEARCH_TERMS_TABLE, LOT_SEARCH_TABLE, LOT_SEARCH_ROWS_TABLE):
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    return create_lot_search_index(conn)
@@ -0,0 +1,131 @@
+"""
+製紙工場ダッシュボードアプリ - 工場（ミル）・ラインごとのシャーディング
+工場・抄紙機ラインごとに別のデータベースファイルを割り当て、書き込みと容量を分散する
+
+シャード構成は PAPERPLANT_SHARDS に {"名前": "接続URL"} のJSON、またはそのJSONファイルのパスで指定する。
+未指定の場合は PAPERPLANT_DATABASE_URL の1シャード（default）で従来どおり動く。
+工場全体の集計はスレッドプールで全シャードへ同時に問い合わせ（scatter）、呼び出し側で結合する。
+SQLiteはクエリ実行中にGILを解放するため、シャードごとの問い合わせは並列に進む。
+
+使い方:
+    export PAPERPLANT_SHARDS='{"tomakomai": "sqlite:///tomakomai.db", "fuji": "sqlite:///fuji.db"}'
+    python sharding.py                                   # 各シャードのスキーマを作成して一覧表示
+"""
+
+import argparse
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from models import create_database, get_session, ProductionBatch, QualityCheck
+
+DEFAULT_SHARD = "default"
+
+class UnknownShard(Exception):
+    """構成にないシャード名"""
+
+def load_shard_config(value, default_url):
+    """PAPERPLANT_SHARDS の値（JSON文字列またはファイルパス）を {名前: URL} に変換"""
+    if not value:
+        return {DEFAULT_SHARD: default_url}
+    if not value.lstrip().startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    shards = json.loads(value)
+    if not isinstance(shards, dict) or not shards:
+        raise ValueError("PAPERPLANT_SHARDS には {\"名前\": \"接続URL\"} の形式で1件以上指定してください")
+    return shards
+
+def default_workers(shard_count):
+    """並列問い合わせのスレッド数の既定値（PAPERPLANT_SHARD_WORKERS 未指定時）"""
+    return min(32, 4 * shard_count)
+
+class ShardRouter:
+    """シャード名からエンジン・セッションを引き、全シャードへの並列問い合わせを行う"""
+
+    def __init__(self, shards, max_workers=None):
+        # 先頭のシャードを既定にする（mill 未指定の単一工場向けAPI・プリウォーム・スナップショット出力）
+        self.urls = dict(shards)
+        self.engines = {name: create_database(url) for name, url in self.urls.items()}
+        self.default = next(iter(self.engines))
+        # 同時に処理する複数リクエストがそれぞれ全シャードへ問い合わせるため、シャード数の4倍（上限32）を既定にする
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or default_workers(len(self.engines)), thread_name_prefix="shard"
+        )
+
+    @classmethod
+    def from_env(cls, default_url):
+        shards = load_shard_config(os.environ.get("PAPERPLANT_SHARDS"), default_url)
+        max_workers = os.environ.get("PAPERPLANT_SHARD_WORKERS")
+        return cls(shards, max_workers=int(max_workers) if max_workers else None)
+
+    @property
+    def names(self):
+        return list(self.engines)
+
+    @property
+    def is_sharded(self):
+        return len(self.engines) > 1
+
+    def engine(self, name=None):
+        try:
+            return self.engines[name or self.default]
+        except KeyError:
+            raise UnknownShard(f"工場 '{name}' は構成されていません") from None
+
+    def session(self, name=None):
+        return get_session(self.engine(name))
+
+    def scatter(self, fn, names=None):
+        """fn(session) を各シャードで並列に実行し、{シャード名: 結果} を返す
+
+        呼び出し元のコンテキスト変数（リクエストごとのSQL計測など）を引き継いで実行する。
+        いずれかのシャードで例外が起きた場合は、全シャードの完了を待ってから送出する。
+        """
+        names = names or self.names
+        # 同じ Context は複数スレッドで同時に使えないため、シャードごとに複製する
+        futures = {
+            name: self.executor.submit(contextvars.copy_context().run, self._run, name, fn) for name in names
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    def _run(self, name, fn):
+        session = self.session(name)
+        try:
+            return fn(session)
+        finally:
+            session.close()
+
+    def dispose(self):
+        self.executor.shutdown(wait=True)
+        for engine in self.engines.values():
+            engine.dispose()
+
+def merge_sorted(results, key, limit, tag="mill"):
+    """シャードごとの結果リスト（{シャード名: [dict, ...]}）にシャード名を付けて結合し、key の降順で limit 件に絞る"""
+    merged = [{**item, tag: name} for name, items in results.items() for item in items]
+    merged.sort(key=key, reverse=True)
+    return merged[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="シャード構成の確認・スキーマ作成")
+    parser.add_argument("--database-url", default=os.environ.get("PAPERPLANT_DATABASE_URL", "sqlite:///paperplant.db"))
+    args = parser.parse_args()
+
+    router = ShardRouter.from_env(args.database_url)
+    try:
+        counts = router.scatter(lambda db: (
+            db.execute(select(func.count()).select_from(ProductionBatch)).scalar(),
+            db.execute(select(func.count()).select_from(QualityCheck)).scalar(),
+        ))
+        for name in router.names:
+            batches, checks = counts[name]
+            print(f"{name:15s} {router.urls[name]:40s} バッチ {batches}件, 品質データ {checks}件")
+    finally:
+        router.dispose()
+
+if __name__ == "__main__":
+    main()
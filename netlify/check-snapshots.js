@@ -0,0 +1,29 @@
+/**
+ * 製紙工場ダッシュボード - Netlifyビルド前のスナップショット確認
+ * frontend/public/snapshots/manifest.json（backend/snapshot_export.py の出力）がなければビルドを失敗させる。
+ * スナップショットは .gitignore 対象のため、Gitからの自動ビルドには含まれない。
+ * PAPERPLANT_DEMO_DATA=1 の場合のみ、デモデータ用のマニフェスト（demo: true）を出力して続行する。
+ */
+
+const fs = require('fs');
+const path = require('path');
+
+const snapshotDir = path.join(__dirname, '..', 'frontend', 'public', 'snapshots');
+const manifestPath = path.join(snapshotDir, 'manifest.json');
+
+if (fs.existsSync(manifestPath)) {
+  const manifest = JSON.parse(fs.readFileSync(manifestPath, 'utf-8'));
+  const count = Object.keys(manifest.bundles || {}).length;
+  console.log(`スナップショット: ${count}バンドル（${manifest.generated_at || '生成日時不明'}）`);
+} else if (process.env.PAPERPLANT_DEMO_DATA === '1') {
+  fs.mkdirSync(snapshotDir, { recursive: true });
+  fs.writeFileSync(manifestPath, JSON.stringify({ version: 1, demo: true, bundles: {} }));
+  console.warn('スナップショットがないため、デモデータでビルドします（PAPERPLANT_DEMO_DATA=1）');
+} else {
+  console.error(
+    'frontend/public/snapshots/manifest.json がありません。\n' +
+    'DBのある環境で `npm run deploy`（snapshot_export.py → ビルド → netlify deploy）を実行するか、\n' +
+    'デモデータで公開する場合は PAPERPLANT_DEMO_DATA=1 を設定してください。'
+  );
+  process.exit(1);
+}
@@ -1,8 +1,145 @@
 /**
  * 製紙工場ダッシュボードAPI - Netlify Functions
  * サーバーレス環境でのAPIエンドポイント
+ *
+ * backend/snapshot_export.py が出力した静的スナップショット（/snapshots/manifest.json）の実データを返す。
+ * マニフェストがない場合は 503、スナップショットの対象外のリクエスト（クエリ指定・検索など）は 404、
+ * バンドルを取得できない場合は 503 を返す（実データのつもりでデモデータを表示しない）。
+ * デモデータを生成するのは、デモ用にビルドした場合（マニフェストの demo: true、netlify/check-snapshots.js が出力）のみ。
  */
 
+const zlib = require('zlib');
+
+// スナップショットの配信元（既定はデプロイ先サイトの /snapshots）
+const SNAPSHOT_BASE_URL = process.env.SNAPSHOT_BASE_URL ||
+  (process.env.URL ? `${process.env.URL}/snapshots` : null);
+const MANIFEST_TTL_MS = 60 * 1000;
+const MAX_CACHED_BUNDLES = 100;
+
+let manifestCache = { fetchedAt: 0, manifest: null };
+// バンドルのファイル名は内容ハッシュを含むため、取得済みのものはそのまま再利用できる
+const bundleCache = new Map();
+
+async function loadManifest() {
+  if (!SNAPSHOT_BASE_URL) return null;
+  if (Date.now() - manifestCache.fetchedAt < MANIFEST_TTL_MS) return manifestCache.manifest;
+
+  let manifest = manifestCache.manifest;
+  try {
+    const response = await fetch(`${SNAPSHOT_BASE_URL}/manifest.json`);
+    if (response.ok) {
+      manifest = await response.json();
+    } else if (response.status === 404) {
+      manifest = null;
+    }
+  } catch (error) {
+    console.error('Snapshot manifest fetch failed:', error.message);
+  }
+  manifestCache = { fetchedAt: Date.now(), manifest };
+  return manifest;
+}
+
+async function loadBundle(file) {
+  if (bundleCache.has(file)) return bundleCache.get(file);
+
+  const response = await fetch(`${SNAPSHOT_BASE_URL}/${file}`);
+  if (!response.ok) return null;
+  const body = Buffer.from(await response.arrayBuffer());
+  if (bundleCache.size >= MAX_CACHED_BUNDLES) {
+    bundleCache.delete(bundleCache.keys().next().value);
+  }
+  bundleCache.set(file, body);
+  return body;
+}
+
+// APIパスとクエリからバンドルのキーを求める
+function snapshotKey(path, query) {
+  const kpiMatch = path.match(/^\/kpi\/trend\/([^/]+)$/);
+  if (kpiMatch) {
+    return { key: `kpi/trend/${kpiMatch[1]}/${query.period || 'daily'}`, handledParams: ['period'] };
+  }
+  const processMatch = path.match(/^\/dashboard\/process\/([^/]+)$/);
+  if (processMatch) {
+    return { key: `dashboard/process/${processMatch[1].toUpperCase()}`, handledParams: [] };
+  }
+  return { key: path.replace(/^\//, ''), handledParams: [] };
+}
+
+// マニフェストがない場合の応答（デプロイ手順の誤りを隠さない）
+function snapshotUnavailable(headers) {
+  console.error(`Snapshot manifest not found at ${SNAPSHOT_BASE_URL || '(SNAPSHOT_BASE_URL/URL unset)'}/manifest.json`);
+  return {
+    statusCode: 503,
+    headers,
+    body: JSON.stringify({
+      error: 'Snapshot Unavailable',
+      message: 'manifest.json がデプロイされていません。DBのある環境で snapshot_export.py を実行してからデプロイしてください'
+    })
+  };
+}
+
+// スナップショットで返せないリクエストへの応答（デモ用マニフェストの場合は null を返してデモデータを生成）
+function snapshotMiss(headers, manifest, statusCode, message) {
+  if (manifest.demo) return null;
+  return {
+    statusCode,
+    headers,
+    body: JSON.stringify({
+      error: statusCode === 404 ? 'Snapshot Not Found' : 'Snapshot Unavailable',
+      message
+    })
+  };
+}
+
+// スナップショットと同じ条件（クエリ指定なし）のリクエストだけをバンドルで返す
+async function serveSnapshot(path, event, headers, manifest) {
+  const query = event.queryStringParameters || {};
+  const { key, handledParams } = snapshotKey(path, query);
+  const unhandled = Object.keys(query).filter(name => !handledParams.includes(name));
+  if (unhandled.length) {
+    return snapshotMiss(headers, manifest, 404,
+      `スナップショット配信ではクエリ指定（${unhandled.join(', ')}）に対応していません。DBに接続したAPIを利用してください`);
+  }
+
+  const entry = manifest.bundles?.[key];
+  if (!entry) {
+    return snapshotMiss(headers, manifest, 404,
+      `${key} のスナップショットがありません。snapshot_export.py の出力対象を確認してください`);
+  }
+  let body = null;
+  try {
+    body = await loadBundle(entry.file);
+  } catch (error) {
+    console.error(`Snapshot bundle fetch failed: ${entry.file}`, error.message);
+  }
+  if (!body) {
+    return snapshotMiss(headers, manifest, 503,
+      `スナップショット ${entry.file} を取得できません。しばらくしてから再度お試しください`);
+  }
+
+  const snapshotHeaders = {
+    ...headers,
+    'Cache-Control': 'public, max-age=60',
+    'ETag': `"${entry.sha256}"`,
+    'X-Snapshot-Generated-At': entry.generated_at
+  };
+  const acceptEncoding = event.headers?.['accept-encoding'] || '';
+  if (acceptEncoding.includes('gzip')) {
+    // 圧縮済みのバンドルを展開せずに返す
+    return {
+      statusCode: 200,
+      headers: { ...snapshotHeaders, 'Content-Encoding': 'gzip' },
+      body: body.toString('base64'),
+      isBase64Encoded: true
+    };
+  }
+  return {
+    statusCode: 200,
+    headers: snapshotHeaders,
+    body: zlib.gunzipSync(body).toString('utf-8')
+  };
+}
+
 // デモデータ生成用のヘルパー関数
 function generateRandomValue(base, variance = 0.1) {
   return base + (Math.random() - 0.5) * base * variance;
@@ -228,6 +365,27 @@ exports.handler = async (event, context) => {
 
     // ルーティング
     if (method === 'GET') {
+      // ヘルスチェック
+      if (path === '/health') {
+        return {
+          statusCode: 200,
+          headers,
+          body: JSON.stringify({ 
+            status: 'healthy', 
+            timestamp: new Date().toISOString(),
+            environment: 'netlify-functions'
+          })
+        };
+      }
+
+      // 静的スナップショット（実データ）
+      const manifest = await loadManifest();
+      if (!manifest) return snapshotUnavailable(headers);
+      const snapshot = await serveSnapshot(path, event, headers, manifest);
+      if (snapshot) return snapshot;
+
+      // 以下はデモ用マニフェスト（demo: true）の場合のみ
+
       // ダッシュボードサマリー
       if (path === '/dashboard/summary') {
         const data = {
@@ -305,19 +463,6 @@ exports.handler = async (event, context) => {
           body: JSON.stringify(data)
         };
       }
-
-      // ヘルスチェック
-      if (path === '/health') {
-        return {
-          statusCode: 200,
-          headers,
-          body: JSON.stringify({ 
-            status: 'healthy', 
-            timestamp: new Date().toISOString(),
-            environment: 'netlify-functions'
-          })
-        };
-      }
     }
 
     // 404 - Not Found
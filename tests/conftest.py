@@ -0,0 +1,35 @@
+"""
+テスト共通設定
+backend・database のモジュールはアプリと同じく sys.path から平置きで読み込む
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for directory in ("database", "backend"):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.append(path)
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'paperplant.db'}"
+
+@pytest.fixture
+def client(database_url, monkeypatch):
+    """一時データベースに接続したAPIクライアント（単一シャード構成）"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from cache import payload_cache
+
+    monkeypatch.delenv("PAPERPLANT_SHARDS", raising=False)
+    monkeypatch.setattr(main, "DATABASE_URL", database_url)
+    monkeypatch.setattr(main, "PREWARM_ON_STARTUP", False)
+    payload_cache.invalidate()
+    with TestClient(main.app) as test_client:
+        yield test_client
+    payload_cache.invalidate()
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert, select
+
+from cd_profile_analysis import CDProfileAnalyzer
+from models import create_database, MachineStatusLog, ProcessRecord, QualityCheck
+
+START = datetime(2024, 12, 1, 8, 0)
+
+def populate(engine, scans=180, streak_from=30):
+    """1分ごとの坪量プロファイル（60点）。streak_from 本目以降は位置 21-23 が厚い"""
+    rng = np.random.default_rng(0)
+    with engine.begin() as conn:
+        record_id = conn.execute(insert(ProcessRecord).values(
+            batch_id="PB-TEST", process_code="P3", machine_id="PM-1",
+            start_ts=START, end_ts=START + timedelta(minutes=scans),
+        )).inserted_primary_key[0]
+        rows = []
+        for scan in range(scans):
+            profile = 80 + rng.normal(0, 0.2, 60)
+            if scan >= streak_from:
+                profile[20:23] += 2.0
+            rows.append({
+                "record_id": record_id, "ts": START + timedelta(minutes=scan), "parameter_name": "basis_weight",
+                "value": float(profile.mean()), "value_array": profile.round(3).tolist(),
+                "upper_limit": 84.0, "lower_limit": 76.0, "measurement_type": "online",
+            })
+        conn.execute(insert(QualityCheck), rows)
+
+def streak_alarms(engine):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(MachineStatusLog.ts, MachineStatusLog.message)
+            .where(MachineStatusLog.message.like("[CD] basis_weight CDストリーク%"))
+        ).all()
+
+def test_overlapping_windows_update_the_running_episode(database_url):
+    engine = create_database(database_url)
+    populate(engine)
+    analyzer = CDProfileAnalyzer(engine)
+
+    first = analyzer.analyze(START, START + timedelta(minutes=90))
+    [streak] = [finding for finding in first if finding["kind"] == "streak"]
+    assert streak["positions"] == (21, 23)
+    started = f"{streak['start_ts']:%Y-%m-%d %H:%M}〜"
+    assert analyzer.record(first) == len(first)
+    [(ts, message)] = streak_alarms(engine)
+    assert ts == START + timedelta(minutes=89)
+    assert started in message
+
+    # 同じ期間の再解析では何も変わらない
+    assert analyzer.record(analyzer.analyze(START, START + timedelta(minutes=90))) == 0
+
+    # 継続中のストリークを含む重なった期間: 行は増えず、終了時刻が延びて開始時刻は最初の検出のまま
+    second = analyzer.analyze(START + timedelta(minutes=60), START + timedelta(minutes=180))
+    assert analyzer.record(second) == 1
+    [(ts, message)] = streak_alarms(engine)
+    assert ts == START + timedelta(minutes=179)
+    assert started in message
+
+    # 記録済みの事象の途中だけを解析し直しても追加されない
+    assert analyzer.record(analyzer.analyze(START + timedelta(minutes=100), START + timedelta(minutes=150))) == 0
+    assert len(streak_alarms(engine)) == 1
+    engine.dispose()
+
+def test_streaks_at_other_positions_are_separate_alarms(database_url):
+    engine = create_database(database_url)
+    populate(engine)
+    analyzer = CDProfileAnalyzer(engine)
+    analyzer.record(analyzer.analyze(START, START + timedelta(minutes=90)))
+
+    moved = analyzer.analyze(START + timedelta(minutes=60), START + timedelta(minutes=180))
+    for finding in moved:
+        if finding["kind"] == "streak":
+            finding["positions"] = (40, 42)
+    assert analyzer.record(moved) == 1
+    assert len(streak_alarms(engine)) == 2
+    engine.dispose()
@@ -0,0 +1,30 @@
+import asyncio
+import inspect
+import threading
+
+import httpx
+
+import main
+
+def test_database_endpoints_run_in_threadpool():
+    """get_db を使うエンドポイントは同期関数（イベントループ上でDBを使わない）"""
+    for route in main.app.routes:
+        dependencies = getattr(getattr(route, "dependant", None), "dependencies", [])
+        if any(dependency.call is main.get_db for dependency in dependencies):
+            assert not inspect.iscoroutinefunction(route.endpoint), route.path
+
+def test_requests_beyond_pool_size_complete(client):
+    """接続プールの上限（5+10）を超える同時リクエストでも詰まらない"""
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            responses = await asyncio.gather(*(http.get("/api/alerts", params={"status": "all"}) for _ in range(60)))
+        status_codes.extend(response.status_code for response in responses)
+
+    # イベントループが止まると wait_for も効かないため、別スレッドで実行して待ち時間を区切る
+    status_codes = []
+    worker = threading.Thread(target=lambda: asyncio.run(run()), daemon=True)
+    worker.start()
+    worker.join(timeout=20)
+    assert not worker.is_alive(), "同時リクエストが完了しません（イベントループが停止）"
+    assert status_codes == [200] * 60
@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, text, update
+
+from event_log import create_event_log_triggers
+from models import (
+    create_database, FinishedProductLot, MachineStatusLog, ProcessRecord, ProductionBatch, ProductionEvent,
+    QualityCheck, RawMaterialLot
+)
+from test_journey import START, populate
+
+@pytest.fixture
+def engine(database_url):
+    engine = create_database(database_url)
+    yield engine
+    engine.dispose()
+
+def events(conn):
+    return conn.execute(
+        select(ProductionEvent.event_type, ProductionEvent.source_id, ProductionEvent.payload)
+        .order_by(ProductionEvent.event_id)
+    ).all()
+
+def add_lot(conn):
+    """原料入荷→工程開始→品質逸脱・アラート→工程完了→製品完成→出荷の順に登録・更新"""
+    conn.execute(insert(RawMaterialLot).values(
+        lot_id="RML-001", arrival_ts=START - timedelta(days=1), supplier_name="北海道木材",
+        material_type="木材チップ", weight_kg=20000.0,
+    ))
+    conn.execute(insert(ProductionBatch).values(
+        batch_id="PB-001", raw_material_lot_id="RML-001", creation_ts=START, batch_type="Pulp", status="active",
+    ))
+    record_id = conn.execute(insert(ProcessRecord).values(
+        batch_id="PB-001", process_code="P3", machine_id="PM-1", operator_id="OP-01", start_ts=START,
+    )).inserted_primary_key[0]
+    conn.execute(insert(QualityCheck), [
+        {"record_id": record_id, "ts": START + timedelta(minutes=m), "parameter_name": "basis_weight",
+         "value": value, "upper_limit": 84.0, "lower_limit": 76.0, "is_ok": 76.0 <= value <= 84.0}
+        for m, value in ((5, 80.0), (10, 90.0))
+    ])
+    conn.execute(insert(MachineStatusLog), [
+        {"record_id": record_id, "machine_id": "PM-1", "ts": START + timedelta(minutes=15), "status": "alarm",
+         "alert_level": level, "message": f"{level} message", "resolved": False}
+        for level in ("info", "warning")
+    ])
+    conn.execute(update(ProcessRecord).where(ProcessRecord.record_id == record_id).values(
+        end_ts=START + timedelta(minutes=40), output_kg=15000.0,
+    ))
+    conn.execute(insert(FinishedProductLot).values(
+        product_lot_id="FPL-001", batch_id="PB-001", product_code="NP-80",
+        completion_ts=START + timedelta(hours=1), quantity_kg=15000.0,
+    ))
+    conn.execute(update(FinishedProductLot).values(shipment_ts=START + timedelta(days=1), destination="Customer-01"))
+    # 確定済みの日時の再更新ではイベントを追加しない
+    conn.execute(update(FinishedProductLot).values(shipment_ts=START + timedelta(days=2)))
+    conn.execute(update(ProcessRecord).values(end_ts=START + timedelta(minutes=50)))
+
+def test_triggers_append_one_event_per_fact(engine):
+    with engine.begin() as conn:
+        add_lot(conn)
+        logged = events(conn)
+    assert [event_type for event_type, _, _ in logged] == [
+        "raw_material_arrival", "process_start", "quality_excursion", "alert", "process_end",
+        "product_completion", "shipment",
+    ]
+    payloads = {event_type: payload for event_type, _, payload in logged}
+    # 工程開始時点では出力量が確定していないため、開始イベントには持たない
+    assert "output_kg" not in payloads["process_start"]
+    assert payloads["process_end"]["output_kg"] == 15000.0
+    assert payloads["quality_excursion"]["value"] == 90.0
+    assert payloads["shipment"]["destination"] == "Customer-01"
+
+def test_backfill_on_trigger_creation(engine):
+    with engine.begin() as conn:
+        add_lot(conn)
+        expected = Counter(event_type for event_type, _, _ in events(conn))
+        for (name,) in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'production_events_%'"
+        )).all():
+            conn.execute(text(f"DROP TRIGGER {name}"))
+        conn.execute(text("DELETE FROM production_events"))
+
+        create_event_log_triggers(conn)
+        assert Counter(event_type for event_type, _, _ in events(conn)) == expected
+        # 作成済みのトリガーでは取り込みを繰り返さない
+        create_event_log_triggers(conn)
+        assert Counter(event_type for event_type, _, _ in events(conn)) == expected
+
+def test_changed_trigger_definition_is_replaced_without_backfill(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER production_events_process_start"))
+        conn.execute(text(
+            "CREATE TRIGGER production_events_process_start AFTER INSERT ON process_records BEGIN "
+            "INSERT INTO production_events(ts, event_type, batch_id, machine_id, source_id, payload) "
+            "SELECT new.start_ts, 'process_start', new.batch_id, new.machine_id, new.record_id, "
+            "json_object('record_id', new.record_id, 'output_kg', new.output_kg); END"
+        ))
+        create_event_log_triggers(conn)
+        assert events(conn) == []
+        add_lot(conn)
+        payload = next(payload for event_type, _, payload in events(conn) if event_type == "process_start")
+        assert "output_kg" not in payload and payload["operator_id"] == "OP-01"
+
+def test_plant_timeline_cursor_pages(client):
+    populate(client.app.state.engine, batches=20)
+    window = {"start_time": (START - timedelta(days=2)).isoformat(), "end_time": (START + timedelta(days=2)).isoformat()}
+    everything = client.get("/api/plant/timeline", params={**window, "limit": 2000}).json()
+    assert everything["next_cursor"] is None
+
+    paged, cursor = [], None
+    while True:
+        page = client.get("/api/plant/timeline", params={**window, "limit": 7, **({"cursor": cursor} if cursor else {})})
+        assert page.status_code == 200
+        paged += page.json()["events"]
+        cursor = page.json()["next_cursor"]
+        if not cursor:
+            break
+    assert [event["event_id"] for event in paged] == [event["event_id"] for event in everything["events"]]
+    assert len(paged) == 20 * 4
+    timestamps = [datetime.fromisoformat(event["timestamp"]) for event in paged]
+    assert timestamps == sorted(timestamps)
+
+    starts = client.get("/api/plant/timeline", params={**window, "event_type": "process_start"}).json()["events"]
+    assert len(starts) == 20 and {event["event_type"] for event in starts} == {"process_start"}
+    assert client.get("/api/plant/timeline", params={"cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, insert
+
+from models import (
+    FinishedProductLot, ProcessRecord, ProductionBatch, QualityCheck, RawMaterialLot
+)
+
+START = datetime(2024, 12, 1, 8, 0)
+
+def populate(engine, batches=50):
+    """原料入荷・工程開始/完了・品質検査・製品完成のそろったロット系列"""
+    with engine.begin() as conn:
+        for i in range(batches):
+            ts = START + timedelta(hours=i)
+            conn.execute(insert(RawMaterialLot).values(
+                lot_id=f"RML-{i:03d}", arrival_ts=ts - timedelta(days=1), supplier_name="北海道木材",
+                material_type="木材チップ", weight_kg=20000.0,
+            ))
+            conn.execute(insert(ProductionBatch).values(
+                batch_id=f"PB-{i:03d}", raw_material_lot_id=f"RML-{i:03d}", creation_ts=ts,
+                batch_type="Pulp", status="completed",
+            ))
+            record_id = conn.execute(insert(ProcessRecord).values(
+                batch_id=f"PB-{i:03d}", process_code="P3", machine_id="PM-1", operator_id="OP-01",
+                start_ts=ts, end_ts=ts + timedelta(minutes=40), output_kg=15000.0,
+            )).inserted_primary_key[0]
+            conn.execute(insert(QualityCheck).values(
+                record_id=record_id, ts=ts + timedelta(minutes=10), parameter_name="basis_weight",
+                value=80.0, upper_limit=84.0, lower_limit=76.0, is_ok=True, measurement_type="online",
+            ))
+            conn.execute(insert(FinishedProductLot).values(
+                product_lot_id=f"FPL-{i:03d}", batch_id=f"PB-{i:03d}", product_code="NP-80",
+                completion_ts=ts + timedelta(hours=1), quantity_kg=15000.0,
+            ))
+
+def post_journeys(client, lot_ids):
+    response = client.post("/api/traceability/journeys", json={"lot_ids": lot_ids})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+@pytest.fixture
+def count_queries(client):
+    engine = client.app.state.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+def test_query_count_does_not_depend_on_lot_count(client, count_queries):
+    populate(client.app.state.engine)
+    counts = {}
+    for size in (1, 10, 50):
+        count_queries.clear()
+        lines = post_journeys(client, [f"FPL-{i:03d}" for i in range(size)])
+        assert [line["batch_id"] for line in lines] == [f"PB-{i:03d}" for i in range(size)]
+        assert all(line["timeline"] for line in lines)
+        counts[size] = len(count_queries)
+    # 製品ロットの解決・イベントログ・品質検査件数の3クエリ
+    assert counts == {1: 3, 10: 3, 50: 3}
+
+def test_timeline_events_for_a_lot(client):
+    populate(client.app.state.engine, batches=1)
+    [line] = post_journeys(client, ["FPL-000"])
+    assert [event["event_type"] for event in line["timeline"]] == [
+        "raw_material_arrival", "process_start", "process_end", "product_completion"
+    ]
+    assert line["timeline"][1]["data"]["quality_checks"] == 1
+
+def test_invalid_and_unknown_lots_become_error_lines(client):
+    populate(client.app.state.engine, batches=1)
+    lines = post_journeys(client, ["FPL-000", "XYZ-1", "FPL-999", "PB-999", "PB-000"])
+    assert [line["lot_id"] for line in lines] == ["FPL-000", "XYZ-1", "FPL-999", "PB-999", "PB-000"]
+    assert "timeline" in lines[0] and "timeline" in lines[4]
+    assert lines[1]["error"] == "無効なロットIDです"
+    assert lines[2]["error"] == "製品ロットが見つかりません"
+    assert lines[3] == {"lot_id": "PB-999", "batch_id": "PB-999", "error": "バッチが見つかりません"}
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, update
+
+from kpi_engine import KPIEngine
+from models import (
+    create_database, FinishedProductLot, KPIMetrics, MachineStatusLog, ProcessRecord, ProductionBatch, QualityCheck,
+    RawMaterialLot
+)
+
+def test_run_returns_period_counts(database_url):
+    engine = create_database(database_url)
+    kpi_engine = KPIEngine(engine)
+    assert kpi_engine.run(full=True) == {"hourly": 0, "daily": 0, "monthly": 0}
+    assert kpi_engine.run() == {"hourly": 0, "daily": 0, "monthly": 0}
+    engine.dispose()
+
+# 抄紙機 PM-1（設計能力 2300kg/h）で 08:00〜10:00 に3000kgを生産。08:45〜09:15 に停止（時間の境界をまたぐ）。
+# 品質検査は 08時台 4件すべて合格、09時台 4件中1件不合格。
+# 製品ロットは PB-1（原料 10000kg）から 10:30 に 4500kg、PB-2（原料 5000kg、不合格なし）から 11:10 に 4000kg。
+DAY = datetime(2024, 12, 2)
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+def add_batch(conn, n, weight):
+    conn.execute(insert(RawMaterialLot).values(
+        lot_id=f"RML-{n}", arrival_ts=at(6), supplier_name="北海道木材", material_type="木材チップ", weight_kg=weight,
+    ))
+    conn.execute(insert(ProductionBatch).values(
+        batch_id=f"PB-{n}", raw_material_lot_id=f"RML-{n}", creation_ts=at(8), batch_type="Paper",
+        initial_quantity_kg=8000.0, status="processing",
+    ))
+
+def add_checks(conn, hour, results):
+    conn.execute(insert(QualityCheck), [
+        {"record_id": 1, "ts": at(hour, 10 * i), "parameter_name": "basis_weight", "value": 80.0,
+         "upper_limit": 84.0, "lower_limit": 76.0, "is_ok": ok}
+        for i, ok in enumerate(results)
+    ])
+
+def add_status(conn, ts, status):
+    conn.execute(insert(MachineStatusLog).values(
+        machine_id="PM-1", record_id=1, ts=ts, status=status, alert_level="info", message=status, resolved=False,
+    ))
+
+def add_lot(conn, n, ts, quantity):
+    conn.execute(insert(FinishedProductLot).values(
+        product_lot_id=f"FPL-{n}", batch_id=f"PB-{n}", product_code="NP-80", completion_ts=ts,
+        quantity_kg=quantity, final_quality_ok=True,
+    ))
+
+# 元データを少しずつ追加する手順（各手順の後に差分計算を行う）
+STEPS = [
+    lambda conn: (
+        add_batch(conn, 1, 10000.0),
+        conn.execute(insert(ProcessRecord).values(
+            batch_id="PB-1", process_code="P3", machine_id="PM-1", start_ts=at(8), operator_id="OP001",
+        )),
+        add_checks(conn, 8, [True] * 4),
+    ),
+    lambda conn: (add_status(conn, at(8, 45), "stopped"), add_checks(conn, 9, [True, True, False, True])),
+    lambda conn: (
+        add_status(conn, at(9, 15), "running"),
+        conn.execute(update(ProcessRecord).values(end_ts=at(10), output_kg=3000.0)),
+        add_lot(conn, 1, at(10, 30), 4500.0),
+    ),
+    lambda conn: (add_batch(conn, 2, 5000.0), add_lot(conn, 2, at(11, 10), 4000.0)),
+]
+
+def metrics(engine):
+    with engine.connect() as conn:
+        return {
+            (row.period_type, row.ts, row.machine_id, row.metric_name): pytest.approx(row.value)
+            for row in conn.execute(select(KPIMetrics))
+        }
+
+@pytest.fixture
+def kpi_db(database_url):
+    engine = create_database(database_url)
+    yield engine
+    engine.dispose()
+
+def test_known_values(kpi_db):
+    for step in STEPS:
+        with kpi_db.begin() as conn:
+            step(conn)
+    KPIEngine(kpi_db).run(full=True)
+    values = metrics(kpi_db)
+
+    performance = 1500 / 1725  # 各時間 1500kg / ((1 - 0.25h) × 2300kg/h)
+    assert values[("hourly", at(8), "PM-1", "OEE")] == 0.75 * performance * 1.0 * 100
+    assert values[("hourly", at(9), "PM-1", "OEE")] == 0.75 * performance * 0.75 * 100
+    assert values[("hourly", at(8), "PM-1", "production_rate")] == 1.5
+    # 工程の終了時間に、不合格のあった工程の通過（FPY 0%）と投入 8000kg に対する歩留まり
+    assert values[("hourly", at(10), "PM-1", "FPY")] == 0.0
+    assert values[("hourly", at(10), "PM-1", "yield_rate")] == 37.5
+    assert ("hourly", at(10), "PM-1", "OEE") not in values
+
+    for period_type, ts in (("daily", DAY), ("monthly", DAY.replace(day=1))):
+        assert values[(period_type, ts, "PM-1", "OEE")] == 0.75 * (3000 / 3450) * (7 / 8) * 100
+        assert values[(period_type, ts, None, "OEE")] == values[(period_type, ts, "PM-1", "OEE")]
+        assert values[(period_type, ts, None, "FPY")] == 50.0
+        assert values[(period_type, ts, None, "yield_rate")] == (4500 + 4000) / (10000 + 5000) * 100
+        # 工場全体の生産速度は、いずれかの設備が稼働していた2時間あたり
+        assert values[(period_type, ts, None, "production_rate")] == (4500 + 4000) / 1000 / 2
+
+def test_incremental_runs_match_full_recompute(kpi_db):
+    kpi_engine = KPIEngine(kpi_db)
+    for step in STEPS:
+        with kpi_db.begin() as conn:
+            step(conn)
+        kpi_engine.run()
+    incremental = metrics(kpi_db)
+    assert incremental
+
+    kpi_engine.run(full=True)
+    assert metrics(kpi_db) == incremental
+    # 新しいデータがなければ何も再計算しない
+    assert kpi_engine.run() == {"hourly": 0, "daily": 0, "monthly": 0}
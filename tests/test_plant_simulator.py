@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import (
+    FinishedProductLot, MachineStatusLog, ProcessRecord, ProductionBatch, ProductionEvent, QualityCheck,
+    RawMaterialLot
+)
+from plant_simulator import CD_PROFILE_POINTS, PlantSimulator
+
+START = datetime(2024, 12, 1, 8, 0)
+
+def simulate(database_url, ticks=24, points=300, **options):
+    """2時間刻みで ticks 回進めたシミュレーター（既定では抄紙工程・製品完成・出荷まで進む2日分）"""
+    simulator = PlantSimulator(database_url, lines=3, seed=7, start=START, **options)
+    written = [simulator.advance(START + timedelta(hours=2 * (n + 1)), points) for n in range(ticks)]
+    return simulator, written
+
+def count(conn, model, *conditions):
+    return conn.execute(select(func.count()).select_from(model).where(*conditions)).scalar()
+
+def test_advance_writes_the_counted_rows(database_url):
+    simulator, written = simulate(database_url, fault_rate=0.0)
+    assert simulator.clock == START + timedelta(hours=48)
+    with simulator.engine.connect() as conn:
+        for model, key in ((RawMaterialLot, "raw_material_lots"), (ProductionBatch, "production_batches"),
+                           (ProcessRecord, "process_records"), (QualityCheck, "quality_checks")):
+            assert count(conn, model) == simulator.counts[key], key
+        assert count(conn, QualityCheck) == sum(written)
+        assert count(conn, ProductionBatch) > 3
+        assert count(conn, FinishedProductLot, FinishedProductLot.shipment_ts.is_not(None)) == simulator.counts["shipments"]
+        assert count(conn, MachineStatusLog) == 0
+        assert count(conn, FinishedProductLot) == simulator.counts["finished_product_lots"]
+        # 測定点は各刻みの模擬時刻の範囲内
+        first, last = conn.execute(select(func.min(QualityCheck.ts), func.max(QualityCheck.ts))).one()
+        assert START <= first and last < simulator.clock
+
+        profiles = conn.execute(
+            select(func.json_array_length(QualityCheck.value_array))
+            .where(QualityCheck.value_array.is_not(None))
+        ).scalars().all()
+    assert len(profiles) == simulator.counts["cd_profiles"] > 0
+    assert set(profiles) == {CD_PROFILE_POINTS}
+    simulator.engine.dispose()
+
+def test_faults_raise_alarms_and_recover(database_url):
+    simulator, _ = simulate(database_url, fault_rate=100.0)
+    with simulator.engine.connect() as conn:
+        alarms = conn.execute(
+            select(MachineStatusLog.machine_id, MachineStatusLog.alert_level, MachineStatusLog.record_id)
+            .where(MachineStatusLog.status == "alarm")
+        ).all()
+        assert alarms
+        assert {level for _, level, _ in alarms} <= {"warning", "critical"}
+        assert all(record_id is not None for _, _, record_id in alarms)
+        # 障害は設備ごとに1件まで。復旧した障害は解決済みにして info ログを残す
+        unresolved = count(conn, MachineStatusLog, MachineStatusLog.status == "alarm",
+                           MachineStatusLog.resolved == False)
+        assert unresolved == len(simulator.faults)
+        assert count(conn, MachineStatusLog, MachineStatusLog.status == "running") == len(alarms) - unresolved
+        assert count(conn, ProductionEvent, ProductionEvent.event_type == "alert") == len(alarms)
+    simulator.engine.dispose()
+
+def test_same_seed_gives_the_same_data(tmp_path):
+    def values(name):
+        simulator, _ = simulate(f"sqlite:///{tmp_path / name}", ticks=3, points=100, fault_rate=5.0)
+        with simulator.engine.connect() as conn:
+            rows = conn.execute(
+                select(QualityCheck.ts, QualityCheck.parameter_name, QualityCheck.value).order_by(QualityCheck.check_id)
+            ).all()
+        simulator.engine.dispose()
+        return rows
+
+    assert values("a.db") == values("b.db")
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import ProcessRecord, QualityCheck
+
+PROFILE = [80.0 + i / 10 for i in range(10)]
+
+def populate(engine, start):
+    """抄紙工程の記録2件に、坪量・水分の測定点（坪量の2点目以降と水分の1点目はCDプロファイル付き）"""
+    checks = []
+    with engine.begin() as conn:
+        for n in range(2):
+            ts = start + timedelta(hours=n)
+            record_id = conn.execute(insert(ProcessRecord).values(
+                batch_id=f"PB-{n:03d}", process_code="P3", machine_id="PM-1", operator_id="OP-01",
+                start_ts=ts, end_ts=ts + timedelta(minutes=40), output_kg=15000.0,
+            )).inserted_primary_key[0]
+            for i, parameter in enumerate(("basis_weight", "basis_weight", "moisture")):
+                profile = PROFILE if (parameter == "basis_weight" and (n or i)) or (parameter == "moisture" and not n) else None
+                checks.append(conn.execute(insert(QualityCheck).values(
+                    record_id=record_id, ts=ts + timedelta(minutes=10 * (i + 1)), parameter_name=parameter,
+                    value=80.0, target_value=80.0, upper_limit=84.0, lower_limit=76.0, is_ok=True,
+                    measurement_type="online", value_array=profile,
+                )).inserted_primary_key[0])
+    return checks
+
+def process_view(client, start, **params):
+    response = client.get("/api/dashboard/process/P3", params={
+        "start_time": (start - timedelta(hours=1)).isoformat(), "end_time": (start + timedelta(hours=2)).isoformat(),
+        **params,
+    })
+    assert response.status_code == 200
+    return response.json()["quality_data"]
+
+def test_process_view_profiles(client):
+    start = datetime(2024, 12, 1, 8, 0)
+    checks = populate(client.app.state.engine, start)
+
+    latest = process_view(client, start)
+    assert [point["check_id"] for point in latest] == checks
+    with_profile = {point["check_id"]: point["parameter"] for point in latest if "cd_profile" in point}
+    # パラメータごとに最新のプロファイルを持つ1点のみ
+    assert with_profile == {checks[4]: "basis_weight", checks[2]: "moisture"}
+    assert all(point["cd_profile"] == PROFILE for point in latest if "cd_profile" in point)
+
+    assert not any("cd_profile" in point for point in process_view(client, start, include_profiles="none"))
+    everything = process_view(client, start, include_profiles="all")
+    assert [point["cd_profile"] is not None for point in everything] == [False, True, True, True, True, False]
+    assert client.get("/api/dashboard/process/P3", params={"include_profiles": "some"}).status_code == 422
+
+def test_fields_select_point_columns(client):
+    start = datetime(2024, 12, 1, 8, 0)
+    populate(client.app.state.engine, start)
+
+    points = process_view(client, start, fields="value,is_ok", include_profiles="none")
+    assert {tuple(point) for point in points} == {("check_id", "value", "is_ok")}
+    response = client.get("/api/dashboard/process/P3", params={"fields": "value,nonexistent"})
+    assert response.status_code == 400 and "nonexistent" in response.json()["detail"]
+
+    populate(client.app.state.engine, datetime.now() - timedelta(hours=3))
+    trend = client.get("/api/dashboard/quality-trend/basis_weight", params={"fields": "timestamp,value"}).json()["data"]
+    assert len(trend) == 4
+    assert all(set(point) == {"check_id", "timestamp", "value"} for point in trend)
+    default = client.get("/api/dashboard/quality-trend/basis_weight").json()["data"]
+    assert set(default[0]) == {"timestamp", "value", "target", "upper_limit", "lower_limit", "is_ok"}
+    latest = client.get("/api/dashboard/quality-trend/basis_weight", params={"include_profiles": "latest"}).json()["data"]
+    assert sum("cd_profile" in point for point in latest) == 1 and "cd_profile" in latest[-1]
+
+def test_profile_endpoint(client):
+    checks = populate(client.app.state.engine, datetime(2024, 12, 1, 8, 0))
+    response = client.get(f"/api/quality/checks/{checks[1]}/profile")
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile["check_id"] == checks[1] and profile["parameter"] == "basis_weight"
+    assert profile["cd_profile"] == PROFILE
+    # プロファイルなし・存在しない品質データは404
+    assert client.get(f"/api/quality/checks/{checks[0]}/profile").status_code == 404
+    assert client.get("/api/quality/checks/999999/profile").status_code == 404
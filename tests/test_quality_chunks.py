@@ -0,0 +1,102 @@
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import quality_chunks
+from models import create_database, QualityCheck, QualityChunk
+from queries import fetch_quality_trend
+from quality_chunks import chunk_watermark, compact_quality_checks, fetch_trend
+
+NOW = datetime(2024, 12, 1, 12, 0)
+BEFORE = NOW - timedelta(days=30)
+FIELDS = ("timestamp", "value", "is_ok", "record_id")
+
+def populate(engine, order):
+    """直近1時間の50点と60日前の50点を order（"recent_first" / "interleaved" / "old_first"）の check_id 順で投入"""
+    recent = [NOW - timedelta(hours=1) + timedelta(minutes=i) for i in range(50)]
+    old = [NOW - timedelta(days=60) + timedelta(minutes=i) for i in range(50)]
+    if order == "recent_first":
+        timestamps = recent + old
+    elif order == "old_first":
+        timestamps = old + recent
+    else:
+        timestamps = [ts for pair in zip(recent, old) for ts in pair]
+    with engine.begin() as conn:
+        conn.execute(insert(QualityCheck), [
+            {"record_id": 1, "ts": ts, "parameter_name": "basis_weight", "value": 80.0 + i / 100,
+             "upper_limit": 84.0, "lower_limit": 76.0, "is_ok": True, "measurement_type": "online"}
+            for i, ts in enumerate(timestamps)
+        ])
+
+def trend(engine):
+    with engine.connect() as conn:
+        return fetch_trend(conn, "basis_weight", NOW - timedelta(days=90), FIELDS)
+
+def remaining(engine, *conditions):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(QualityCheck).where(*conditions)).scalar()
+
+def compacted(engine, *conditions):
+    with engine.connect() as conn:
+        return remaining(engine, QualityCheck.check_id <= chunk_watermark(conn), *conditions)
+
+def test_rows_after_the_cutoff_are_never_compacted(database_url):
+    for order in ("recent_first", "interleaved"):
+        engine = create_database(database_url.replace(".db", f"-{order}.db"))
+        populate(engine, order)
+        expected = trend(engine)
+        assert len(expected) == 100
+
+        compact_quality_checks(engine, BEFORE)
+        assert compacted(engine, QualityCheck.ts >= BEFORE) == 0
+        assert trend(engine) == expected
+
+        # 直近の行が古くなれば、残りもチャンク化される。チャンク化した行は削除しない
+        compact_quality_checks(engine, NOW + timedelta(hours=1))
+        assert compacted(engine) == remaining(engine) == 100
+        assert trend(engine) == expected
+        engine.dispose()
+
+def test_old_rows_before_recent_ones_are_compacted(database_url):
+    engine = create_database(database_url)
+    populate(engine, "old_first")
+    expected = trend(engine)
+
+    counts = compact_quality_checks(engine, BEFORE)
+    assert counts == {"points": 50, "chunks": 1}
+    assert remaining(engine) == 100
+    with engine.connect() as conn:
+        assert chunk_watermark(conn) == 50
+    assert trend(engine) == expected
+
+    # 再実行しても二重にチャンク化しない
+    assert compact_quality_checks(engine, BEFORE) == {"points": 0, "chunks": 0}
+    assert trend(engine) == expected
+    engine.dispose()
+
+def test_trend_points_keep_their_check_ids(database_url):
+    engine = create_database(database_url)
+    populate(engine, "old_first")
+    compact_quality_checks(engine, NOW + timedelta(hours=1))
+    with engine.connect() as conn:
+        check_ids = conn.execute(select(QualityCheck.check_id).order_by(QualityCheck.ts)).scalars().all()
+        # 既定の項目はチャンクから、check_id を含む項目は行から読む
+        assert len(fetch_quality_trend(conn, "basis_weight", NOW - timedelta(days=90))) == 100
+        points = fetch_quality_trend(conn, "basis_weight", NOW - timedelta(days=90), ("timestamp", "value"))
+    assert [point["check_id"] for point in points] == check_ids
+    engine.dispose()
+
+def test_delete_option_is_refused(database_url, monkeypatch):
+    engine = create_database(database_url)
+    populate(engine, "old_first")
+    monkeypatch.setattr(sys, "argv", ["quality_chunks.py", "--database-url", database_url, "--older-than-hours", "0",
+                                      "--delete"])
+    with pytest.raises(SystemExit) as exc_info:
+        quality_chunks.main()
+    assert exc_info.value.code == 2
+    assert remaining(engine) == 100
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(QualityChunk)).scalar() == 0
+    engine.dispose()
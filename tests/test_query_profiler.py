@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from query_profiler import QueryProfiler
+
+def test_failed_statement_does_not_leave_start_time():
+    engine = create_engine("sqlite://")
+    profiler = QueryProfiler(threshold_ms=0, explain=False).attach(engine)
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        assert conn.info.get("paperplant_profiler_start") == []
+        conn.execute(text("SELECT 1"))
+    assert [entry["sql"] for entry in profiler.recent()] == ["SELECT ?"]
+    profiler.detach(engine)
+    engine.dispose()
+
+def test_admin_endpoints_disabled_without_token(client):
+    assert client.get("/api/admin/slow-queries").status_code == 404
+    assert client.delete("/api/admin/slow-queries").status_code == 404
+
+def test_admin_endpoints_require_token(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.get("/api/admin/slow-queries").status_code == 401
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    response = client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert "by_fingerprint" in response.json()
+    assert client.delete("/api/admin/slow-queries", headers={"X-Admin-Token": "secret"}).json() == {"status": "cleared"}
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, inspect, text
+
+from models import SCHEMA_VERSION, ensure_schema
+
+def user_version(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def set_user_version(engine, version):
+    with engine.begin() as conn:
+        conn.execute(text(f"PRAGMA user_version = {version}"))
+
+def test_creates_schema_and_records_version(database_url):
+    engine = create_engine(database_url)
+    assert ensure_schema(engine) is True
+    assert user_version(engine) == SCHEMA_VERSION
+    assert "quality_checks" in inspect(engine).get_table_names()
+    assert ensure_schema(engine) is False
+    engine.dispose()
+
+def test_newer_database_is_left_untouched(database_url):
+    engine = create_engine(database_url)
+    ensure_schema(engine)
+    set_user_version(engine, SCHEMA_VERSION + 1)
+    assert ensure_schema(engine) is False
+    assert user_version(engine) == SCHEMA_VERSION + 1
+    engine.dispose()
+
+def test_older_database_is_upgraded(database_url):
+    engine = create_engine(database_url)
+    ensure_schema(engine)
+    set_user_version(engine, SCHEMA_VERSION - 1)
+    assert ensure_schema(engine) is True
+    assert user_version(engine) == SCHEMA_VERSION
+    engine.dispose()
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, insert, text, update
+
+from models import create_database, RawMaterialLot
+from search_index import LOT_SEARCH_ROWS_TABLE, LOT_SEARCH_TABLE, create_lot_search_index, rebuild_lot_search_index
+
+@pytest.fixture
+def engine(database_url):
+    engine = create_database(database_url)
+    with engine.begin() as conn:
+        conn.execute(insert(RawMaterialLot), [
+            {"lot_id": f"RML-{i:03d}", "arrival_ts": datetime(2024, 1, 1), "supplier_name": "北海道木材",
+             "material_type": "木材チップ", "weight_kg": 20000.0}
+            for i in range(10)
+        ])
+    yield engine
+    engine.dispose()
+
+def indexed_lots(conn, lot_type="raw_material"):
+    return set(conn.execute(
+        text(f"SELECT lot_id FROM {LOT_SEARCH_TABLE} WHERE lot_type = :lot_type"), {"lot_type": lot_type}
+    ).scalars())
+
+def source_lots(conn):
+    return set(conn.execute(text("SELECT lot_id FROM raw_material_lots")).scalars())
+
+def renumber_rowids(conn):
+    """VACUUM による rowid の振り直しを再現（トリガーを通さずに rowid だけを変える）"""
+    trigger_sql = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'raw_material_lots_lot_search_au'"
+    )).scalar()
+    conn.execute(text("DROP TRIGGER raw_material_lots_lot_search_au"))
+    conn.execute(text("UPDATE raw_material_lots SET rowid = rowid + 1000"))
+    conn.execute(text(trigger_sql))
+
+def test_index_follows_deletes_and_updates_after_rowid_change(engine):
+    with engine.begin() as conn:
+        renumber_rowids(conn)
+        conn.execute(delete(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-003"))
+        conn.execute(update(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-004").values(lot_id="RML-104"))
+    with engine.connect() as conn:
+        assert indexed_lots(conn) == source_lots(conn)
+        assert "RML-003" not in indexed_lots(conn)
+        assert conn.execute(text(f"SELECT count(*) FROM {LOT_SEARCH_ROWS_TABLE}")).scalar() == 9
+
+def test_index_survives_vacuum(engine):
+    with engine.begin() as conn:
+        conn.execute(delete(RawMaterialLot).where(RawMaterialLot.lot_id.in_(["RML-000", "RML-001"])))
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    with engine.begin() as conn:
+        conn.execute(delete(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-005"))
+    with engine.connect() as conn:
+        assert indexed_lots(conn) == source_lots(conn)
+
+def test_legacy_rowid_index_is_rebuilt(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {LOT_SEARCH_ROWS_TABLE}"))
+        assert create_lot_search_index(conn) is True
+        assert indexed_lots(conn) == source_lots(conn)
+        assert rebuild_lot_search_index(conn) is True
+        assert indexed_lots(conn) == source_lots(conn)
+
+def test_suggest_uses_index_after_update(engine):
+    from models import get_session
+    from traceability import suggest_lots
+
+    with engine.begin() as conn:
+        conn.execute(update(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-007").values(lot_id="XYZ-777"))
+    session = get_session(engine)
+    try:
+        assert [item["lot_id"] for item in suggest_lots(session, "Z-77")] == ["XYZ-777"]
+    finally:
+        session.close()
+
+def index_rows(conn):
+    return conn.execute(text(f"SELECT count(*) FROM {LOT_SEARCH_ROWS_TABLE}")).scalar(), conn.execute(
+        text(f"SELECT max(row_id) FROM {LOT_SEARCH_ROWS_TABLE}")
+    ).scalar()
+
+def test_only_indexed_columns_rewrite_the_index(engine):
+    with engine.begin() as conn:
+        before = index_rows(conn)
+        # 索引対象外の列の更新では対応表の行を作り直さない（row_id が増えない）
+        conn.execute(update(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-001").values(weight_kg=1.0))
+        assert index_rows(conn) == before
+        conn.execute(update(RawMaterialLot).where(RawMaterialLot.lot_id == "RML-002").values(supplier_name="欧州パルプ"))
+        assert index_rows(conn)[1] > before[1]
+        assert conn.execute(text(
+            "SELECT count(*) FROM lot_search_terms WHERE field = 'supplier_name' AND value = '欧州パルプ'"
+        )).scalar() == 1
+
+def test_legacy_update_trigger_is_replaced(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER raw_material_lots_lot_search_au"))
+        conn.execute(text(
+            "CREATE TRIGGER raw_material_lots_lot_search_au AFTER UPDATE ON raw_material_lots BEGIN SELECT 1; END"
+        ))
+        assert create_lot_search_index(conn) is True
+        trigger_sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'raw_material_lots_lot_search_au'"
+        )).scalar()
+        assert "AFTER UPDATE OF lot_id, supplier_name, material_type ON raw_material_lots" in trigger_sql
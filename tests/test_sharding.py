@@ -0,0 +1,140 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+import metrics
+from main import CRITICAL_ALERT_LIMIT
+from metrics import RequestStats, instrument_engine
+from models import MachineStatusLog
+from queries import combine_kpis, merge_kpi_trends
+from sharding import ShardRouter, merge_sorted
+from test_traceability import lot_key, populate
+from traceability import merge_lot_pages, search_lots
+
+@pytest.fixture
+def router(tmp_path):
+    router = ShardRouter({name: f"sqlite:///{tmp_path / f'{name}.db'}" for name in ("tomakomai", "fuji")})
+    yield router
+    router.dispose()
+
+@pytest.fixture
+def sharded_client(tmp_path, monkeypatch):
+    """2工場構成のAPIクライアント（各工場にロット系列を投入済み）"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from cache import payload_cache
+
+    shards = {name: f"sqlite:///{tmp_path / f'{name}.db'}" for name in ("tomakomai", "fuji")}
+    setup = ShardRouter(shards)
+    for name in setup.names:
+        populate(setup.engine(name), prefix=f"{name}-")
+    setup.dispose()
+
+    monkeypatch.setenv("PAPERPLANT_SHARDS", json.dumps(shards))
+    monkeypatch.setattr(main, "PREWARM_ON_STARTUP", False)
+    payload_cache.invalidate()
+    with TestClient(main.app) as test_client:
+        yield test_client
+    payload_cache.invalidate()
+
+def test_merged_pages_match_a_single_database(router, tmp_path):
+    single = ShardRouter({"all": f"sqlite:///{tmp_path / 'all.db'}"})
+    for name in router.names:
+        populate(router.engine(name), prefix=f"{name}-")
+        populate(single.engine(), prefix=f"{name}-")
+
+    def page_through(search):
+        keys, cursor, total = [], None, None
+        while True:
+            page = search(cursor)
+            total = page["total_count"] if total is None else total
+            keys += [lot_key(lot) for lot in page["lots"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                return keys, total
+
+    expected = page_through(lambda cursor: single.scatter(
+        lambda session: search_lots(session, [], limit=7, cursor=cursor))["all"])
+    merged = page_through(lambda cursor: merge_lot_pages(
+        router.scatter(lambda session: search_lots(session, [], limit=7, cursor=cursor)), 7))
+    assert merged == expected
+    assert len(expected[0]) == expected[1]
+    single.dispose()
+
+def test_scatter_counts_shard_queries_in_the_request_stats(router):
+    for engine in router.engines.values():
+        instrument_engine(engine)
+    stats = RequestStats("/test")
+    token = metrics._current_request.set(stats)
+    try:
+        router.scatter(lambda session: search_lots(session, [], limit=5))
+    finally:
+        metrics._current_request.reset(token)
+    # 空のシャードでは、生産開始日時のあるバッチ・ないバッチの取得と件数集計の3文
+    assert stats.query_count == 3 * len(router.names)
+
+def test_executor_is_sized_for_concurrent_requests(router, tmp_path, monkeypatch):
+    # 2シャード × 同時リクエスト4件分
+    assert router.executor._max_workers == 8
+    many = ShardRouter({f"mill{i}": f"sqlite:///{tmp_path / f'mill{i}.db'}" for i in range(10)})
+    assert many.executor._max_workers == 32
+    many.dispose()
+    monkeypatch.setenv("PAPERPLANT_SHARD_WORKERS", "3")
+    configured = ShardRouter.from_env(f"sqlite:///{tmp_path / 'configured.db'}")
+    assert configured.executor._max_workers == 3
+    configured.dispose()
+
+def test_merge_sorted_tags_and_limits():
+    merged = merge_sorted({"a": [{"ts": 3}, {"ts": 1}], "b": [{"ts": 2}]}, key=lambda item: item["ts"], limit=2)
+    assert merged == [{"ts": 3, "mill": "a"}, {"ts": 2, "mill": "b"}]
+
+def test_kpi_trends_sum_production_and_average_rates():
+    assert combine_kpis([{"value": 10.0, "target": 12.0, "unit": "t/h"},
+                         {"value": 20.0, "target": 18.0, "unit": "t/h"}])["value"] == 30.0
+    ts = datetime(2024, 12, 1)
+    trend = merge_kpi_trends([
+        [{"timestamp": ts, "value": 80.0, "target": 85.0, "unit": "%"}],
+        [{"timestamp": ts, "value": 90.0, "target": None, "unit": "%"}],
+    ])
+    assert trend == [{"timestamp": ts, "value": 85.0, "target": 85.0, "unit": "%", "achievement_rate": 100.0}]
+
+def queries_total(client, route):
+    text = client.get("/metrics").text
+    match = re.search(rf'^paperplant_db_queries_total{{method="GET",route="{re.escape(route)}"}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+def test_plant_wide_search_is_measured_and_opens_only_shard_sessions(sharded_client, monkeypatch):
+    shards = sharded_client.app.state.shards
+    opened = []
+    session = shards.session
+    monkeypatch.setattr(shards, "session", lambda name=None: opened.append(name) or session(name))
+
+    before = queries_total(sharded_client, "/api/traceability/search")
+    response = sharded_client.get("/api/traceability/search", params={"limit": 10})
+    assert response.status_code == 200
+    assert response.json()["total_count"] == 2 * 33  # 1工場あたり25バッチ・33系列
+    assert sorted(opened) == sorted(shards.names)
+    assert queries_total(sharded_client, "/api/traceability/search") - before == 2 * len(shards.names)
+
+def test_summary_lists_the_newest_critical_alerts(sharded_client):
+    now = datetime.now()
+    # 古い順に登録（log_id の順に読むと古いアラートが残る）
+    with sharded_client.app.state.shards.engine("fuji").begin() as conn:
+        conn.execute(insert(MachineStatusLog), [
+            {"machine_id": "PM-2", "ts": now - timedelta(hours=12 - i), "status": "alarm", "alert_level": "critical",
+             "message": f"アラート{i}", "resolved": False}
+            for i in range(CRITICAL_ALERT_LIMIT + 2)
+        ])
+    for params in ({}, {"mill": "fuji"}):
+        alerts = sharded_client.get("/api/dashboard/summary", params=params).json()["critical_alerts"]
+        assert [alert["message"] for alert in alerts] == [
+            f"アラート{i}" for i in reversed(range(2, CRITICAL_ALERT_LIMIT + 2))
+        ]
+
+def test_unknown_mill_is_not_found(sharded_client):
+    assert sharded_client.get("/api/alerts", params={"mill": "nowhere"}).status_code == 404
+    assert sharded_client.get("/api/alerts", params={"mill": "fuji"}).status_code == 200
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+from sqlalchemy import insert
+
+from models import MachineStatusLog
+from sharding import ShardRouter
+from snapshot_export import SnapshotExporter
+from test_traceability import populate
+
+def export(exporter, runs):
+    """API をプロセス内で起動し、各回の前に runs[i]() を呼んでから差分出力した件数の一覧を返す"""
+    import main
+
+    async def run_all():
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://snapshot") as client:
+                counts = []
+                for before in runs:
+                    before()
+                    counts.append(await exporter.run(client, main.app.state.shards))
+                return counts
+
+    return asyncio.run(run_all())
+
+def test_write_to_a_second_shard_regenerates_bundles(tmp_path, monkeypatch):
+    import main
+    from cache import payload_cache
+
+    shards = {name: f"sqlite:///{tmp_path / f'{name}.db'}" for name in ("tomakomai", "fuji")}
+    setup = ShardRouter(shards)
+    for name in setup.names:
+        populate(setup.engine(name), prefix=f"{name}-")
+
+    def add_alarm():
+        with setup.engine("fuji").begin() as conn:
+            conn.execute(insert(MachineStatusLog).values(
+                machine_id="PM-2", ts=datetime(2024, 12, 1, 9, 0), status="alarm", alert_level="critical",
+                message="ワイヤー破断", resolved=False,
+            ))
+        payload_cache.invalidate()
+
+    monkeypatch.setenv("PAPERPLANT_SHARDS", json.dumps(shards))
+    monkeypatch.setattr(main, "PREWARM_ON_STARTUP", False)
+    payload_cache.invalidate()
+    exporter = SnapshotExporter(str(tmp_path / "snapshots"))
+    manifests = []
+
+    def save_manifest():
+        manifests.append(exporter.load_manifest()["bundles"])
+
+    try:
+        first, unchanged, after_alarm = export(exporter, [lambda: None, save_manifest, add_alarm])
+    finally:
+        setup.dispose()
+        payload_cache.invalidate()
+
+    assert first["failed"] == 0 and first["written"] > 0
+    assert unchanged == {"written": 0, "unchanged": 0, "skipped": first["written"], "failed": 0}
+    # 既定（先頭）以外のシャードへの書き込みでも、依存するバンドルは再生成される
+    [before] = manifests
+    after = exporter.load_manifest()["bundles"]
+    assert set(before["alerts"]["sources"]["machine_status"]) == {"tomakomai", "fuji"}
+    assert after["alerts"]["file"] != before["alerts"]["file"]
+    assert after["dashboard/process-flow"]["generated_at"] != before["dashboard/process-flow"]["generated_at"]
+    # 設備ステータスに依存するサマリー・工程フロー・アラート・工程別監視（P1〜P4）の7件
+    assert after_alarm["written"] + after_alarm["unchanged"] == 7
+    assert after_alarm["skipped"] == first["written"] - 7 and after_alarm["failed"] == 0